@@ -0,0 +1,44 @@
+"""
+Compare two result files written by load.py, for example from two commits:
+
+    python benchmarks/compare.py before.json after.json
+
+For every endpoint present in both files the p50, p95, p99 latency and
+requests per second are printed side by side with the relative change.
+"""
+
+import sys
+import json
+
+METRICS = [("p50", "p50_ms"), ("p95", "p95_ms"), ("p99", "p99_ms"), ("req/s", "requests_per_second")]
+
+def _load(path):
+    with open(path) as f:
+        results = json.load(f)
+    return results, {
+        (run["size"], run["driver"], run["endpoint"]): run for run in results["runs"]
+    }
+
+def _change(before, after):
+    if not before:
+        return "     n/a"
+    return "{:+7.1f}%".format((after - before) / before * 100)
+
+def main():
+    if len(sys.argv) != 3:
+        sys.exit("usage: compare.py BEFORE AFTER")
+    before_results, before = _load(sys.argv[1])
+    after_results, after = _load(sys.argv[2])
+    print("before: {}\nafter:  {}".format(before_results["commit"], after_results["commit"]))
+
+    for key in sorted(set(before) & set(after)):
+        old, new = before[key], after[key]
+        columns = ["{:>8} {:<6} {:<24}".format(*key)]
+        for label, metric in METRICS:
+            columns.append("{} {:>9.2f} {}".format(
+                label, new[metric], _change(old[metric], new[metric])
+            ))
+        print("  ".join(columns))
+
+if __name__ == "__main__":
+    main()
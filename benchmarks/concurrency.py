@@ -0,0 +1,149 @@
+"""
+Benchmark for concurrent readers and writers on one SQLite database.
+
+Seeds a catalogue and serves it with a threaded WSGI server, then runs
+reader threads that GET movie items and pages of the movie collection
+while writer threads PUT changes to movies, for a fixed duration. This is
+done once with the SQLite settings the app used before engine tuning
+(rollback journal, synchronous=FULL, no memory mapped I/O) and once with
+the defaults of movietracker.database (WAL, synchronous=NORMAL, mmap). The
+response cache is disabled so that every read goes to the database. For
+readers and writers the p50/p99 latency, requests per second and the
+number of failed requests are reported.
+
+Run with the movietracker package installed (see README):
+
+    python benchmarks/concurrency.py --readers 8 --writers 2 --seconds 10
+"""
+
+import os
+import json
+import time
+import random
+import argparse
+import threading
+import http.client
+from seed import create_benchmark_app, seed
+
+CONFIGS = [
+    ("rollback", {
+        "SQLITE_JOURNAL_MODE": "DELETE",
+        "SQLITE_SYNCHRONOUS": "FULL",
+        "SQLITE_MMAP_SIZE": None,
+    }),
+    ("wal", {}),
+]
+
+def _percentile(timings, p):
+    if not timings:
+        return None
+    return round(timings[min(len(timings) - 1, int(len(timings) * p))] * 1000, 3)
+
+def _context(app):
+    from movietracker.models import Genre, Movie
+    with app.app_context():
+        genres = [name for name, in Genre.query.with_entities(Genre.name)]
+        movies = [uuid for uuid, in Movie.query.with_entities(Movie.uuid).limit(1000)]
+    return genres, movies
+
+def _reader(port, movies, deadline, rng, result):
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    while time.perf_counter() < deadline:
+        if rng.random() < 0.5:
+            path = "/api/movies/{}/".format(rng.choice(movies))
+        else:
+            path = "/api/movies/?limit=50&min_score={}".format(rng.randint(1, 9))
+        start = time.perf_counter()
+        connection.request("GET", path)
+        resp = connection.getresponse()
+        resp.read()
+        result["timings"].append(time.perf_counter() - start)
+        if resp.status >= 400:
+            result["errors"] += 1
+    connection.close()
+
+def _writer(port, movies, genres, deadline, rng, result):
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    while time.perf_counter() < deadline:
+        body = json.dumps({
+            "title": "concurrency-{}".format(rng.randrange(10 ** 6)),
+            "actors": "actor-{}".format(rng.randrange(10 ** 6)),
+            "release_date": "2000-01-01",
+            "score": round(rng.uniform(1, 10), 1),
+            "genre": rng.choice(genres),
+        })
+        start = time.perf_counter()
+        connection.request(
+            "PUT", "/api/movies/{}/".format(rng.choice(movies)),
+            body=body, headers={"Content-Type": "application/json"}
+        )
+        resp = connection.getresponse()
+        resp.read()
+        result["timings"].append(time.perf_counter() - start)
+        if resp.status >= 400:
+            result["errors"] += 1
+    connection.close()
+
+def run(name, config, args):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    app, db_path = create_benchmark_app(RESPONSE_CACHE_ENABLED=False, **config)
+    seed(app, movies=args.size, genres=10)
+    genres, movies = _context(app)
+
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    reads = {"timings": [], "errors": 0}
+    writes = {"timings": [], "errors": 0}
+    deadline = time.perf_counter() + args.seconds
+    threads = [
+        threading.Thread(target=_reader, args=(server.server_port, movies, deadline, random.Random(i), reads))
+        for i in range(args.readers)
+    ] + [
+        threading.Thread(target=_writer, args=(server.server_port, movies, genres, deadline, random.Random(-i), writes))
+        for i in range(1, args.writers + 1)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    for suffix in ["", "-wal", "-shm"]:
+        if os.path.exists(db_path + suffix):
+            os.unlink(db_path + suffix)
+
+    row = {"config": name}
+    for kind, result in [("read", reads), ("write", writes)]:
+        timings = sorted(result["timings"])
+        row[kind + "_p50_ms"] = _percentile(timings, 0.50)
+        row[kind + "_p99_ms"] = _percentile(timings, 0.99)
+        row[kind + "_rps"] = round(len(timings) / elapsed, 1)
+        row[kind + "_errors"] = result["errors"]
+    return row
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=100000, help="Number of movies to seed")
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    results = []
+    for name, config in CONFIGS:
+        row = run(name, config, args)
+        results.append(row)
+        print(
+            "{config:<9} read p50 {read_p50_ms} ms p99 {read_p99_ms} ms {read_rps}/s {read_errors} errors  "
+            "write p50 {write_p50_ms} ms p99 {write_p99_ms} ms {write_rps}/s {write_errors} errors".format(**row)
+        )
+    print(json.dumps(results))
+
+if __name__ == "__main__":
+    main()
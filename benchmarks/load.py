@@ -0,0 +1,367 @@
+"""
+Load-testing benchmark for every resource of the API.
+
+Seeds a synthetic catalogue with the fast generator in seed.py and then
+drives each endpoint either in-process through the Flask test client or over
+HTTP against a real threaded WSGI server. Every endpoint is run in a fresh
+process, and the peak RSS it reports is the high-water mark of that process
+after warm-up, so each endpoint is measured on its own. For each endpoint the
+p50/p95/p99 latency, requests per second, peak RSS and how much the RSS grew
+during the run are printed and written as JSON, together with the git commit, so runs of different commits
+can be compared with compare.py.
+
+Run with the movietracker package installed (see README):
+
+    python benchmarks/load.py --sizes 1000 100000 1000000 --driver both \\
+        --output results.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import threading
+import subprocess
+import http.client
+import multiprocessing
+from urllib.parse import quote
+from seed import create_benchmark_app, seed
+
+# name, method, path template, number of requests relative to --requests
+ENDPOINTS = [
+    ("entry_point", "GET", "/api/", 1),
+    ("genre_collection", "GET", "/api/genres/", 1),
+    ("genre_item", "GET", "/api/genres/{genre}/", 1),
+    ("movies_by_genre", "GET", "/api/genres/{genre}/movies/", 1),
+    ("series_by_genre", "GET", "/api/genres/{genre}/series/", 1),
+    ("movie_collection", "GET", "/api/movies/", 1),
+    ("movie_collection_sorted", "GET", "/api/movies/?sort=-score&min_score=5", 1),
+    ("movie_item", "GET", "/api/movies/{movie}/", 1),
+    ("series_collection", "GET", "/api/series/", 1),
+    ("series_item", "GET", "/api/series/{series}/", 1),
+    ("actor_item", "GET", "/api/actors/{actor}/", 1),
+    ("search", "GET", "/api/search/?q=title+{number}", 1),
+    ("movie_export", "GET", "/api/movies/export/", 0.01),
+    ("series_export", "GET", "/api/series/export/", 0.01),
+    ("add_movie", "POST", "/api/genres/{genre}/movies/", 0.5),
+    ("add_series", "POST", "/api/genres/{genre}/series/", 0.5),
+    ("edit_movie", "PUT", "/api/movies/{movie}/", 0.5),
+    ("edit_series", "PUT", "/api/series/{series}/", 0.5),
+    ("patch_movie", "PATCH", "/api/movies/{movie}/", 0.5),
+    ("patch_series", "PATCH", "/api/series/{series}/", 0.5),
+    ("bulk_movies", "POST", "/api/movies/bulk/", 0.1),
+    ("bulk_series", "POST", "/api/series/bulk/", 0.1),
+    ("batch_movies", "PUT", "/api/movies/batch/", 0.1),
+    ("batch_series", "PUT", "/api/series/batch/", 0.1),
+    ("delete_movie", "DELETE", "/api/movies/{movie}/", 0.5),
+    ("delete_series", "DELETE", "/api/series/{series}/", 0.5),
+    ("delete_batch_movies", "DELETE", "/api/movies/batch/", 0.1),
+    ("delete_batch_series", "DELETE", "/api/series/batch/", 0.1),
+]
+
+# items selected by every batch request
+BATCH_ITEMS = 10
+
+def _document(method, path, context, rng):
+    series = "/series/" in path
+    document = {
+        "title": "benchmark-{}".format(rng.randrange(10 ** 6)),
+        "actors": "actor-{}".format(rng.randrange(10 ** 6)),
+        "release_date": "2000-01-01",
+        "score": round(rng.uniform(1, 10), 1),
+    }
+    if series:
+        document["seasons"] = rng.randint(1, 10)
+    if method == "PUT" or "/bulk/" in path:
+        document["genre"] = rng.choice(context["genres"])
+    if "/bulk/" in path:
+        return [dict(document, title="bulk-{}".format(i)) for i in range(100)]
+    return document
+
+def _deletable(name, context, kind):
+    # single and batch deletes take every other deletable item
+    return context["deletable_" + kind][name.startswith("delete_batch_")::2]
+
+def _max_count(name, context):
+    '''
+    Return how many requests an endpoint can send without running out of
+    items to delete, None if it doesn't delete.
+    '''
+    if not name.startswith("delete_"):
+        return None
+    items = min(len(_deletable(name, context, "movies")), len(_deletable(name, context, "series")))
+    return items // BATCH_ITEMS if name.startswith("delete_batch_") else items
+
+def _batch_document(method, uuids, rng):
+    document = {"uuids": uuids}
+    if method == "PUT":
+        document["patch"] = {"score": round(rng.uniform(1, 10), 1)}
+    return document
+
+def _patch_document(path, rng):
+    if "/series/" in path:
+        return {"seasons": rng.randint(1, 10)}
+    return {"score": round(rng.uniform(1, 10), 1)}
+
+def _content_type(method):
+    return "application/merge-patch+json" if method == "PATCH" else "application/json"
+
+def _requests(name, method, template, count, context, rng):
+    '''
+    Build the list of (method, path, body) to send. Deletes use items of
+    their own so that every request hits existing items.
+    '''
+    uuids = {
+        "movie": list(context["movies"]),
+        "series": list(context["series"]),
+    }
+    if name.startswith("delete_"):
+        uuids["movie"] = _deletable(name, context, "movies")
+        uuids["series"] = _deletable(name, context, "series")
+
+    actors = context.get("actors") or [""]
+    requests = []
+    for i in range(count):
+        path = template.format(
+            genre=rng.choice(context["genres"]),
+            movie=uuids["movie"][i % len(uuids["movie"])],
+            series=uuids["series"][i % len(uuids["series"])],
+            actor=quote(actors[i % len(actors)]),
+            number=rng.randrange(context["size"]),
+        )
+        body = None
+        if "/batch/" in path:
+            kind = "series" if "/series/" in path else "movie"
+            if method == "DELETE":
+                selected = uuids[kind][i * BATCH_ITEMS:(i + 1) * BATCH_ITEMS]
+            else:
+                selected = rng.sample(uuids[kind], BATCH_ITEMS)
+            body = json.dumps(_batch_document(method, selected, rng))
+        elif method == "PATCH":
+            body = json.dumps(_patch_document(path, rng))
+        elif method in ("POST", "PUT"):
+            body = json.dumps(_document(method, path, context, rng))
+        requests.append((method, path, body))
+    return requests
+
+def _percentile(timings, p):
+    return timings[min(len(timings) - 1, int(len(timings) * p))]
+
+def _client_driver(app, requests):
+    client = app.test_client()
+    timings = []
+    started = time.perf_counter()
+    for method, path, body in requests:
+        start = time.perf_counter()
+        resp = client.open(path, method=method, data=body, content_type=_content_type(method))
+        resp.get_data()
+        resp.close()
+        timings.append(time.perf_counter() - start)
+        if resp.status_code >= 400:
+            raise RuntimeError("{} {} returned {}".format(method, path, resp.status_code))
+    return timings, time.perf_counter() - started
+
+def _server_driver(app, requests, concurrency):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+    timings = []
+    errors = []
+
+    def worker(part):
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        for method, path, body in part:
+            headers = {"Content-Type": _content_type(method)} if body else {}
+            start = time.perf_counter()
+            connection.request(method, path, body=body, headers=headers)
+            resp = connection.getresponse()
+            resp.read()
+            timings.append(time.perf_counter() - start)
+            if resp.status >= 400:
+                errors.append("{} {} returned {}".format(method, path, resp.status))
+        connection.close()
+
+    threads = [
+        threading.Thread(target=worker, args=(requests[i::concurrency],))
+        for i in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    if errors:
+        raise RuntimeError(errors[0])
+    return timings, elapsed
+
+def _run_endpoint(queue, db_path, config, driver, endpoint, count, concurrency, context):
+    try:
+        queue.put(_measure(db_path, config, driver, endpoint, count, concurrency, context))
+    except Exception as e:
+        queue.put({"endpoint": endpoint[0], "error": repr(e)})
+
+def _rss():
+    '''
+    Return the current and the peak resident set size of this process in kB,
+    or (None, None) where /proc is not available.
+    '''
+    try:
+        with open("/proc/self/status") as f:
+            values = dict(line.split(":", 1) for line in f)
+    except OSError:
+        return None, None
+    return int(values["VmRSS"].split()[0]), int(values["VmHWM"].split()[0])
+
+def _reset_peak_rss():
+    # the high-water mark and ru_maxrss carry over from the parent across
+    # fork and exec, writing 5 to clear_refs resets it to the current RSS
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def _measure(db_path, config, driver, endpoint, count, concurrency, context):
+    name, method, template, _ = endpoint
+    app, _ = create_benchmark_app(db_path, **config)
+    if "{actor}" in template:
+        # earlier endpoints change actors, so they are looked up when needed
+        context = dict(context, actors=_actors(app))
+    requests = _requests(name, method, template, count, context, random.Random(name))
+
+    # the first request pays for imports and connection setup
+    if method == "GET":
+        app.test_client().get(requests[0][1]).close()
+    _reset_peak_rss()
+    baseline, _ = _rss()
+
+    if driver == "client":
+        timings, elapsed = _client_driver(app, requests)
+    else:
+        timings, elapsed = _server_driver(app, requests, concurrency)
+
+    _, peak = _rss()
+    timings.sort()
+    return {
+        "endpoint": name,
+        "method": method,
+        "path": template,
+        "requests": len(timings),
+        "p50_ms": round(_percentile(timings, 0.50) * 1000, 3),
+        "p95_ms": round(_percentile(timings, 0.95) * 1000, 3),
+        "p99_ms": round(_percentile(timings, 0.99) * 1000, 3),
+        "requests_per_second": round(len(timings) / elapsed, 1),
+        "peak_rss_kb": peak,
+        "rss_growth_kb": peak - baseline if peak is not None else None,
+    }
+
+def _context(app, size):
+    from movietracker.models import Genre, Movie, Series
+    with app.app_context():
+        genres = [name for name, in Genre.query.with_entities(Genre.name)]
+        movies = [uuid for uuid, in Movie.query.with_entities(Movie.uuid).limit(1000)]
+        series = [uuid for uuid, in Series.query.with_entities(Series.uuid).limit(1000)]
+    return {
+        "size": size,
+        "genres": genres,
+        "movies": movies[:500],
+        "series": series[:500],
+        "deletable_movies": movies[500:],
+        "deletable_series": series[500:],
+    }
+
+def _actors(app):
+    from movietracker.models import Actor, movie_actor
+    with app.app_context():
+        query = Actor.query.with_entities(Actor.name).join(movie_actor, movie_actor.c.actor_id == Actor.id)
+        return [name for name, in query.distinct().order_by(Actor.name).limit(500)]
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__))
+        ).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000],
+        help="Number of movies and of series to seed")
+    parser.add_argument("--genres", type=int, default=20)
+    parser.add_argument("--driver", choices=["client", "server", "both"], default="both")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=4, help="Client threads for the server driver")
+    parser.add_argument("--endpoints", nargs="+", help="Only run these endpoints")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the response cache")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    config = {"RESPONSE_CACHE_ENABLED": not args.no_cache}
+    drivers = ["client", "server"] if args.driver == "both" else [args.driver]
+    endpoints = [e for e in ENDPOINTS if not args.endpoints or e[0] in args.endpoints]
+    spawn = multiprocessing.get_context("spawn")
+
+    results = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "runs": [],
+    }
+
+    for size in args.sizes:
+        app, db_path = create_benchmark_app(**config)
+        start = time.perf_counter()
+        seed(app, movies=size, series=size, genres=args.genres)
+        print("seeded {} movies and {} series in {:.1f} s".format(size, size, time.perf_counter() - start))
+        context = _context(app, size)
+
+        for i, driver in enumerate(drivers):
+            # every driver deletes items of its own
+            driver_context = dict(
+                context,
+                deletable_movies=context["deletable_movies"][i::len(drivers)],
+                deletable_series=context["deletable_series"][i::len(drivers)],
+            )
+            for endpoint in endpoints:
+                count = max(1, int(args.requests * endpoint[3]))
+                max_count = _max_count(endpoint[0], driver_context)
+                if max_count is not None:
+                    count = min(count, max_count)
+                queue = spawn.Queue()
+                process = spawn.Process(target=_run_endpoint, args=(
+                    queue, db_path, config, driver, endpoint, count, args.concurrency, driver_context
+                ))
+                process.start()
+                row = queue.get()
+                process.join()
+                if "error" in row:
+                    sys.exit("{} failed: {}".format(row["endpoint"], row["error"]))
+                row.update(size=size, driver=driver)
+                results["runs"].append(row)
+                print("{size:>8} {driver:<6} {endpoint:<24} p50 {p50_ms:>9.2f} ms  p95 {p95_ms:>9.2f} ms  "
+                      "p99 {p99_ms:>9.2f} ms  {requests_per_second:>8.1f} req/s  {peak_rss_kb!s:>8} kB  "
+                      "+{rss_growth_kb!s} kB".format(**row))
+        os.unlink(db_path)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results))
+
+if __name__ == "__main__":
+    main()
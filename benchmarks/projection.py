@@ -0,0 +1,78 @@
+"""
+Benchmark for loading a full movie listing as ORM objects versus as rows of
+only the needed columns.
+
+For each catalogue size all movies are loaded once with
+Movie.query.options(joinedload(Movie.genre)).all(), the path listings used
+before, and once with listing_query(Movie).all(), and the item field tuples
+are extracted from the results. The time and the peak memory allocated
+while loading (measured with tracemalloc) are reported.
+
+Run with the movietracker package installed (see README):
+
+    python benchmarks/projection.py [size ...]
+"""
+
+import os
+import sys
+import json
+import time
+import tracemalloc
+from sqlalchemy.orm import joinedload
+from movietracker import db
+from movietracker.models import Movie, listing_query
+from seed import create_benchmark_app, seed
+
+REPEAT = 3
+
+def load_entities():
+    return [
+        ((m.title, m.actors, m.release_date, m.score, m.genre.name), m.uuid)
+        for m in Movie.query.options(joinedload(Movie.genre)).all()
+    ]
+
+def load_rows():
+    return [(row[:-2], row.uuid) for row in listing_query(Movie).all()]
+
+def measure(func):
+    best = None
+    for _ in range(REPEAT):
+        db.session.remove()
+        start = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+
+    db.session.remove()
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, best, peak
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    results = []
+    for size in sizes:
+        app, db_path = create_benchmark_app()
+        seed(app, movies=size)
+        with app.app_context():
+            entities, entity_seconds, entity_peak = measure(load_entities)
+            rows, row_seconds, row_peak = measure(load_rows)
+            assert entities == rows
+        os.unlink(db_path)
+
+        row = {
+            "movies": size,
+            "orm_ms": round(entity_seconds * 1000, 1),
+            "projection_ms": round(row_seconds * 1000, 1),
+            "orm_peak_mb": round(entity_peak / 2 ** 20, 1),
+            "projection_peak_mb": round(row_peak / 2 ** 20, 1),
+        }
+        results.append(row)
+        print("{movies:>8} movies  orm {orm_ms:>8} ms {orm_peak_mb:>7} MB  "
+              "projection {projection_ms:>8} ms {projection_peak_mb:>7} MB".format(**row))
+    print(json.dumps(results))
+
+if __name__ == "__main__":
+    main()
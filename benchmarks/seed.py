@@ -0,0 +1,75 @@
+"""
+Fast synthetic catalogue generator for benchmarks.
+
+Rows are inserted with executemany through SQLAlchemy Core in large chunks
+instead of creating ORM objects, so a million rows take seconds instead of
+minutes.
+"""
+
+import os
+import random
+import tempfile
+from movietracker import db, create_app
+from movietracker.models import Genre, Movie, Series, link_unlinked_actors
+from movietracker.utils import get_uuid
+
+CHUNK_SIZE = 20000
+
+def create_benchmark_app(db_path=None, **config):
+    '''
+    Create an app using a new SQLite database file. Returns the app and the
+    path to the database file.
+    '''
+    if db_path is None:
+        fd, db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+    config.setdefault("SQLALCHEMY_DATABASE_URI", "sqlite:///" + db_path)
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+    return app, db_path
+
+def _rows(count, genre_ids, rng, extra=None):
+    for i in range(count):
+        row = {
+            "uuid": get_uuid(),
+            "genre_id": genre_ids[i % len(genre_ids)],
+            "title": "title-{}".format(i),
+            "actors": "actor-{}, actor-{}".format(rng.randrange(count), rng.randrange(count)),
+            "release_date": "{:04d}-{:02d}-{:02d}".format(
+                rng.randint(1950, 2020), rng.randint(1, 12), rng.randint(1, 28)
+            ),
+            "score": round(rng.uniform(1, 10), 1),
+        }
+        if extra is not None:
+            row.update(extra(rng))
+        yield row
+
+def _insert(table, rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            db.session.execute(table.insert(), chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(table.insert(), chunk)
+
+def seed(app, movies, series=0, genres=10, seed=0):
+    '''
+    Fill the database of the app with given number of genres, movies and
+    series. Items are spread evenly across genres named genre-0, genre-1...
+    '''
+    rng = random.Random(seed)
+    with app.app_context():
+        db.session.execute(
+            Genre.__table__.insert(),
+            [{"name": "genre-{}".format(i)} for i in range(genres)]
+        )
+        genre_ids = [genre_id for genre_id, in db.session.query(Genre.id).order_by(Genre.id)]
+        _insert(Movie.__table__, _rows(movies, genre_ids, rng))
+        _insert(Series.__table__, _rows(
+            series, genre_ids, rng, lambda rng: {"seasons": rng.randint(1, 10)}
+        ))
+        link_unlinked_actors(db.session.connection())
+        db.session.commit()
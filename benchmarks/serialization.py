@@ -0,0 +1,85 @@
+"""
+Microbenchmark for encoding movie and series collection pages.
+
+Compares building a MovieTrackerBuilder for every item and encoding the
+document with json.dumps against the ItemSerializer path in
+movietracker.serializers, which writes the items straight from tuples of
+field values. Hrefs are computed beforehand so that only building and
+encoding is measured. The outputs are checked to be identical.
+
+Run with the movietracker package installed (see README):
+
+    python benchmarks/serialization.py [items ...]
+"""
+
+import sys
+import json
+import random
+import timeit
+from movietracker.constants import *
+from movietracker.serializers import MOVIE_FIELDS, SERIES_FIELDS, encode_collection, \
+    movie_serializer, series_serializer
+from movietracker.utils import MovieTrackerBuilder
+
+ROUNDS = 20
+
+def make_rows(count, fields, rng):
+    rows = []
+    for i in range(count):
+        values = {
+            "title": "title-{}".format(i),
+            "actors": "actor-{}, actor-{}".format(rng.randrange(count), rng.randrange(count)),
+            "release_date": "{:04d}-{:02d}-{:02d}".format(
+                rng.randint(1950, 2020), rng.randint(1, 12), rng.randint(1, 28)
+            ),
+            "score": round(rng.uniform(1, 10), 1),
+            "seasons": rng.randint(1, 10),
+            "genre": "genre-{}".format(i % 10),
+        }
+        rows.append((tuple(values[field] for field in fields), "/api/items/{}/".format(i)))
+    return rows
+
+def make_body():
+    body = MovieTrackerBuilder()
+    body.add_namespace("mt", LINK_RELATIONS_URL)
+    body.add_control("self", "/api/movies/")
+    return body
+
+def builders(rows, fields, profile):
+    body = make_body()
+    body["items"] = []
+    for values, href in rows:
+        item = MovieTrackerBuilder(**dict(zip(fields, values)))
+        item.add_control("self", href)
+        item.add_control("profile", profile)
+        body["items"].append(item)
+    return json.dumps(body)
+
+def serializer(rows, serializer):
+    return encode_collection(make_body(), (serializer.encode(values, href) for values, href in rows))
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000]
+    rng = random.Random(0)
+    results = []
+    for size in sizes:
+        for kind, fields, profile, item_serializer in [
+            ("movie", MOVIE_FIELDS, MOVIE_PROFILE, movie_serializer),
+            ("series", SERIES_FIELDS, SERIES_PROFILE, series_serializer),
+        ]:
+            rows = make_rows(size, fields, rng)
+            assert builders(rows, fields, profile) == serializer(rows, item_serializer)
+            row = {"items": size, "type": kind}
+            for name, func in [
+                ("builder", lambda: builders(rows, fields, profile)),
+                ("serializer", lambda: serializer(rows, item_serializer)),
+            ]:
+                seconds = min(timeit.repeat(func, number=ROUNDS, repeat=3))
+                row[name + "_ms"] = round(seconds / ROUNDS * 1000, 3)
+            row["speedup"] = round(row["builder_ms"] / row["serializer_ms"], 1)
+            results.append(row)
+            print("{items:>6} {type:<7} builder {builder_ms:>9} ms  serializer {serializer_ms:>9} ms  x{speedup}".format(**row))
+    print(json.dumps(results))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Microbenchmark for JSON schema validation of POST and PUT requests.
+
+Compares the per-request cost of the original approach, where the schema is
+rebuilt for validation, for iterating its properties and for the Mason
+control and jsonschema.validate checks the schema and creates a validator on
+every call, with the shared schema registry in movietracker.schemas.
+
+Run with the movietracker package installed (see README):
+
+    python benchmarks/validation.py
+"""
+
+import json
+import timeit
+import jsonschema
+from movietracker.models import Movie, Series
+from movietracker import schemas
+
+ROUNDS = 1000
+
+DOCUMENTS = {
+    (Movie, "post"): {
+        "title": "The Avengers",
+        "actors": "Robert Downey Jr.",
+        "release_date": "2012-04-11",
+        "score": 8.0
+    },
+    (Movie, "put"): {
+        "title": "The Avengers",
+        "actors": "Robert Downey Jr.",
+        "release_date": "2012-04-11",
+        "score": 8.0,
+        "genre": "Action"
+    },
+    (Series, "post"): {
+        "title": "Breaking Bad",
+        "actors": "Bryan Cranston",
+        "release_date": "2008-01-20",
+        "score": 9.5,
+        "seasons": 5
+    },
+    (Series, "put"): {
+        "title": "Breaking Bad",
+        "actors": "Bryan Cranston",
+        "release_date": "2008-01-20",
+        "score": 9.5,
+        "seasons": 5,
+        "genre": "Crime"
+    },
+}
+
+def uncached(model, method, document):
+    get_schema = getattr(model, "get_schema_" + method)
+    jsonschema.validate(document, get_schema())
+    for attr in get_schema()["properties"]:
+        pass
+    get_schema()
+
+def cached(model, method, document):
+    schemas.validate(document, model, method)
+    for attr in schemas.get_schema(model, method)["properties"]:
+        pass
+    schemas.get_schema(model, method)
+
+def main():
+    results = []
+    for (model, method), document in DOCUMENTS.items():
+        row = {"schema": "{}.{}".format(model.__name__, method)}
+        for name, func in [("uncached", uncached), ("cached", cached)]:
+            seconds = min(timeit.repeat(
+                lambda: func(model, method, document),
+                number=ROUNDS,
+                repeat=5
+            ))
+            row[name + "_us"] = round(seconds / ROUNDS * 1e6, 2)
+        row["speedup"] = round(row["uncached_us"] / row["cached_us"], 1)
+        results.append(row)
+        print("{schema:<12} uncached {uncached_us:>9} us  cached {cached_us:>9} us  x{speedup}".format(**row))
+    print(json.dumps(results))
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,11 @@ import os
 import json
 from flask import Flask, Response
 from flask_sqlalchemy import SQLAlchemy
-from movietracker.utils import MovieTrackerBuilder
+from movietracker.database import RoutingSession
+from movietracker.utils import MovieTrackerBuilder, create_error_response, create_mason_response
 from movietracker.constants import *
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 # Based on http://flask.pocoo.org/docs/1.0/tutorial/factory/#the-application-factory
 # Modified to use Flask SQLAlchemy
@@ -27,23 +28,59 @@ def create_app(test_config=None):
     except OSError:
         pass
     
+    from . import database
+    database.configure_engine(app)
     db.init_app(app)
+    database.init_app(app, db)
 
     from . import models
     from . import api
+    from . import bulk
+    from . import caching
+    from . import compression
+    from . import instrumentation
+    from . import search
     app.cli.add_command(models.init_db_command)
+    app.cli.add_command(models.upgrade_db_command)
     app.cli.add_command(models.generate_test_data)
+    app.cli.add_command(bulk.import_catalog_command)
     app.register_blueprint(api.api_bp)
+    caching.init_app(app)
+    instrumentation.init_app(app)
+    compression.init_app(app)
 
     @app.route("/api/", methods=["GET"])
+    @caching.conditional()
     def entry_point():
         body = MovieTrackerBuilder()
         body.add_namespace("mt", LINK_RELATIONS_URL)
         body.add_control_all_movies()
         body.add_control_all_series()
         body.add_control_all_genres()
+        body.add_control_search()
+        body.add_control_filmography()
 
-        return Response(json.dumps(body), 200, mimetype=MASON)
+        return create_mason_response(body)
+
+    @app.route("/api/_cache/", methods=["GET"])
+    def cache_stats():
+        cache = caching.get_cache()
+        stats = cache.stats() if cache is not None else {}
+        return Response(json.dumps(stats), 200, mimetype="application/json")
+
+    @app.route("/api/_metrics", methods=["GET"])
+    def metrics():
+        registry = instrumentation.get_metrics()
+        if registry is None:
+            return create_error_response(404,
+                "Metrics not available",
+                "Instrumentation is not enabled"
+            )
+        return Response(
+            registry.render(caching.get_cache()),
+            200,
+            mimetype="text/plain; version=0.0.4"
+        )
 
     @app.route("/")
     def admin_site():
@@ -1,8 +1,10 @@
 from flask import Blueprint
 from flask_restful import Api
+from movietracker.resources.actor import ActorItem
 from movietracker.resources.genre import GenreCollection, GenreItem, MoviesByGenreCollection, SeriesByGenreCollection
-from movietracker.resources.movie import MovieCollection, MovieItem
-from movietracker.resources.series import SeriesCollection, SeriesItem
+from movietracker.resources.movie import MovieBatch, MovieBulk, MovieCollection, MovieExport, MovieItem
+from movietracker.resources.search import Search
+from movietracker.resources.series import SeriesBatch, SeriesBulk, SeriesCollection, SeriesExport, SeriesItem
 
 api_bp = Blueprint("api", __name__, url_prefix="/api/")
 api = Api(api_bp)
@@ -12,6 +14,14 @@ api.add_resource(GenreItem, "/genres/<genre>/")
 api.add_resource(MoviesByGenreCollection, "/genres/<genre>/movies/")
 api.add_resource(SeriesByGenreCollection, "/genres/<genre>/series/")
 api.add_resource(MovieCollection, "/movies/")
+api.add_resource(MovieExport, "/movies/export/")
+api.add_resource(MovieBulk, "/movies/bulk/")
+api.add_resource(MovieBatch, "/movies/batch/")
 api.add_resource(MovieItem, "/movies/<movie>/")
 api.add_resource(SeriesCollection, "/series/")
-api.add_resource(SeriesItem, "/series/<series>/")
\ No newline at end of file
+api.add_resource(SeriesExport, "/series/export/")
+api.add_resource(SeriesBulk, "/series/bulk/")
+api.add_resource(SeriesBatch, "/series/batch/")
+api.add_resource(SeriesItem, "/series/<series>/")
+api.add_resource(Search, "/search/")
+api.add_resource(ActorItem, "/actors/<actor>/")
\ No newline at end of file
@@ -0,0 +1,186 @@
+from jsonschema import ValidationError
+from sqlalchemy import select
+from movietracker import db
+from movietracker.models import Genre, bump_table_versions, link_actors
+from movietracker.caching import get_genre_id
+from movietracker.constants import *
+from movietracker.filters import FILTER_PARAMETERS, filter_query, get_filter_schema
+from movietracker.schemas import get_schema, register_schema, validate
+
+def _build_schema(model, method):
+    filter_schema = get_filter_schema(model)
+    selection = {
+        "uuids": {
+            "description": "Uuids of the items",
+            "type": "array",
+            "items": {"type": "string"},
+            "minItems": 1
+        },
+        "filter": {
+            "description": "Filter that selects the items, at least one parameter is required",
+            "type": "object",
+            "properties": dict(
+                {name: filter_schema["properties"][name] for name in FILTER_PARAMETERS},
+                genre={"description": "Name of the genre", "type": "string"}
+            ),
+            "additionalProperties": False,
+            "minProperties": 1
+        }
+    }
+    schema = {
+        "type": "object",
+        "properties": selection,
+        "oneOf": [{"required": ["uuids"]}, {"required": ["filter"]}],
+        "additionalProperties": False
+    }
+    if method == "put":
+        selection["patch"] = dict(get_schema(model, "patch"),
+            description="Properties to set on all items", minProperties=1)
+        schema["required"] = ["patch"]
+    return schema
+
+register_schema("batch_put", lambda model: _build_schema(model, "put"))
+register_schema("batch_delete", lambda model: _build_schema(model, "delete"))
+
+def _chunks(values, size):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+def _genre_id(name):
+    genre_id = get_genre_id(name)
+    if genre_id is None:
+        raise ValueError("Genre with name '{}' cannot be found".format(name))
+    return genre_id
+
+def _select(model, document):
+    '''
+    Find the items selected by the uuids or the filter of a batch document.
+    Returns the requested uuids (None for a filter) and (id, uuid, genre name)
+    rows of the items that exist.
+    '''
+    query = db.session.query(model.id, model.uuid, Genre.name).select_from(model) \
+        .outerjoin(Genre, model.genre_id == Genre.id)
+
+    if "uuids" in document:
+        uuids = list(dict.fromkeys(document["uuids"]))
+        rows = []
+        for chunk in _chunks(uuids, BATCH_CHUNK_SIZE):
+            rows.extend(query.filter(model.uuid.in_(chunk)))
+        return uuids, rows
+
+    query = filter_query(model, query, document["filter"])
+    if "genre" in document["filter"]:
+        query = query.filter(model.genre_id == _genre_id(document["filter"]["genre"]))
+    return None, query.order_by(model.id).all()
+
+def _summary(uuids, rows):
+    found = {row.uuid for row in rows}
+    if uuids is None:
+        uuids = [row.uuid for row in rows]
+    return [
+        {"uuid": uuid, "status": 204 if uuid in found else 404}
+        for uuid in uuids
+    ]
+
+def _validate(document, model, method):
+    try:
+        validate(document, model, method)
+    except ValidationError as e:
+        raise ValueError(str(e))
+
+def update_items(model, document):
+    '''
+    Apply the patch of a batch PUT document to all movies or series it
+    selects, either by a list of uuids or by a filter. The items are updated
+    with one UPDATE statement per chunk of BATCH_CHUNK_SIZE items, all in
+    one transaction. Raises ValueError if the document is invalid.
+
+    Returns a tuple of (per item statuses, names of the genres whose
+    listings changed). Each status is a dict with the uuid of the item and
+    204 if it was updated or 404 if it doesn't exist.
+    '''
+    _validate(document, model, "batch_put")
+    values = dict(document["patch"])
+    genres = set()
+    if "genre" in values:
+        genres.add(values["genre"])
+        values["genre_id"] = _genre_id(values.pop("genre"))
+
+    uuids, rows = _select(model, document)
+    table = model.__table__
+    for chunk in _chunks([row.id for row in rows], BATCH_CHUNK_SIZE):
+        db.session.execute(table.update().where(table.c.id.in_(chunk)).values(values))
+    if rows:
+        if "actors" in values:
+            link_actors(db.session.connection(), model, [(row.id, values["actors"]) for row in rows])
+        bump_table_versions(db.session.connection(), [model.__tablename__])
+    db.session.commit()
+    genres.update(row.name for row in rows)
+    return _summary(uuids, rows), genres
+
+def delete_items(model, document):
+    '''
+    Delete all movies or series selected by a batch DELETE document, with
+    one DELETE statement per chunk of BATCH_CHUNK_SIZE items, all in one
+    transaction. Raises ValueError if the document is invalid.
+
+    Returns the same tuple as update_items.
+    '''
+    _validate(document, model, "batch_delete")
+    uuids, rows = _select(model, document)
+    table = model.__table__
+    for chunk in _chunks([row.id for row in rows], BATCH_CHUNK_SIZE):
+        db.session.execute(table.delete().where(table.c.id.in_(chunk)))
+    if rows:
+        bump_table_versions(db.session.connection(), [model.__tablename__])
+    db.session.commit()
+    return _summary(uuids, rows), {row.name for row in rows}
+
+def patch_item(model, uuid, document):
+    '''
+    Apply a JSON Merge Patch document to one movie or series. Only the
+    supplied properties are validated and set, null removes an optional
+    property. The row is changed with a single UPDATE without loading it,
+    and the genre is looked up and the actors are linked only if the patch
+    changes them. Raises ValueError if the document is invalid.
+
+    Returns None if the item doesn't exist, otherwise the names of the
+    genres whose listings changed.
+    '''
+    _validate(document, model, "patch")
+    if not document:
+        # an empty merge patch changes nothing
+        if db.session.query(model.id).filter(model.uuid == uuid).first() is None:
+            return None
+        return set()
+
+    values = dict(document)
+    genres = set()
+    table = model.__table__
+    if "genre" in values:
+        genres.add(values["genre"])
+        values["genre_id"] = _genre_id(values.pop("genre"))
+        # the listings of the old genre change too
+        genres.add(db.session.query(Genre.name).join(model, model.genre_id == Genre.id)
+            .filter(model.uuid == uuid).scalar())
+
+    statement = table.update().where(table.c.uuid == uuid).values(values)
+    genre_name = select(Genre.name).where(Genre.id == table.c.genre_id).scalar_subquery()
+    connection = db.session.connection()
+    if connection.dialect.update_returning:
+        rows = db.session.execute(statement.returning(table.c.id, genre_name)).all()
+    else:
+        result = db.session.execute(statement)
+        rows = db.session.query(model.id, Genre.name).outerjoin(Genre, model.genre_id == Genre.id) \
+            .filter(model.uuid == uuid).all() if result.rowcount else []
+    if not rows:
+        db.session.rollback()
+        return None
+
+    if "actors" in values:
+        link_actors(connection, model, [(item_id, values["actors"]) for item_id, _ in rows])
+    bump_table_versions(connection, [model.__tablename__])
+    db.session.commit()
+    genres.update(name for _, name in rows)
+    genres.discard(None)
+    return genres
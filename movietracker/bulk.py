@@ -0,0 +1,133 @@
+import json
+import click
+from flask.cli import with_appcontext
+from jsonschema import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+from movietracker import db
+from movietracker.models import Movie, Series, bump_table_versions, link_actors
+from movietracker.caching import get_genre_cache
+from movietracker.constants import *
+from movietracker.schemas import get_schema, validate
+from movietracker.utils import get_uuid
+
+def _insert(model, rows):
+    db.session.execute(model.__table__.insert(), rows)
+    connection = db.session.connection()
+    uuids = [row["uuid"] for row in rows]
+    for i in range(0, len(uuids), BATCH_CHUNK_SIZE):
+        link_actors(connection, model, db.session.query(model.id, model.actors)
+            .filter(model.uuid.in_(uuids[i:i + BATCH_CHUNK_SIZE])))
+    bump_table_versions(connection, [model.__tablename__])
+
+def _prepare(model, document, genres):
+    '''
+    Validate one document against the PUT schema of the model and turn it into
+    a row for the model's table. Raises ValueError if the document is invalid.
+    '''
+    try:
+        validate(document, model, "put")
+    except ValidationError as e:
+        raise ValueError(str(e))
+
+    genre_id = genres.get(document["genre"])
+    if genre_id is None:
+        raise ValueError("Genre with name '{}' cannot be found".format(document["genre"]))
+
+    row = {"uuid": get_uuid(), "genre_id": genre_id}
+    for attr in get_schema(model, "put")["properties"]:
+        if attr != "genre":
+            row[attr] = document.get(attr)
+    return row
+
+def _flush_chunk(model, chunk, errors):
+    '''
+    Insert a chunk of (index, row) pairs in one transaction. If the chunk
+    fails the rows are retried one by one so that only the failing rows are
+    reported as errors.
+    '''
+    try:
+        _insert(model, [row for _, row in chunk])
+        db.session.commit()
+        return len(chunk)
+    except SQLAlchemyError:
+        db.session.rollback()
+
+    created = 0
+    for index, row in chunk:
+        try:
+            _insert(model, [row])
+            db.session.commit()
+            created += 1
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            errors.append({"index": index, "message": str(getattr(e, "orig", e))})
+    return created
+
+def import_items(model, documents, chunk_size=IMPORT_CHUNK_SIZE):
+    '''
+    Bulk insert movies or series. Documents use the PUT schema of the model
+    and are inserted in chunks of chunk_size rows with one transaction per
+    chunk. Genres are resolved with the shared genre cache. Invalid
+    documents are skipped and reported, they don't abort the import.
+
+    Returns a tuple of (number of created items, list of errors) where each
+    error is a dict with the index of the document and an error message.
+    '''
+    genres = get_genre_cache().get_ids()
+    created = 0
+    errors = []
+    chunk = []
+
+    for index, document in enumerate(documents):
+        try:
+            chunk.append((index, _prepare(model, document, genres)))
+        except ValueError as e:
+            errors.append({"index": index, "message": str(e)})
+            continue
+        if len(chunk) >= chunk_size:
+            created += _flush_chunk(model, chunk, errors)
+            chunk = []
+
+    if chunk:
+        created += _flush_chunk(model, chunk, errors)
+    return created, errors
+
+def _read_json_lines(f, line_numbers, errors):
+    '''
+    Parse a JSON lines file skipping blank lines. The line number of each
+    yielded document is appended to line_numbers so that import errors can be
+    reported by line.
+    '''
+    for number, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            document = json.loads(line)
+        except ValueError as e:
+            errors.append((number, "Invalid JSON: {}".format(e)))
+            continue
+        line_numbers.append(number)
+        yield document
+
+@click.command("import-catalog")
+@click.argument("file", type=click.File("r"))
+@click.option("--type", "item_type", type=click.Choice(["movie", "series"]), default="movie",
+    help="Type of the items in the file")
+@click.option("--chunk-size", default=IMPORT_CHUNK_SIZE, help="Rows inserted per transaction")
+@with_appcontext
+def import_catalog_command(file, item_type, chunk_size):
+    '''
+    Import movies or series from a JSON lines file, one item per line
+    '''
+    model = Movie if item_type == "movie" else Series
+    line_numbers = []
+    errors = []
+    documents = _read_json_lines(file, line_numbers, errors)
+    created, import_errors = import_items(model, documents, chunk_size)
+    for error in import_errors:
+        errors.append((line_numbers[error["index"]], error["message"]))
+
+    for number, message in sorted(errors):
+        click.echo("line {}: {}".format(number, message), err=True)
+    click.echo("Imported {} items, {} errors".format(created, len(errors)))
@@ -0,0 +1,410 @@
+import json
+import time
+import pickle
+import hashlib
+import functools
+import itertools
+import threading
+from collections import OrderedDict
+from flask import Response, current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from movietracker import compression, db
+from movietracker.database import READ_METHODS, get_replica
+from movietracker.models import Genre, TableVersion
+from movietracker.utils import build_url, get_uuid
+
+def get_table_versions():
+    '''
+    Get version counters of all tables as a dict. The counters are read once
+    per request.
+    '''
+    if "table_versions" not in g:
+        g.table_versions = dict(db.session.query(TableVersion.name, TableVersion.version))
+    return g.table_versions
+
+def compute_etag(models):
+    '''
+    Compute a strong ETag for the current request URL from the version
+    counters of the tables the representation is built from
+    '''
+    versions = get_table_versions()
+    key = [request.full_path] + [
+        [model.__tablename__, versions.get(model.__tablename__, 0)] for model in models
+    ]
+    return hashlib.sha1(json.dumps(key).encode("utf-8")).hexdigest()
+
+def conditional(*models):
+    '''
+    Decorator for GET handlers whose response only depends on the URL and
+    the rows of given models. Adds an ETag to successful responses and
+    responds with 304 Not Modified if the client's If-None-Match matches,
+    without calling the handler at all. The weak comparison is used because
+    compressed responses carry the ETag as a weak one.
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            etag = g.etag = compute_etag(models)
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+
+            response = func(*args, **kwargs)
+            if response.status_code == 200:
+                response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
+
+
+class GenreCache(object):
+    """
+    Process-wide map between genre names and ids, kept separately for the
+    primary database and every read replica so that a lagging replica
+    doesn't make the maps of the others reload. In read requests the maps
+    of the request's database are reloaded whenever the version counter of
+    the genre table differs from the one they were loaded at, which costs
+    no query since conditional GET reads the counters anyway. Other
+    requests don't read the counters for single lookups: they use the maps
+    as loaded and reload them only when a genre isn't found. Genre changes
+    flushed in this process drop all maps.
+    """
+
+    def __init__(self):
+        self.loads = 0
+        # database engine, None for the primary: (version, name to id, id to name)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _load(self, replica, version):
+        ids = dict(db.session.query(Genre.name, Genre.id))
+        entry = (version, ids, {genre_id: name for name, genre_id in ids.items()})
+        self._entries[replica] = entry
+        self.loads += 1
+        return entry
+
+    def _get_entry(self, reload=False, check=False):
+        replica = get_replica()
+        entry = self._entries.get(replica)
+        if entry is not None and not reload:
+            if not check and has_request_context() and request.method not in READ_METHODS:
+                return entry
+            version = get_table_versions().get(Genre.__tablename__, 0)
+            if entry[0] == version:
+                return entry
+        with self._lock:
+            if entry is not self._entries.get(replica):
+                # loaded by another thread meanwhile
+                return self._entries[replica]
+            return self._load(replica, get_table_versions().get(Genre.__tablename__, 0))
+
+    def _lookup(self, index, key):
+        entry = self._get_entry()
+        value = entry[index].get(key)
+        if value is None and key is not None and has_request_context() \
+                and request.method not in READ_METHODS:
+            # the genre may have been added in another process
+            value = self._get_entry(reload=True)[index].get(key)
+        return value
+
+    def get_ids(self):
+        '''
+        Get a dict of all genre names to ids. Must not be modified. The
+        version counter is always checked since a missing name can't be
+        told from one that was added in another process.
+        '''
+        return self._get_entry(check=True)[1]
+
+    def get_id(self, name):
+        return self._lookup(1, name)
+
+    def get_name(self, genre_id):
+        return self._lookup(2, genre_id)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries = {}
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_flushed_genres(session, flush_context):
+    # genres are only written through the ORM
+    changed = itertools.chain(session.new, session.dirty, session.deleted)
+    if has_app_context() and any(isinstance(obj, Genre) for obj in changed):
+        session.info["genres_changed"] = True
+        get_genre_cache().invalidate()
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _invalidate_ended_genres(session):
+    # maps loaded before the transaction ended may hold its uncommitted genres
+    if session.info.pop("genres_changed", False) and has_app_context():
+        get_genre_cache().invalidate()
+
+
+class LRUCache(object):
+    """
+    In-process cache backend that keeps at most max_entries values and drops
+    the least recently used ones first. Values expire ttl seconds after they
+    were set.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SharedCache(object):
+    """
+    Cache backend on top of a shared key-value store so that all worker
+    processes use the same entries. The client needs get(key), set(key, value,
+    ex=seconds) and delete(key) like redis-py clients have. Values are stored
+    pickled. Evictions and expirations are left to the store and not counted.
+    """
+
+    def __init__(self, client, ttl=60, prefix="movietracker:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+class LocalClient(object):
+    """
+    Stand-in for a shared key-value store that keeps everything in a dict.
+    Can be used with SharedCache in development and tests.
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        value, expires = self.data.get(key, (None, None))
+        if expires is not None and expires < time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def set(self, key, value, ex=None):
+        self.data[key] = (value, None if ex is None else time.monotonic() + ex)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+class ResponseCache(object):
+    """
+    Cache of serialized response bodies keyed by URL path and query string.
+    Every path has a generation token that is part of the keys of its entries;
+    invalidating a path replaces the token, which makes all entries of the
+    path unreachable at once regardless of their query strings. Unreachable
+    entries are dropped by the backend eventually.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def _generation(self, path):
+        generation = self.backend.get("generation:" + path)
+        if generation is None:
+            generation = get_uuid()
+            self.backend.set("generation:" + path, generation)
+        return generation
+
+    def _key(self, path, query):
+        return "response:{}:{}?{}".format(self._generation(path), path, query)
+
+    def get(self, path, query, etag):
+        '''
+        Get the entry of a response if it was stored with given ETag. An
+        entry of an older version of the response counts as a miss.
+        '''
+        entry = self.backend.get(self._key(path, query))
+        if entry is None or entry["etag"] != etag:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def set(self, path, query, entry):
+        self.backend.set(self._key(path, query), entry)
+
+    def invalidate(self, path):
+        self.backend.delete("generation:" + path)
+
+    def stats(self):
+        stats = {
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+        # shared stores evict and expire entries themselves, so only
+        # in-process backends can count them
+        for name in ("evictions", "expirations"):
+            if hasattr(self.backend, name):
+                stats[name] = getattr(self.backend, name)
+        return stats
+
+
+def init_app(app):
+    '''
+    Set up the response cache of the app. RESPONSE_CACHE_BACKEND can be set
+    to a backend object (e.g. SharedCache), otherwise an LRUCache sized by
+    RESPONSE_CACHE_SIZE and RESPONSE_CACHE_TTL is used. Caching can be turned
+    off with RESPONSE_CACHE_ENABLED.
+    '''
+    app.config.setdefault("RESPONSE_CACHE_ENABLED", True)
+    app.config.setdefault("RESPONSE_CACHE_SIZE", 1024)
+    app.config.setdefault("RESPONSE_CACHE_TTL", 60)
+    app.config.setdefault("RESPONSE_CACHE_BACKEND", None)
+
+    cache = None
+    if app.config["RESPONSE_CACHE_ENABLED"]:
+        backend = app.config["RESPONSE_CACHE_BACKEND"]
+        if backend is None:
+            backend = LRUCache(app.config["RESPONSE_CACHE_SIZE"], app.config["RESPONSE_CACHE_TTL"])
+        cache = ResponseCache(backend)
+    app.extensions["response_cache"] = cache
+    app.extensions["genre_cache"] = GenreCache()
+
+def get_cache():
+    return current_app.extensions.get("response_cache")
+
+def get_genre_cache():
+    return current_app.extensions["genre_cache"]
+
+def get_genre_id(name):
+    '''
+    Get the id of the genre with given name, or None if there is no such
+    genre
+    '''
+    return get_genre_cache().get_id(name)
+
+def get_genre_name(genre_id):
+    '''
+    Get the name of the genre with given id, or None for no genre
+    '''
+    return get_genre_cache().get_name(genre_id)
+
+def invalidate(*paths):
+    '''
+    Drop cached responses of given URL paths, for all query strings
+    '''
+    cache = get_cache()
+    if cache is not None:
+        for path in paths:
+            cache.invalidate(path)
+
+def cached(func):
+    '''
+    Decorator for collection GET handlers that stores successful responses in
+    the response cache. Cached entries remember the ETag of the response, so
+    when used together with conditional an entry is only served while the
+    underlying tables haven't changed, even if the change was made by another
+    process that couldn't invalidate this process' cache. Compressed variants
+    of the body are stored in the entry as they are needed, so a hit is
+    never compressed again.
+    '''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        cache = get_cache()
+        if cache is None:
+            return func(*args, **kwargs)
+
+        path = request.script_root + request.path
+        query = request.query_string.decode("latin-1")
+        etag = g.get("etag")
+        entry = cache.get(path, query, etag)
+        if entry is not None:
+            body = entry["body"]
+            encoding = compression.negotiate(len(body))
+            if encoding is not None:
+                variants = entry.setdefault("variants", {})
+                if encoding not in variants:
+                    variants[encoding] = compression.compress(body, encoding)
+                    cache.set(path, query, entry)
+                body = variants[encoding]
+            response = Response(body, 200, mimetype=entry["mimetype"])
+            if encoding is not None:
+                compression.set_encoding(response, encoding)
+            response.headers["X-Cache"] = "HIT"
+            return response
+
+        response = func(*args, **kwargs)
+        if response.status_code == 200 and not response.is_streamed:
+            body = response.get_data()
+            variants = {}
+            encoding = compression.negotiate(len(body))
+            if encoding is not None:
+                variants[encoding] = compression.compress(body, encoding)
+                response.set_data(variants[encoding])
+                compression.set_encoding(response, encoding)
+            cache.set(path, query, {
+                "etag": etag,
+                "body": body,
+                "mimetype": response.mimetype,
+                "variants": variants,
+            })
+            response.headers["X-Cache"] = "MISS"
+        return response
+    return wrapper
+
+def invalidate_movie_listings(*genres):
+    '''
+    Drop cached movie collections that contain movies of given genres
+    '''
+    invalidate(build_url("api.moviecollection"), *[
+        build_url("api.moviesbygenrecollection", genre=genre) for genre in genres if genre is not None
+    ])
+
+def invalidate_series_listings(*genres):
+    '''
+    Drop cached series collections that contain series of given genres
+    '''
+    invalidate(build_url("api.seriescollection"), *[
+        build_url("api.seriesbygenrecollection", genre=genre) for genre in genres if genre is not None
+    ])
@@ -0,0 +1,136 @@
+import gzip
+import zlib
+from flask import current_app, request
+from movietracker.constants import *
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def get_encodings():
+    '''
+    Content codings the app can produce, in order of preference
+    '''
+    if brotli is not None:
+        return ["br", "gzip"]
+    return ["gzip"]
+
+def negotiate(size=None):
+    '''
+    Choose the content coding for a response of the current request from its
+    Accept-Encoding header. Returns None if compression is disabled, the
+    client doesn't accept any of the supported codings or the size of the
+    body is known and below COMPRESSION_MIN_SIZE.
+    '''
+    config = current_app.config
+    if not config.get("COMPRESSION_ENABLED"):
+        return None
+    if size is not None and size < config["COMPRESSION_MIN_SIZE"]:
+        return None
+    encoding = request.accept_encodings.best_match(get_encodings())
+    if encoding is None or request.accept_encodings[encoding] == 0:
+        return None
+    return encoding
+
+def compress(data, encoding):
+    '''
+    Compress a complete body with given content coding
+    '''
+    config = current_app.config
+    if encoding == "br":
+        return brotli.compress(data, quality=config["COMPRESSION_BROTLI_QUALITY"])
+    # mtime is fixed so that the same body always compresses the same way
+    return gzip.compress(data, compresslevel=config["COMPRESSION_LEVEL"], mtime=0)
+
+def _compressor(encoding):
+    config = current_app.config
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=config["COMPRESSION_BROTLI_QUALITY"])
+        return compressor.process, compressor.flush, compressor.finish
+    # wbits 31 writes a gzip header and trailer
+    compressor = zlib.compressobj(config["COMPRESSION_LEVEL"], zlib.DEFLATED, 31)
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+class CompressedStream(object):
+    """
+    Iterable that compresses the chunks of a streamed response body as they
+    are produced. Every chunk is flushed through the compressor so that the
+    client receives data as soon as it's available. Closing the stream
+    closes the wrapped iterable too, even if iteration never started.
+    """
+
+    def __init__(self, chunks, encoding, charset="utf-8"):
+        self.chunks = chunks
+        self.charset = charset
+        # created here because the app context may be gone during iteration
+        self._compressor = _compressor(encoding)
+
+    def __iter__(self):
+        process, flush, finish = self._compressor
+        for chunk in self.chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(self.charset)
+            data = process(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+
+    def close(self):
+        if hasattr(self.chunks, "close"):
+            self.chunks.close()
+
+def set_encoding(response, encoding):
+    '''
+    Mark a response as having a body compressed with given content coding.
+    A strong ETag is made weak because it identifies the uncompressed body.
+    '''
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+
+def _is_compressible(response):
+    return response.mimetype in current_app.config["COMPRESSION_MIMETYPES"]
+
+def _compress_response(response):
+    if not _is_compressible(response):
+        return response
+    response.vary.add("Accept-Encoding")
+
+    if "Content-Encoding" in response.headers:
+        # already compressed, e.g. a cached variant
+        set_encoding(response, response.headers["Content-Encoding"])
+        return response
+    if response.status_code != 200 or response.direct_passthrough:
+        return response
+
+    if response.is_streamed:
+        encoding = negotiate()
+        if encoding is not None:
+            response.response = CompressedStream(response.response, encoding)
+            response.headers.pop("Content-Length", None)
+            set_encoding(response, encoding)
+        return response
+
+    data = response.get_data()
+    encoding = negotiate(len(data))
+    if encoding is not None:
+        response.set_data(compress(data, encoding))
+        set_encoding(response, encoding)
+    return response
+
+def init_app(app):
+    '''
+    Set up response compression. Responses of the types in
+    COMPRESSION_MIMETYPES are compressed with gzip, or with brotli if the
+    brotli package is installed and the client prefers it, when the body is
+    at least COMPRESSION_MIN_SIZE bytes. Streamed responses are compressed
+    on the fly regardless of their size.
+    '''
+    app.config.setdefault("COMPRESSION_ENABLED", True)
+    app.config.setdefault("COMPRESSION_MIN_SIZE", 1024)
+    app.config.setdefault("COMPRESSION_LEVEL", 6)
+    app.config.setdefault("COMPRESSION_BROTLI_QUALITY", 5)
+    app.config.setdefault("COMPRESSION_MIMETYPES", [MASON, "application/json", "text/plain"])
+    app.after_request(_compress_response)
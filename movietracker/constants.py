@@ -1,6 +1,14 @@
 MASON = "application/vnd.mason+json"
+MERGE_PATCH = "application/merge-patch+json"
 LINK_RELATIONS_URL = "/movie-tracker/link-relations/"
 MOVIE_PROFILE = "/profiles/movie/"
 SERIES_PROFILE = "/profiles/series/"
 GENRE_PROFILE = "/profiles/genre/"
-ERROR_PROFILE = "/profiles/error/"
\ No newline at end of file
+ERROR_PROFILE = "/profiles/error/"
+DATE_PATTERN = "^[0-9]{4}-[01][0-9]-[0-3][0-9]$"
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+EXPORT_BATCH_SIZE = 1000
+IMPORT_CHUNK_SIZE = 5000
+BATCH_CHUNK_SIZE = 500
@@ -0,0 +1,149 @@
+import time
+import random
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+
+READ_METHODS = ("GET", "HEAD")
+READ_YOUR_WRITES_COOKIE = "mt_primary"
+
+def _is_sqlite(uri):
+    return make_url(uri).get_backend_name() == "sqlite"
+
+def _set_pool_options(config, url, options):
+    if not _is_sqlite(url):
+        options.setdefault("pool_size", config["DATABASE_POOL_SIZE"])
+        options.setdefault("max_overflow", config["DATABASE_MAX_OVERFLOW"])
+        options.setdefault("pool_recycle", config["DATABASE_POOL_RECYCLE"])
+        options.setdefault("pool_pre_ping", config["DATABASE_POOL_PRE_PING"])
+
+class RoutingSession(Session):
+    """
+    Session that binds all statements of read requests to the read replica
+    chosen for the request, see init_app. Flushes, and everything outside
+    read requests, use the primary database.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing:
+            replica = get_replica()
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def get_replica():
+    '''
+    Get the engine of the read replica used by the current request, or None
+    if the request uses the primary database
+    '''
+    if has_request_context():
+        return g.get("db_replica")
+    return None
+
+def configure_engine(app):
+    '''
+    Fill in SQLALCHEMY_ENGINE_OPTIONS from the DATABASE_* settings before the
+    engine is created. The pool settings only apply to server databases,
+    SQLite keeps the pool SQLAlchemy picks for it. The same applies to the
+    read replicas in DATABASE_REPLICAS, which are given as URIs or as dicts
+    of engine options with the URI as "url". Options set directly in
+    SQLALCHEMY_ENGINE_OPTIONS or in a replica's options take precedence.
+    '''
+    app.config.setdefault("DATABASE_POOL_SIZE", 10)
+    app.config.setdefault("DATABASE_MAX_OVERFLOW", 20)
+    app.config.setdefault("DATABASE_POOL_RECYCLE", 1800)
+    app.config.setdefault("DATABASE_POOL_PRE_PING", True)
+    app.config.setdefault("SQLITE_JOURNAL_MODE", "WAL")
+    app.config.setdefault("SQLITE_SYNCHRONOUS", "NORMAL")
+    app.config.setdefault("SQLITE_BUSY_TIMEOUT", 5000)
+    app.config.setdefault("SQLITE_FOREIGN_KEYS", True)
+    app.config.setdefault("SQLITE_MMAP_SIZE", 256 * 2 ** 20)
+    app.config.setdefault("DATABASE_REPLICAS", [])
+    app.config.setdefault("DATABASE_READ_YOUR_WRITES", 5)
+
+    options = app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {})
+    _set_pool_options(app.config, app.config["SQLALCHEMY_DATABASE_URI"], options)
+
+    replicas = app.config["DATABASE_REPLICAS"]
+    for i, replica in enumerate(replicas):
+        if isinstance(replica, str):
+            replica = replicas[i] = {"url": replica}
+        _set_pool_options(app.config, replica["url"], replica)
+
+def get_sqlite_pragmas(config):
+    '''
+    Get the pragmas to run on every new SQLite connection as a list of
+    (name, value) tuples. Settings that are None are left to SQLite's
+    defaults.
+    '''
+    pragmas = [
+        ("journal_mode", config["SQLITE_JOURNAL_MODE"]),
+        ("synchronous", config["SQLITE_SYNCHRONOUS"]),
+        ("busy_timeout", config["SQLITE_BUSY_TIMEOUT"]),
+        ("foreign_keys", None if config["SQLITE_FOREIGN_KEYS"] is None else
+            "ON" if config["SQLITE_FOREIGN_KEYS"] else "OFF"),
+        ("mmap_size", config["SQLITE_MMAP_SIZE"]),
+    ]
+    return [(name, value) for name, value in pragmas if value is not None]
+
+def _wrote_recently():
+    try:
+        return float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+def _route_request():
+    if request.method in READ_METHODS and not _wrote_recently():
+        g.db_replica = random.choice(current_app.extensions["db_replicas"])
+
+def _remember_write(response):
+    window = current_app.config["DATABASE_READ_YOUR_WRITES"]
+    if window and request.method not in READ_METHODS and response.status_code < 400:
+        response.set_cookie(
+            READ_YOUR_WRITES_COOKIE,
+            "{:.3f}".format(time.time() + window),
+            max_age=window,
+            path=request.script_root + "/api/",
+            httponly=True
+        )
+    return response
+
+def init_app(app, db):
+    '''
+    Set up the pragmas of SQLite engines of the app and read replica routing.
+    Must be called after db.init_app. By default connections use WAL
+    journaling so that readers don't block on a writer, synchronous=NORMAL
+    which is safe with WAL, a 5 second busy timeout, enforced foreign keys
+    and 256 MB of memory mapped I/O.
+
+    DATABASE_REPLICAS lists read replicas of the primary database. GET
+    requests are then served from a randomly chosen replica, other requests
+    from the primary. The replicas aren't binds of db, so db.create_all and
+    the CLI commands never touch them. After a successful write the client
+    gets a cookie that sends its reads to the primary for
+    DATABASE_READ_YOUR_WRITES seconds, so it sees its own changes even if
+    the replicas lag behind. Set it to 0 to turn this off.
+    '''
+    replicas = [
+        create_engine(**options) for options in app.config["DATABASE_REPLICAS"]
+    ]
+    app.extensions["db_replicas"] = replicas
+    if replicas:
+        app.before_request(_route_request)
+        app.after_request(_remember_write)
+
+    pragmas = get_sqlite_pragmas(app.config)
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute("PRAGMA {}={}".format(name, value))
+        cursor.close()
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines + replicas:
+        if engine.dialect.name == "sqlite":
+            event.listen(engine, "connect", set_pragmas)
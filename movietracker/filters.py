@@ -0,0 +1,171 @@
+import re
+from datetime import date
+from flask import request
+from sqlalchemy import select
+from movietracker.constants import DATE_PATTERN
+from movietracker.models import Actor, Genre, Series, get_actor_links
+from movietracker.serializers import GENRE_FIELDS, MOVIE_FIELDS, SERIES_FIELDS
+
+_date_pattern = re.compile(DATE_PATTERN)
+
+# query parameters handled by filter_query
+FILTER_PARAMETERS = ["min_score", "max_score", "released_after", "released_before", "actor"]
+
+_filter_schemas = {}
+
+def _number(name, value):
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError("Parameter '{}' must be a number".format(name))
+
+def _date(name, value):
+    if _date_pattern.match(value):
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            pass
+    raise ValueError("Parameter '{}' must be a date in format YYYY-MM-DD".format(name))
+
+def _like(value):
+    # escape LIKE wildcards so that the value is matched literally
+    value = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return "%" + value + "%"
+
+def get_sort_fields(model):
+    '''
+    Names of the attributes a collection of the model can be sorted by
+    '''
+    fields = ["title", "release_date", "score"]
+    if model is Series:
+        fields.append("seasons")
+    return fields
+
+def get_item_fields(model):
+    '''
+    Names of the fields of collection items of the model
+    '''
+    if model is Genre:
+        return GENRE_FIELDS
+    if model is Series:
+        return SERIES_FIELDS
+    return MOVIE_FIELDS
+
+def get_fieldset(model):
+    '''
+    Parse the fields and controls query parameters of the current request.
+    Returns the names of the item fields to include and whether items get
+    controls. Raises ValueError on invalid parameters.
+    '''
+    fields = get_item_fields(model)
+    if "fields" in request.args:
+        fields = [field for field in request.args["fields"].split(",") if field]
+        for field in fields:
+            if field not in get_item_fields(model):
+                raise ValueError("Unknown field '{}'".format(field))
+        if not fields:
+            raise ValueError("Parameter 'fields' must name at least one field")
+
+    controls = request.args.get("controls", "all")
+    if controls not in ("all", "none"):
+        raise ValueError("Parameter 'controls' must be 'all' or 'none'")
+    return fields, controls == "all"
+
+def get_filter_schema(model):
+    '''
+    Schema of the filtering and sorting query parameters of a movie or series
+    collection, used in the Mason href template control. Built once per model.
+    '''
+    if model not in _filter_schemas:
+        _filter_schemas[model] = _build_filter_schema(model)
+    return _filter_schemas[model]
+
+def _build_filter_schema(model):
+    schema = {
+        "type": "object",
+        "properties": {}
+    }
+    props = schema["properties"]
+    props["min_score"] = {
+        "description": "Smallest score to include",
+        "type": "number"
+    }
+    props["max_score"] = {
+        "description": "Largest score to include",
+        "type": "number"
+    }
+    props["released_after"] = {
+        "description": "Earliest release date to include",
+        "type": "string",
+        "pattern": DATE_PATTERN
+    }
+    props["released_before"] = {
+        "description": "Latest release date to include",
+        "type": "string",
+        "pattern": DATE_PATTERN
+    }
+    props["actor"] = {
+        "description": "Part of an actor's name",
+        "type": "string"
+    }
+    props["sort"] = {
+        "description": "Comma separated list of fields to sort by, prefix "
+                       "with - for descending order: " + ", ".join(get_sort_fields(model)),
+        "type": "string"
+    }
+    props["fields"] = {
+        "description": "Comma separated list of item fields to include: " + ", ".join(get_item_fields(model)),
+        "type": "string"
+    }
+    props["controls"] = {
+        "description": "Set to none to leave out the controls of items",
+        "type": "string",
+        "enum": ["all", "none"]
+    }
+    props["limit"] = {
+        "description": "Number of items per page",
+        "type": "integer"
+    }
+    return schema
+
+def filter_query(model, query, args=None):
+    '''
+    Add WHERE clauses for the filter query parameters of the current request,
+    or for the parameters in args if given. Raises ValueError on invalid
+    parameters.
+    '''
+    if args is None:
+        args = request.args
+    if "min_score" in args:
+        query = query.filter(model.score >= _number("min_score", args["min_score"]))
+    if "max_score" in args:
+        query = query.filter(model.score <= _number("max_score", args["max_score"]))
+    if "released_after" in args:
+        query = query.filter(model.release_date >= _date("released_after", args["released_after"]))
+    if "released_before" in args:
+        query = query.filter(model.release_date <= _date("released_before", args["released_before"]))
+    if "actor" in args:
+        # the names are matched in the actor table, items are then found
+        # through the index of the link table
+        links, item_id = get_actor_links(model)
+        actors = select(Actor.id).where(Actor.name.like(_like(args["actor"]), escape="\\"))
+        query = query.filter(model.id.in_(select(item_id).where(links.c.actor_id.in_(actors))))
+    return query
+
+def get_sort_keys(model):
+    '''
+    Parse the sort query parameter of the current request into keys for
+    Page. The id is always added last to make the order total. Raises
+    ValueError on invalid parameters.
+    '''
+    keys = []
+    for field in request.args.get("sort", "").split(","):
+        if not field:
+            continue
+        descending = field.startswith("-")
+        name = field.lstrip("-")
+        if name not in get_sort_fields(model):
+            raise ValueError("Cannot sort by '{}'".format(name))
+        keys.append((getattr(model, name), descending))
+    keys.append((model.id, False))
+    return keys
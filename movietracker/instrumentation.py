@@ -0,0 +1,201 @@
+import time
+import threading
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# upper bounds of the request duration histogram in seconds
+DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+
+class RequestTimings(object):
+    """
+    Timings of the request being served, stored in g while instrumentation is
+    enabled. Times are in seconds.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+
+
+class Metrics(object):
+    """
+    Aggregated request metrics of the app, grouped by endpoint and method.
+    Rendered in Prometheus text exposition format by render.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._series = {}
+
+    def record(self, endpoint, method, status, timings, duration, size):
+        with self._lock:
+            key = (endpoint, method, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+            key = (endpoint, method)
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    "buckets": [0] * len(DURATION_BUCKETS),
+                    "count": 0,
+                    "duration": 0.0,
+                    "sql_count": 0,
+                    "sql_time": 0.0,
+                    "serialize_time": 0.0,
+                    "response_bytes": 0,
+                }
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    series["buckets"][i] += 1
+            series["count"] += 1
+            series["duration"] += duration
+            series["sql_count"] += timings.sql_count
+            series["sql_time"] += timings.sql_time
+            series["serialize_time"] += timings.serialize_time
+            series["response_bytes"] += size or 0
+
+    def render(self, cache=None):
+        '''
+        Render all metrics, and the statistics of the response cache if one
+        is given, in Prometheus text format
+        '''
+        lines = []
+
+        def add(name, kind, help, samples):
+            lines.append("# HELP {} {}".format(name, help))
+            lines.append("# TYPE {} {}".format(name, kind))
+            for labels, value in samples:
+                lines.append("{}{} {}".format(name, _labels(labels), _number(value)))
+
+        with self._lock:
+            requests = sorted(self._requests.items())
+            series = sorted(self._series.items())
+
+        add("movietracker_requests_total", "counter", "Number of requests served", [
+            ({"endpoint": endpoint, "method": method, "status": status}, count)
+            for (endpoint, method, status), count in requests
+        ])
+
+        samples = []
+        for (endpoint, method), values in series:
+            labels = {"endpoint": endpoint, "method": method}
+            for bound, count in zip(DURATION_BUCKETS, values["buckets"]):
+                samples.append((dict(labels, le=_number(bound)), count))
+            samples.append((dict(labels, le="+Inf"), values["count"]))
+        lines.append("# HELP movietracker_request_duration_seconds Time spent serving requests")
+        lines.append("# TYPE movietracker_request_duration_seconds histogram")
+        for labels, value in samples:
+            lines.append("movietracker_request_duration_seconds_bucket{} {}".format(_labels(labels), value))
+        for (endpoint, method), values in series:
+            labels = _labels({"endpoint": endpoint, "method": method})
+            lines.append("movietracker_request_duration_seconds_sum{} {}".format(labels, _number(values["duration"])))
+            lines.append("movietracker_request_duration_seconds_count{} {}".format(labels, values["count"]))
+
+        for name, key, help in [
+            ("movietracker_sql_statements_total", "sql_count", "Number of SQL statements executed"),
+            ("movietracker_sql_duration_seconds_total", "sql_time", "Time spent executing SQL statements"),
+            ("movietracker_serialization_duration_seconds_total", "serialize_time", "Time spent encoding response bodies"),
+            ("movietracker_response_bytes_total", "response_bytes", "Size of response bodies"),
+        ]:
+            add(name, "counter", help, [
+                ({"endpoint": endpoint, "method": method}, values[key])
+                for (endpoint, method), values in series
+            ])
+
+        if cache is not None:
+            for key, value in sorted(cache.stats().items()):
+                add("movietracker_response_cache_{}_total".format(key), "counter",
+                    "Response cache {}".format(key), [({}, value)])
+
+        return "\n".join(lines) + "\n"
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in labels.items()
+    ) + "}"
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _current_timings():
+    if has_request_context():
+        return g.get("request_timings")
+    return None
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_timings() is not None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timings = _current_timings()
+    if timings is not None and conn.info.get("query_start"):
+        timings.sql_count += 1
+        timings.sql_time += time.perf_counter() - conn.info["query_start"].pop()
+
+@contextmanager
+def timed_serialization():
+    '''
+    Context manager that adds the time spent inside it to the serialization
+    time of the current request
+    '''
+    timings = _current_timings()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.serialize_time += time.perf_counter() - start
+
+def _start_request():
+    g.request_timings = RequestTimings()
+
+def _finish_request(response):
+    timings = g.pop("request_timings", None)
+    if timings is None:
+        return response
+
+    duration = time.perf_counter() - timings.start
+    # streamed responses have no known size when the handler returns
+    size = response.calculate_content_length()
+    get_metrics().record(
+        request.endpoint or "none", request.method, response.status_code,
+        timings, duration, size
+    )
+    response.headers["Server-Timing"] = ", ".join([
+        'db;dur={:.3f};desc="{} queries"'.format(timings.sql_time * 1000, timings.sql_count),
+        "serialize;dur={:.3f}".format(timings.serialize_time * 1000),
+        "total;dur={:.3f}".format(duration * 1000),
+    ])
+    return response
+
+def init_app(app):
+    '''
+    Set up request instrumentation if INSTRUMENTATION_ENABLED is set. Every
+    response then gets a Server-Timing header with the time spent in SQL,
+    in serialization and in total, and the aggregated metrics are available
+    from get_metrics.
+    '''
+    app.config.setdefault("INSTRUMENTATION_ENABLED", False)
+
+    metrics = None
+    if app.config["INSTRUMENTATION_ENABLED"]:
+        metrics = Metrics()
+        app.before_request(_start_request)
+        app.after_request(_finish_request)
+    app.extensions["metrics"] = metrics
+
+def get_metrics():
+    return current_app.extensions.get("metrics")
@@ -1,7 +1,63 @@
 import click
+from datetime import date
+from sqlalchemy import event, exists, inspect, literal, null, select, union_all
+from sqlalchemy.types import UserDefinedType
+from sqlalchemy.orm import Session, attributes
+from flask import g, has_app_context
 from flask.cli import with_appcontext
 from movietracker import db
+from movietracker.constants import DATE_PATTERN
 from movietracker.utils import get_uuid
+from movietracker.serializers import MOVIE_FIELDS, SERIES_FIELDS
+
+# rows per statement when actors are looked up or linked in bulk
+ACTOR_CHUNK_SIZE = 500
+
+
+class _SQLiteDate(UserDefinedType):
+    # DATE column that stores and returns the YYYY-MM-DD text as is
+    cache_ok = True
+
+    def get_col_spec(self, **kw):
+        return "DATE"
+
+
+class ISODate(db.TypeDecorator):
+    """
+    Date column that takes and returns dates as YYYY-MM-DD strings like the
+    API does. Values that aren't valid dates are rejected with ValueError.
+    SQLite has no date type and dates are stored there as YYYY-MM-DD text,
+    so on SQLite the values are passed through without converting them to
+    date objects and back.
+    """
+
+    impl = db.Date
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "sqlite":
+            return _SQLiteDate()
+        return dialect.type_descriptor(db.Date())
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, str):
+            value = date.fromisoformat(value)
+        elif value is not None and not isinstance(value, date):
+            raise ValueError("Date must be a YYYY-MM-DD string, not {!r}".format(value))
+        if value is not None and dialect.name == "sqlite":
+            return value.isoformat()
+        return value
+
+    def process_result_value(self, value, dialect):
+        if isinstance(value, date):
+            return value.isoformat()
+        return value
+
+    def result_processor(self, dialect, coltype):
+        if dialect.name == "sqlite":
+            return None
+        return super().result_processor(dialect, coltype)
+
 
 class Genre(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -11,13 +67,51 @@ class Genre(db.Model):
     series = db.relationship("Series", back_populates="genre")
 
 
+class Actor(db.Model):
+    """
+    Actor named in the actors of movies and series. The actors string of an
+    item is kept as it was given, the links to actors are derived from it
+    and are used to find items by actor.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False, unique=True)
+
+
+# the second index finds the items of an actor
+movie_actor = db.Table(
+    "movie_actor",
+    db.Column("movie_id", db.Integer, db.ForeignKey("movie.id", ondelete="CASCADE"), primary_key=True),
+    db.Column("actor_id", db.Integer, db.ForeignKey("actor.id", ondelete="CASCADE"), primary_key=True),
+    db.Index("ix_movie_actor_actor_id_movie_id", "actor_id", "movie_id"),
+)
+
+series_actor = db.Table(
+    "series_actor",
+    db.Column("series_id", db.Integer, db.ForeignKey("series.id", ondelete="CASCADE"), primary_key=True),
+    db.Column("actor_id", db.Integer, db.ForeignKey("actor.id", ondelete="CASCADE"), primary_key=True),
+    db.Index("ix_series_actor_actor_id_series_id", "actor_id", "series_id"),
+)
+
+
 class Movie(db.Model):
+    # genre_id leads the composite indexes so that genre scoped listings can
+    # both filter and sort using the index
+    __table_args__ = (
+        db.Index("ix_movie_genre_id_id", "genre_id", "id"),
+        db.Index("ix_movie_genre_id_release_date", "genre_id", "release_date"),
+        db.Index("ix_movie_genre_id_score", "genre_id", "score"),
+        db.Index("ix_movie_title", "title"),
+        db.Index("ix_movie_release_date", "release_date"),
+        db.Index("ix_movie_score", "score"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     genre_id = db.Column(db.Integer, db.ForeignKey("genre.id", ondelete="CASCADE"))
     title = db.Column(db.String(64), nullable=False)
     uuid = db.Column(db.String(64), nullable=False, unique=True)
     actors = db.Column(db.String(64), nullable=True)
-    release_date = db.Column(db.String(64), nullable=False)
+    release_date = db.Column(ISODate, nullable=False)
     score = db.Column(db.Float, nullable=True)
 
     genre = db.relationship("Genre", back_populates="movies")
@@ -42,7 +136,7 @@ class Movie(db.Model):
         props["release_date"] =  {
             "description": "Release date of the movie",
             "type": "string",
-            "pattern": "^[0-9]{4}-[01][0-9]-[0-3][0-9]$"
+            "pattern": DATE_PATTERN
         }
         props["score"] = {
             "description": "IMDb score of the movie",
@@ -70,7 +164,7 @@ class Movie(db.Model):
         props["release_date"] =  {
             "description": "Release date of the movie",
             "type": "string",
-            "pattern": "^[0-9]{4}-[01][0-9]-[0-3][0-9]$"
+            "pattern": DATE_PATTERN
         }
         props["score"] = {
             "description": "IMDb score of the movie",
@@ -82,14 +176,30 @@ class Movie(db.Model):
         }
         return schema
 
+    @staticmethod
+    def get_schema_patch():
+        # any subset of the PUT properties
+        schema = Movie.get_schema_put()
+        del schema["required"]
+        return schema
+
 
 class Series(db.Model):
+    __table_args__ = (
+        db.Index("ix_series_genre_id_id", "genre_id", "id"),
+        db.Index("ix_series_genre_id_release_date", "genre_id", "release_date"),
+        db.Index("ix_series_genre_id_score", "genre_id", "score"),
+        db.Index("ix_series_title", "title"),
+        db.Index("ix_series_release_date", "release_date"),
+        db.Index("ix_series_score", "score"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     genre_id = db.Column(db.Integer, db.ForeignKey("genre.id", ondelete="CASCADE"))
     title = db.Column(db.String(64), nullable=False)
     uuid = db.Column(db.String(64), nullable=False, unique=True)
     actors = db.Column(db.String(64), nullable=True)
-    release_date = db.Column(db.String(64), nullable=False)
+    release_date = db.Column(ISODate, nullable=False)
     score = db.Column(db.Float, nullable=True)
     seasons = db.Column(db.Integer, default=1, nullable=False)
 
@@ -115,7 +225,7 @@ class Series(db.Model):
         props["release_date"] =  {
             "description": "Release date of the series",
             "type": "string",
-            "pattern": "^[0-9]{4}-[01][0-9]-[0-3][0-9]$"
+            "pattern": DATE_PATTERN
         }
         props["score"] = {
             "description": "IMDb score of the series",
@@ -147,7 +257,7 @@ class Series(db.Model):
         props["release_date"] =  {
             "description": "Release date of the series",
             "type": "string",
-            "pattern": "^[0-9]{4}-[01][0-9]-[0-3][0-9]$"
+            "pattern": DATE_PATTERN
         }
         props["score"] = {
             "description": "IMDb score of the series",
@@ -163,19 +273,291 @@ class Series(db.Model):
         }
         return schema
 
+    @staticmethod
+    def get_schema_patch():
+        # any subset of the PUT properties
+        schema = Series.get_schema_put()
+        del schema["required"]
+        return schema
+
+
+def listing_query(model, fields=None, extra=()):
+    '''
+    Query for collection listings of movies or series that selects only the
+    columns of given item fields (all fields of the serializer by default),
+    in the order of the serializer's fields, followed by the extra columns
+    that are not among them. The genre name is joined in as "genre" only if
+    it's needed. Returns plain rows instead of ORM objects, so no instances
+    are constructed or tracked by the session.
+    '''
+    all_fields = SERIES_FIELDS if model is Series else MOVIE_FIELDS
+    if fields is None:
+        fields = all_fields
+    columns = []
+    for field in all_fields:
+        if field in fields:
+            columns.append(Genre.name.label("genre") if field == "genre" else getattr(model, field))
+    names = [column.key for column in columns]
+    for column in extra:
+        if column.key not in names:
+            columns.append(column)
+            names.append(column.key)
+
+    query = db.session.query(*columns).select_from(model)
+    if "genre" in fields:
+        query = query.outerjoin(Genre, model.genre_id == Genre.id)
+    return query
+
+
+_actor_links = {Movie: movie_actor, Series: series_actor}
+
+def get_actor_links(model):
+    '''
+    Get the table that links actors to movies or series, and its column of
+    movie or series ids
+    '''
+    table = _actor_links[model]
+    return table, table.c[model.__tablename__ + "_id"]
+
+def parse_actors(actors):
+    '''
+    Split an actors string into a list of unique actor names. Names are
+    separated by commas.
+    '''
+    if not actors:
+        return []
+    names = (name.strip() for name in actors.split(","))
+    return list(dict.fromkeys(name for name in names if name))
+
+def _chunks(values, size=ACTOR_CHUNK_SIZE):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+def _get_actor_ids(connection, names):
+    '''
+    Get a dict of given actor names to ids, adding the actors that don't
+    exist yet
+    '''
+    table = Actor.__table__
+    names = list(names)
+    ids = {}
+    for chunk in _chunks(names):
+        ids.update(connection.execute(select(table.c.name, table.c.id).where(table.c.name.in_(chunk))).all())
+    missing = [name for name in names if name not in ids]
+    if missing:
+        connection.execute(table.insert(), [{"name": name} for name in missing])
+        for chunk in _chunks(missing):
+            ids.update(connection.execute(select(table.c.name, table.c.id).where(table.c.name.in_(chunk))).all())
+    return ids
+
+def link_actors(connection, model, items):
+    '''
+    Replace the actor links of movies or series with the actors in their
+    actors strings. items is an iterable of (id, actors) pairs. Must be
+    called for new items too, even without actors, so that links left by a
+    deleted item whose id was reused are removed. ORM flushes link actors
+    automatically, Core statements that insert items or set actors must call
+    this themselves.
+    '''
+    table, item_id = get_actor_links(model)
+    items = [(id_, parse_actors(actors)) for id_, actors in items]
+    if not items:
+        return
+    actor_ids = _get_actor_ids(connection, {name for _, names in items for name in names})
+    unlinked = set()
+    for chunk in _chunks([id_ for id_, _ in items]):
+        unlinked.update(connection.scalars(select(table.c.actor_id).where(item_id.in_(chunk))))
+        connection.execute(table.delete().where(item_id.in_(chunk)))
+    links = [
+        {item_id.key: id_, "actor_id": actor_ids[name]}
+        for id_, names in items for name in names
+    ]
+    if links:
+        connection.execute(table.insert(), links)
+    _delete_unlinked_actors(connection, unlinked - set(actor_ids.values()))
+
+def _delete_unlinked_actors(connection, actor_ids):
+    '''
+    Delete those of given actors that no movie or series is linked to
+    '''
+    table = Actor.__table__
+    for chunk in _chunks(sorted(actor_ids)):
+        statement = table.delete().where(table.c.id.in_(chunk))
+        for links in _actor_links.values():
+            statement = statement.where(~exists().where(links.c.actor_id == table.c.id))
+        connection.execute(statement)
+
+def filmography(actor_id):
+    '''
+    Subquery of the movies and series of an actor. Rows have the kind of the
+    item ("movie" or "series"), its id and uuid, the fields of the item and
+    genre_id, with seasons null for movies. The items are found through the
+    index of the actor links, so the cost only depends on the number of
+    items of the actor.
+    '''
+    selects = []
+    for model in _actor_links:
+        links, item_id = get_actor_links(model)
+        table = model.__table__
+        seasons = table.c.seasons if model is Series else null()
+        selects.append(
+            select(
+                literal(model.__tablename__).label("kind"), table.c.id, table.c.uuid,
+                table.c.title, table.c.actors, table.c.release_date, table.c.score,
+                seasons.label("seasons"), table.c.genre_id
+            )
+            .join_from(links, table, item_id == table.c.id)
+            .where(links.c.actor_id == actor_id)
+        )
+    return union_all(*selects).subquery("filmography")
+
+def link_unlinked_actors(connection):
+    '''
+    Link actors of movies and series that have actors but no links, e.g.
+    items created before actors were linked
+    '''
+    for model in _actor_links:
+        _, item_id = get_actor_links(model)
+        items = connection.execute(
+            select(model.__table__.c.id, model.__table__.c.actors)
+            .where(model.__table__.c.actors.isnot(None))
+            .where(model.__table__.c.id.notin_(select(item_id)))
+        ).all()
+        link_actors(connection, model, items)
+
+
+class TableVersion(db.Model):
+    """
+    Version counter of a table that is incremented whenever rows of the table
+    change. Lets HTTP caching detect changes without reading the rows.
+    """
+
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+def init_table_versions(connection):
+    '''
+    Add version counters for tables that don't have one yet
+    '''
+    table = TableVersion.__table__
+    existing = {row[0] for row in connection.execute(table.select())}
+    missing = [
+        {"name": t.name, "version": 0}
+        for t in db.metadata.sorted_tables
+        if t is not table and t.name not in existing
+    ]
+    if missing:
+        connection.execute(table.insert(), missing)
+
+def bump_table_versions(connection, names):
+    '''
+    Increment version counters of given tables. Must be called in the same
+    transaction as the changes so that a rollback reverts both.
+    '''
+    table = TableVersion.__table__
+    connection.execute(
+        table.update()
+        .where(table.c.name.in_(sorted(names)))
+        .values(version=table.c.version + 1)
+    )
+    if has_app_context():
+        g.pop("table_versions", None)
+
+@event.listens_for(TableVersion.__table__, "after_create")
+def _create_table_versions(target, connection, **kw):
+    init_table_versions(connection)
+
+@event.listens_for(Session, "after_flush")
+def _bump_flushed_table_versions(session, flush_context):
+    # ORM changes are tracked here, Core statements must call
+    # bump_table_versions themselves
+    changed = list(session.new) + list(session.deleted)
+    changed += [obj for obj in session.dirty if session.is_modified(obj)]
+    names = {obj.__table__.name for obj in changed} - {TableVersion.__tablename__}
+    if names:
+        bump_table_versions(session.connection(), names)
+
+@event.listens_for(Session, "after_flush")
+def _link_flushed_actors(session, flush_context):
+    # links of deleted items are removed by the foreign key cascade
+    for model in _actor_links:
+        items = [
+            (obj.id, obj.actors) for obj in session.new if isinstance(obj, model)
+        ] + [
+            (obj.id, obj.actors) for obj in session.dirty
+            if isinstance(obj, model) and attributes.get_history(obj, "actors").has_changes()
+        ]
+        if items:
+            link_actors(session.connection(), model, items)
+
 
 @click.command("init-db")
 @with_appcontext
 def init_db_command():
     db.create_all()
 
+def get_alter_date_column(dialect, table, column):
+    '''
+    Get the statement that changes a string column of given table to a DATE
+    column holding the same YYYY-MM-DD dates, or None if the dialect isn't
+    supported. SQLite needs none since it stores dates as text anyway.
+    '''
+    quote = dialect.identifier_preparer.quote
+    if dialect.name == "postgresql":
+        return "ALTER TABLE {0} ALTER COLUMN {1} TYPE DATE USING {1}::date".format(quote(table), quote(column))
+    if dialect.name in ("mysql", "mariadb"):
+        return "ALTER TABLE {} MODIFY {} DATE NOT NULL".format(quote(table), quote(column))
+    return None
+
+def _upgrade_date_columns(engine, inspector):
+    # release dates used to be stored as strings
+    if engine.dialect.name == "sqlite":
+        return
+    for model in (Movie, Series):
+        table = model.__tablename__
+        columns = {column["name"]: column["type"] for column in inspector.get_columns(table)}
+        if isinstance(columns["release_date"], db.Date):
+            continue
+        statement = get_alter_date_column(engine.dialect, table, "release_date")
+        if statement is None:
+            click.echo("Change {}.release_date to DATE by hand, {} is not supported".format(
+                table, engine.dialect.name
+            ))
+            continue
+        with engine.begin() as connection:
+            connection.exec_driver_sql(statement)
+        click.echo("Changed {}.release_date to DATE".format(table))
+
+@click.command("upgrade-db")
+@with_appcontext
+def upgrade_db_command():
+    '''
+    Bring an existing database up to date with the models by creating missing
+    tables and indexes and changing string release dates to DATE columns.
+    Existing rows are only linked to their actors if they aren't yet.
+    '''
+    db.create_all()
+    with db.engine.begin() as connection:
+        init_table_versions(connection)
+        link_unlinked_actors(connection)
+    inspector = inspect(db.engine)
+    _upgrade_date_columns(db.engine, inspector)
+    for table in db.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine)
+                click.echo("Created index {}".format(index.name))
+
 @click.command("testgen")
 @with_appcontext
 def generate_test_data():
     # add genres to test db
-    genres = ["Action", "Crime", "Romance", "Drama", "Horror", "Fantasy"]
-    for g in genres:
-        db.session.add(Genre(name=g))
+    genres = {}
+    for g in ["Action", "Crime", "Romance", "Drama", "Horror", "Fantasy"]:
+        genres[g] = Genre(name=g)
+        db.session.add(genres[g])
     db.session.commit()
 
     db.session.add(Movie(
@@ -184,14 +566,14 @@ def generate_test_data():
         actors="Robert Downey Jr.",
         release_date="2012-04-11",
         score=8.0,
-        genre=Genre.query.filter_by(name="Action").first()
+        genre=genres["Action"]
     ))
     db.session.add(Movie(
         title="Sherlock Holmes",
         uuid=get_uuid(),
         actors="Robert Downey Jr.",
         release_date="2009-12-25",
-        genre=Genre.query.filter_by(name="Crime").first()
+        genre=genres["Crime"]
     ))
 
     db.session.add(Series(
@@ -200,7 +582,7 @@ def generate_test_data():
             release_date="2008-01-20",
             score=9.5,
             seasons=5,
-            genre=Genre.query.filter_by(name="Crime").first()
+            genre=genres["Crime"]
     ))
     db.session.add(Series(
             title="Game of Thrones",
@@ -209,6 +591,6 @@ def generate_test_data():
             release_date="2011-04-17",
             score=9.5,
             seasons=8,
-            genre=Genre.query.filter_by(name="Fantasy").first()
+            genre=genres["Fantasy"]
     ))
     db.session.commit()
\ No newline at end of file
@@ -0,0 +1,176 @@
+import json
+import base64
+import binascii
+from flask import request, url_for
+from sqlalchemy import and_, false, or_
+from sqlalchemy.exc import StatementError
+from movietracker.constants import *
+
+def encode_cursor(values):
+    '''
+    Encode key values of a row into an opaque cursor string
+    '''
+    data = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor, length):
+    '''
+    Decode a cursor created with encode_cursor. Raises ValueError if the cursor
+    is malformed or doesn't contain the expected number of key values, or if
+    a value isn't a string, a number or null.
+    '''
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding).decode("utf-8"))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Cursor '{}' is not valid".format(cursor))
+    if not isinstance(values, list) or len(values) != length:
+        raise ValueError("Cursor '{}' is not valid".format(cursor))
+    for value in values:
+        # bool is a subclass of int but no key column holds booleans
+        if isinstance(value, bool) or not isinstance(value, (str, int, float, type(None))):
+            raise ValueError("Cursor '{}' is not valid".format(cursor))
+    return values
+
+# NULL is treated as the smallest value like SQLite does by default. The
+# order is made explicit with NULLS FIRST / NULLS LAST so that other
+# backends sort nullable columns the same way.
+
+def _nullable(column):
+    # columns that don't come from a table, e.g. literals selected in a
+    # subquery, don't know whether they can be NULL
+    return getattr(column, "nullable", True)
+
+def _greater(column, value):
+    if value is None:
+        return column.isnot(None)
+    return column > value
+
+def _less(column, value):
+    if value is None:
+        return false()
+    if _nullable(column):
+        return or_(column < value, column.is_(None))
+    return column < value
+
+def _equal(column, value):
+    if value is None:
+        return column.is_(None)
+    return column == value
+
+def _keyset_filter(keys, values, backwards=False):
+    '''
+    Build a WHERE clause that selects rows strictly after (or before) the row
+    with given key values in the order defined by keys. For keys (a, b) this
+    results in "a > x OR (a = x AND b > y)" which works on every backend
+    and can use composite indexes.
+    '''
+    clauses = []
+    for i, (column, descending) in enumerate(keys):
+        if descending != backwards:
+            comparison = _less(column, values[i])
+        else:
+            comparison = _greater(column, values[i])
+        equals = [_equal(keys[j][0], values[j]) for j in range(i)]
+        clauses.append(and_(*(equals + [comparison])))
+    return or_(*clauses)
+
+def _order_by(keys, backwards=False):
+    order = []
+    for column, descending in keys:
+        if descending != backwards:
+            order.append(column.desc().nullslast() if _nullable(column) else column.desc())
+        else:
+            order.append(column.asc().nullsfirst() if _nullable(column) else column.asc())
+    return order
+
+
+class Page(object):
+    """
+    One page of a keyset (cursor) paginated query. Rows are ordered by the
+    given keys, a list of (column, descending) tuples which must end with a
+    unique column so that the order is total. Instead of using OFFSET the
+    query continues from the key values of the last row on the previous page,
+    so the cost of fetching a page doesn't depend on how deep into the
+    collection it is.
+    """
+
+    def __init__(self, query, keys, limit=PAGE_SIZE, after=None, before=None):
+        self.keys = keys
+        self.limit = limit
+        backwards = before is not None
+        cursor = before if backwards else after
+
+        if cursor is not None:
+            values = decode_cursor(cursor, len(keys))
+            query = query.filter(_keyset_filter(keys, values, backwards))
+
+        try:
+            rows = query.order_by(*_order_by(keys, backwards)).limit(limit + 1).all()
+        except StatementError as e:
+            # key values of the cursor that the column types don't accept,
+            # e.g. a date that isn't valid or isn't a string
+            if cursor is None or not isinstance(e.orig, (TypeError, ValueError)):
+                raise
+            raise ValueError("Cursor '{}' is not valid".format(cursor))
+        has_more = len(rows) > limit
+        self.items = rows[:limit]
+        self.next_cursor = None
+        self.prev_cursor = None
+
+        if backwards:
+            self.items.reverse()
+            if has_more:
+                self.prev_cursor = self._cursor(self.items[0])
+            self.next_cursor = self._cursor(self.items[-1]) if self.items else before
+        else:
+            if has_more:
+                self.next_cursor = self._cursor(self.items[-1])
+            if after is not None:
+                self.prev_cursor = self._cursor(self.items[0]) if self.items else after
+
+    def _cursor(self, row):
+        return encode_cursor([getattr(row, column.key) for column, _ in self.keys])
+
+    @staticmethod
+    def from_request(query, keys):
+        '''
+        Create a page using limit, after and before query parameters of the
+        current request. Raises ValueError on invalid parameters.
+        '''
+        limit = request.args.get("limit", PAGE_SIZE)
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError("Limit must be an integer")
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError("Limit must be between 1 and {}".format(MAX_PAGE_SIZE))
+
+        after = request.args.get("after")
+        before = request.args.get("before")
+        if after is not None and before is not None:
+            raise ValueError("Only one of 'after' and 'before' can be given")
+
+        return Page(query, keys, limit, after, before)
+
+    def add_controls(self, body):
+        '''
+        Add next and prev controls to a Mason document. The links keep all
+        other query parameters of the current request.
+        '''
+        if self.next_cursor is not None:
+            body.add_control_next_page(page_url(after=self.next_cursor))
+        if self.prev_cursor is not None:
+            body.add_control_prev_page(page_url(before=self.prev_cursor))
+
+def page_url(**cursor):
+    '''
+    URL of the current resource with the current query parameters but with the
+    cursor replaced by the one given
+    '''
+    args = request.args.to_dict()
+    args.pop("after", None)
+    args.pop("before", None)
+    args.update(cursor)
+    args.update(request.view_args)
+    return url_for(request.endpoint, **args)
@@ -0,0 +1,57 @@
+from flask import request
+from flask_restful import Resource
+from movietracker import db
+from movietracker.models import Actor, Genre, Movie, Series, filmography
+from movietracker.constants import *
+from movietracker.caching import cached, conditional, get_genre_name
+from movietracker.pagination import Page
+from movietracker.utils import MovieTrackerBuilder, build_url, create_collection_response, create_error_response, url_template
+from movietracker.serializers import movie_serializer, series_serializer
+
+class ActorItem(Resource):
+
+    @conditional(Movie, Series, Genre)
+    @cached
+    def get(self, actor):
+        actor_id = db.session.query(Actor.id).filter(Actor.name == actor).scalar()
+
+        # movies and series in release order
+        items = filmography(actor_id)
+        keys = [(items.c.release_date, False), (items.c.kind, False), (items.c.id, False)]
+        try:
+            page = Page.from_request(db.session.query(items), keys)
+        except ValueError as e:
+            return create_error_response(400, "Invalid query parameter", str(e))
+
+        # actors are kept when their last item is deleted, so an actor
+        # without items is treated as one that doesn't exist
+        if not page.items and "after" not in request.args and "before" not in request.args:
+            return create_error_response(404,
+                "Actor not found",
+                "Actor with name '{}' does not exist".format(actor)
+            )
+
+        body = MovieTrackerBuilder(
+            name=actor
+        )
+        body.add_namespace("mt", LINK_RELATIONS_URL)
+        body.add_control("self", build_url("api.actoritem", actor=actor))
+        body.add_control_all_movies()
+        body.add_control_all_series()
+        page.add_controls(body)
+        movie_url = url_template("api.movieitem")
+        series_url = url_template("api.seriesitem")
+        items = []
+        for row in page.items:
+            genre = get_genre_name(row.genre_id)
+            if row.kind == Series.__tablename__:
+                items.append(series_serializer.encode(
+                    (row.title, row.actors, row.release_date, row.score, row.seasons, genre),
+                    series_url.format(series=row.uuid)
+                ))
+            else:
+                items.append(movie_serializer.encode(
+                    (row.title, row.actors, row.release_date, row.score, genre),
+                    movie_url.format(movie=row.uuid)
+                ))
+        return create_collection_response(body, items)
@@ -1,93 +1,107 @@
-import json
-from flask import Response, request, url_for
+from flask import Response, request
 from flask_restful import Resource
-from jsonschema import validate, ValidationError
+from jsonschema import ValidationError
 from movietracker import db
-from movietracker.models import Genre, Movie, Series
+from movietracker.models import Genre, Movie, Series, listing_query
 from movietracker.constants import *
-from movietracker.utils import MovieTrackerBuilder, create_error_response, get_uuid
+from movietracker.caching import cached, conditional, get_genre_id, invalidate_movie_listings, invalidate_series_listings
+from movietracker.filters import filter_query, get_fieldset, get_filter_schema, get_sort_keys
+from movietracker.pagination import Page
+from movietracker.schemas import get_schema, validate
+from movietracker.utils import MovieTrackerBuilder, build_url, create_collection_response, create_error_response, create_mason_response, get_uuid, url_template
+from movietracker.serializers import genre_serializer, movie_serializer, series_serializer
 
 class GenreCollection(Resource):
     
+    @conditional(Genre)
+    @cached
     def get(self):
+        try:
+            fields, controls = get_fieldset(Genre)
+        except ValueError as e:
+            return create_error_response(400, "Invalid query parameter", str(e))
+
         body = MovieTrackerBuilder()
         body.add_namespace("mt", LINK_RELATIONS_URL)
-        body.add_control("self", url_for("api.genrecollection"))
+        body.add_control("self", build_url("api.genrecollection"))
         body.add_control_all_movies()
         body.add_control_all_series()
-        body["items"] = []
-
-        for db_genre in Genre.query.all():
-            item = MovieTrackerBuilder(
-                name=db_genre.name
-            )
-            item.add_control("self", url_for("api.genreitem", genre=db_genre.name))
-            item.add_control("profile", GENRE_PROFILE)
-            body["items"].append(item)
-
-        return Response(json.dumps(body), 200, mimetype=MASON)
+        serializer = genre_serializer.subset(fields, controls)
+        genre_url = url_template("api.genreitem")
+        items = (
+            serializer.encode(row, genre_url.format(genre=row.name) if controls else None)
+            for row in db.session.query(Genre.name).order_by(Genre.id)
+        )
+        return create_collection_response(body, items)
 
 
 class GenreItem(Resource):
 
+    @conditional(Genre)
     def get(self, genre):
         # check that genre exists
-        db_genre = Genre.query.filter_by(name=genre).first()
-        if db_genre is None:
+        genre_id = get_genre_id(genre)
+        if genre_id is None:
             return create_error_response(404,
                 "Genre not found",
                 "Genre with name '{}' does not exist".format(genre)
             )
 
         body = MovieTrackerBuilder(
-            name=db_genre.name
+            name=genre
         )
         body.add_namespace("mt", LINK_RELATIONS_URL)
-        body.add_control("self", url_for("api.genreitem", genre=db_genre.name))
-        body.add_control("up", url_for("api.genrecollection"))
-        body.add_control_movies_by_genre(db_genre.name)
-        body.add_control_series_by_genre(db_genre.name)
+        body.add_control("self", build_url("api.genreitem", genre=genre))
+        body.add_control("up", build_url("api.genrecollection"))
+        body.add_control_movies_by_genre(genre)
+        body.add_control_series_by_genre(genre)
 
-        return Response(json.dumps(body), 200, mimetype=MASON)
+        return create_mason_response(body)
 
 
 class MoviesByGenreCollection(Resource):
 
+    @conditional(Genre, Movie)
+    @cached
     def get(self, genre):
         # check that genre exists
-        db_genre = Genre.query.filter_by(name=genre).first()
-        if db_genre is None:
+        genre_id = get_genre_id(genre)
+        if genre_id is None:
             return create_error_response(404,
                 "Genre not found",
                 "Genre with name '{}' does not exist".format(genre)
             )
-        
+
+        try:
+            fields, controls = get_fieldset(Movie)
+            keys = get_sort_keys(Movie)
+            extra = [column for column, _ in keys] + ([Movie.uuid] if controls else [])
+            query = listing_query(Movie, fields, extra).filter(Movie.genre_id == genre_id)
+            query = filter_query(Movie, query)
+            page = Page.from_request(query, keys)
+        except ValueError as e:
+            return create_error_response(400, "Invalid query parameter", str(e))
+
         body = MovieTrackerBuilder(
-            name=db_genre.name
+            name=genre
         )
-        body.add_control("self", url_for("api.moviesbygenrecollection", genre=db_genre.name))
-        body.add_control("up", url_for("api.genreitem", genre=db_genre.name))
-        body.add_control_add_movie(db_genre.name, Movie.get_schema_post())
-        body["items"] = []
-        
-        for db_movie in db_genre.movies:
-            item = MovieTrackerBuilder(
-                title=db_movie.title,
-                actors=db_movie.actors,
-                release_date=db_movie.release_date,
-                score=db_movie.score,
-                genre=db_movie.genre.name
-            )
-            item.add_control("self", url_for("api.movieitem", movie=db_movie.uuid))
-            item.add_control("profile", MOVIE_PROFILE)
-            body["items"].append(item)
-
-        return Response(json.dumps(body), 200, mimetype=MASON)
+        body.add_control("self", build_url("api.moviesbygenrecollection", genre=genre))
+        body.add_control("up", build_url("api.genreitem", genre=genre))
+        body.add_control_filter(build_url("api.moviesbygenrecollection", genre=genre), get_filter_schema(Movie))
+        page.add_controls(body)
+        body.add_control_add_movie(genre, get_schema(Movie, "post"))
+        serializer = movie_serializer.subset(fields, controls)
+        movie_url = url_template("api.movieitem")
+        items = (
+            serializer.encode(row, movie_url.format(movie=row.uuid) if controls else None)
+            for row in page.items
+        )
+        return create_collection_response(body, items)
 
     def post(self, genre):
         # check that genre exists
-        db_genre = Genre.query.filter_by(name=genre).first()
-        if db_genre is None:
+        genre_id = get_genre_id(genre)
+        if genre_id is None:
             return create_error_response(404,
                 "Genre not found",
                 "Genre with name '{}' does not exist".format(genre)
@@ -102,18 +116,18 @@ class MoviesByGenreCollection(Resource):
 
         # validate JSON
         try:
-            validate(request.json, Movie.get_schema_post())
+            validate(request.json, Movie, "post")
         except ValidationError as e:
             return create_error_response(400, "Invalid JSON document", str(e))
 
         # set uuid and genre for the new movie entry
         movie = Movie(
             uuid=get_uuid(),
-            genre=db_genre
+            genre_id=genre_id
         )
 
         # set other properties
-        for attr in Movie.get_schema_post()["properties"]:
+        for attr in get_schema(Movie, "post")["properties"]:
             try:
                 setattr(movie, attr, request.json[attr])
             except KeyError:
@@ -124,50 +138,56 @@ class MoviesByGenreCollection(Resource):
 
         db.session.add(movie)
         db.session.commit()
+        invalidate_movie_listings(genre)
         
         return Response(status=201, headers={
-                "Location": url_for("api.movieitem", movie=movie.uuid)
+                "Location": build_url("api.movieitem", movie=movie.uuid)
             })
 
 
 class SeriesByGenreCollection(Resource):
 
+    @conditional(Genre, Series)
+    @cached
     def get(self, genre):
         # check that genre exists
-        db_genre = Genre.query.filter_by(name=genre).first()
-        if db_genre is None:
+        genre_id = get_genre_id(genre)
+        if genre_id is None:
             return create_error_response(404,
                 "Genre not found",
                 "Genre with name '{}' does not exist".format(genre)
             )
-        
+
+        try:
+            fields, controls = get_fieldset(Series)
+            keys = get_sort_keys(Series)
+            extra = [column for column, _ in keys] + ([Series.uuid] if controls else [])
+            query = listing_query(Series, fields, extra).filter(Series.genre_id == genre_id)
+            query = filter_query(Series, query)
+            page = Page.from_request(query, keys)
+        except ValueError as e:
+            return create_error_response(400, "Invalid query parameter", str(e))
+
         body = MovieTrackerBuilder(
-            name=db_genre.name
+            name=genre
         )
-        body.add_control("self", url_for("api.seriesbygenrecollection", genre=db_genre.name))
-        body.add_control("up", url_for("api.genreitem", genre=db_genre.name))
-        body.add_control_add_series(db_genre.name, Series.get_schema_post())
-        body["items"] = []
-        
-        for db_series in db_genre.series:
-            item = MovieTrackerBuilder(
-                title=db_series.title,
-                actors=db_series.actors,
-                release_date=db_series.release_date,
-                score=db_series.score,
-                seasons=db_series.seasons,
-                genre=db_series.genre.name
-            )
-            item.add_control("self", url_for("api.seriesitem", series=db_series.uuid))
-            item.add_control("profile", SERIES_PROFILE)
-            body["items"].append(item)
-            
-        return Response(json.dumps(body), 200, mimetype=MASON)
+        body.add_control("self", build_url("api.seriesbygenrecollection", genre=genre))
+        body.add_control("up", build_url("api.genreitem", genre=genre))
+        body.add_control_filter(build_url("api.seriesbygenrecollection", genre=genre), get_filter_schema(Series))
+        page.add_controls(body)
+        body.add_control_add_series(genre, get_schema(Series, "post"))
+        serializer = series_serializer.subset(fields, controls)
+        series_url = url_template("api.seriesitem")
+        items = (
+            serializer.encode(row, series_url.format(series=row.uuid) if controls else None)
+            for row in page.items
+        )
+        return create_collection_response(body, items)
 
     def post(self, genre):
         # check that genre exists
-        db_genre = Genre.query.filter_by(name=genre).first()
-        if db_genre is None:
+        genre_id = get_genre_id(genre)
+        if genre_id is None:
             return create_error_response(404,
                 "Not found",
                 "Genre with name '{}' does not exist".format(genre)
@@ -182,18 +202,18 @@ class SeriesByGenreCollection(Resource):
 
         # validate JSON
         try:
-            validate(request.json, Series.get_schema_post())
+            validate(request.json, Series, "post")
         except ValidationError as e:
             return create_error_response(400, "Invalid JSON document", str(e))
 
         # set uuid and genre for the new series entry
         series = Series(
             uuid=get_uuid(),
-            genre=db_genre
+            genre_id=genre_id
         )
 
         # set other properties
-        for attr in Series.get_schema_post()["properties"]:
+        for attr in get_schema(Series, "post")["properties"]:
             try:
                 setattr(series, attr, request.json[attr])
             except KeyError:
@@ -204,7 +224,8 @@ class SeriesByGenreCollection(Resource):
 
         db.session.add(series)
         db.session.commit()
+        invalidate_series_listings(genre)
     
         return Response(status=201, headers={
-            "Location": url_for("api.seriesitem", series=series.uuid)
+            "Location": build_url("api.seriesitem", series=series.uuid)
             })
\ No newline at end of file
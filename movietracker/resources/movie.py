@@ -1,38 +1,139 @@
-import json
 from flask_restful import Resource
-from flask import Response, request, url_for
-from jsonschema import validate, ValidationError
+from flask import Response, request, stream_with_context
+from jsonschema import ValidationError
 from movietracker import db
 from movietracker.models import *
 from movietracker.constants import *
-from movietracker.utils import MovieTrackerBuilder, create_error_response
+from movietracker.caching import cached, conditional, get_genre_id, get_genre_name, invalidate_movie_listings
+from movietracker.schemas import get_schema, validate
+from movietracker.utils import MovieTrackerBuilder, build_url, create_collection_response, create_error_response, create_mason_response, url_template
+from movietracker.serializers import movie_serializer, stream_collection
+from movietracker.filters import filter_query, get_fieldset, get_filter_schema, get_sort_keys
+from movietracker.pagination import Page
+from movietracker.batch import delete_items, patch_item, update_items
+from movietracker.bulk import import_items
 
 class MovieCollection(Resource):
 
+    @conditional(Movie, Genre)
+    @cached
     def get(self):
+        try:
+            fields, controls = get_fieldset(Movie)
+            keys = get_sort_keys(Movie)
+            extra = [column for column, _ in keys] + ([Movie.uuid] if controls else [])
+            query = filter_query(Movie, listing_query(Movie, fields, extra))
+            page = Page.from_request(query, keys)
+        except ValueError as e:
+            return create_error_response(400, "Invalid query parameter", str(e))
+
         body = MovieTrackerBuilder()
         body.add_namespace("mt", LINK_RELATIONS_URL)
-        body.add_control("self", url_for("api.moviecollection"))
+        body.add_control("self", build_url("api.moviecollection"))
         body.add_control_all_genres()
-        body["items"] = []
-        
-        for db_movie in Movie.query.all():
-            item = MovieTrackerBuilder(
-                title=db_movie.title,
-                actors=db_movie.actors,
-                release_date=db_movie.release_date,
-                score=db_movie.score,
-                genre=db_movie.genre.name
+        body.add_control_filter(build_url("api.moviecollection"), get_filter_schema(Movie))
+        body.add_control_export_movies()
+        page.add_controls(body)
+        serializer = movie_serializer.subset(fields, controls)
+        movie_url = url_template("api.movieitem")
+        items = (
+            serializer.encode(row, movie_url.format(movie=row.uuid) if controls else None)
+            for row in page.items
+        )
+        return create_collection_response(body, items)
+
+
+class MovieExport(Resource):
+
+    @conditional(Movie, Genre)
+    def get(self):
+        body = MovieTrackerBuilder()
+        body.add_namespace("mt", LINK_RELATIONS_URL)
+        body.add_control("self", build_url("api.movieexport"))
+        body.add_control("collection", build_url("api.moviecollection"))
+
+        # rows are fetched from the cursor in batches while the response is
+        # being sent so the whole catalogue is never in memory at once
+        query = listing_query(Movie, extra=[Movie.uuid]).order_by(Movie.id)
+        movie_url = url_template("api.movieitem")
+
+        def generate_items():
+            for row in query.yield_per(EXPORT_BATCH_SIZE):
+                yield movie_serializer.encode(row, movie_url.format(movie=row.uuid))
+
+        return Response(
+            stream_with_context(stream_collection(body, generate_items())),
+            200,
+            mimetype=MASON
+        )
+
+
+class MovieBulk(Resource):
+
+    def post(self):
+        # check media type, an empty array is a valid document
+        if not request.is_json:
+            return create_error_response(
+                415, "Unsupported media type",
+                "Requests must be JSON"
             )
-            item.add_control("self", url_for("api.movieitem", movie=db_movie.uuid))
-            item.add_control("profile", MOVIE_PROFILE)
-            body["items"].append(item)
 
-        return Response(json.dumps(body), 200, mimetype=MASON)
+        if not isinstance(request.json, list):
+            return create_error_response(400,
+                "Invalid JSON document",
+                "Request must be a JSON array of movies"
+            )
+
+        # invalid items are reported in the response, the rest are imported
+        created, errors = import_items(Movie, request.json)
+        invalidate_movie_listings(*{
+            document["genre"] for document in request.json
+            if isinstance(document, dict) and isinstance(document.get("genre"), str)
+        })
+
+        body = MovieTrackerBuilder(
+            created=created,
+            errors=errors
+        )
+        body.add_namespace("mt", LINK_RELATIONS_URL)
+        body.add_control("collection", build_url("api.moviecollection"))
+        return create_mason_response(body)
+
+
+class MovieBatch(Resource):
+
+    def _apply(self, func):
+        # check media type, an empty document is rejected by the schema
+        if not request.is_json:
+            return create_error_response(
+                415, "Unsupported media type",
+                "Requests must be JSON"
+            )
+
+        try:
+            items, genres = func(Movie, request.json)
+        except ValueError as e:
+            return create_error_response(400, "Invalid JSON document", str(e))
+        invalidate_movie_listings(*genres)
+
+        body = MovieTrackerBuilder(
+            matched=sum(1 for item in items if item["status"] == 204),
+            items=items
+        )
+        body.add_namespace("mt", LINK_RELATIONS_URL)
+        body.add_control("collection", build_url("api.moviecollection"))
+        return create_mason_response(body)
+
+    def put(self):
+        return self._apply(update_items)
+
+    def delete(self):
+        return self._apply(delete_items)
 
 
 class MovieItem(Resource):
 
+    @conditional(Movie, Genre)
     def get(self, movie):
         db_movie = Movie.query.filter_by(uuid=movie).first()
         if db_movie is None:
@@ -41,21 +142,23 @@ class MovieItem(Resource):
                 "Movie with uuid '{}' cannot be found".format(movie)
             )
                 
+        href = build_url("api.movieitem", movie=db_movie.uuid)
+        genre = get_genre_name(db_movie.genre_id)
         body = MovieTrackerBuilder(
             title=db_movie.title,
             actors=db_movie.actors,
             release_date=db_movie.release_date,
             score=db_movie.score,
-            genre=db_movie.genre.name
+            genre=genre
         )
         body.add_namespace("mt", LINK_RELATIONS_URL)
-        body.add_control("self", url_for("api.movieitem", movie=db_movie.uuid))
-        body.add_control("collection", url_for("api.moviecollection"))        
-        body.add_control_movies_by_genre(db_movie.genre.name)
-        body.add_control_edit(url_for("api.movieitem", movie=db_movie.uuid), Movie.get_schema_put())
-        body.add_control_delete(url_for("api.movieitem", movie=db_movie.uuid))
+        body.add_control("self", href)
+        body.add_control("collection", build_url("api.moviecollection"))        
+        body.add_control_movies_by_genre(genre)
+        body.add_control_edit(href, get_schema(Movie, "put"))
+        body.add_control_delete(href)
             
-        return Response(json.dumps(body), 200, mimetype=MASON)
+        return create_mason_response(body)
         
     def put(self, movie):
         # check that movie exists
@@ -72,23 +175,26 @@ class MovieItem(Resource):
 
         # validate JSON
         try:
-            validate(request.json, Movie.get_schema_put())
+            validate(request.json, Movie, "put")
         except ValidationError as e:
             return create_error_response(400, "Invalid JSON document", str(e))
 
         # check that given genre exists
         genre = request.json["genre"]
-        db_genre = Genre.query.filter_by(name=genre).first()
-        if db_genre is None:
+        genre_id = get_genre_id(genre)
+        if genre_id is None:
             return create_error_response(400,
                 "Invalid JSON document",
                 "Genre with name '{}' cannot be found".format(genre)
                 )
-        else:
-            request.json["genre"] = db_genre
+
+        # listings of the old genre change too
+        old_genre = get_genre_name(db_movie.genre_id)
 
         # set properties
-        for attr in Movie.get_schema_put()["properties"]:
+        for attr in get_schema(Movie, "put")["properties"]:
+            if attr == "genre":
+                continue
             try:
                 setattr(db_movie, attr, request.json[attr])
             except KeyError:
@@ -96,11 +202,34 @@ class MovieItem(Resource):
                     "Missing property in JSON file",
                     "Property '{}' was not found".format(attr)
                     )
+        db_movie.genre_id = genre_id
 
         db.session.add(db_movie)
         db.session.commit()
+        invalidate_movie_listings(old_genre, genre)
         return Response(status=204, mimetype=MASON)
         
+    def patch(self, movie):
+        # check media type
+        if request.mimetype != MERGE_PATCH:
+            return create_error_response(415,
+                "Unsupported media type",
+                "Request content type must be " + MERGE_PATCH
+            )
+
+        try:
+            genres = patch_item(Movie, movie, request.get_json())
+        except ValueError as e:
+            return create_error_response(400, "Invalid JSON document", str(e))
+        if genres is None:
+            return create_error_response(404,
+                "Movie not found",
+                "Movie with uuid '{}' cannot be found".format(movie)
+                )
+
+        invalidate_movie_listings(*genres)
+        return Response(status=204, mimetype=MASON)
+
     def delete(self, movie):
         # check that movie exists
         db_movie = Movie.query.filter_by(uuid=movie).first()
@@ -110,7 +239,9 @@ class MovieItem(Resource):
                 "Movie with uuid '{}' cannot be found".format(movie)
                 )
         
+        genre = get_genre_name(db_movie.genre_id)
         db.session.delete(db_movie)
         db.session.commit()
+        invalidate_movie_listings(genre)
         return Response(status=204, mimetype=MASON)
         
\ No newline at end of file
@@ -0,0 +1,72 @@
+from flask import request, url_for
+from flask_restful import Resource
+from movietracker.models import Genre, Movie, Series
+from movietracker.constants import *
+from movietracker.caching import conditional
+from movietracker.pagination import decode_cursor, encode_cursor, page_url
+from movietracker.search import search
+from movietracker.utils import MovieTrackerBuilder, create_collection_response, create_error_response, url_template
+from movietracker.serializers import movie_serializer, series_serializer
+
+class Search(Resource):
+
+    @conditional(Movie, Series, Genre)
+    def get(self):
+        query = request.args.get("q", "")
+        if not query.strip():
+            return create_error_response(400,
+                "Invalid query parameter",
+                "Search terms must be given with parameter 'q'"
+            )
+
+        # results are ranked so pages are addressed by position, the cursor
+        # just hides the offset
+        try:
+            limit = int(request.args.get("limit", PAGE_SIZE))
+            if not 1 <= limit <= MAX_PAGE_SIZE:
+                raise ValueError
+        except ValueError:
+            return create_error_response(400,
+                "Invalid query parameter",
+                "Limit must be an integer between 1 and {}".format(MAX_PAGE_SIZE)
+            )
+        offset = 0
+        if "after" in request.args:
+            try:
+                offset, = decode_cursor(request.args["after"], 1)
+                # bool is a subclass of int but true and false aren't offsets
+                if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+                    raise ValueError("Cursor is not valid")
+            except ValueError as e:
+                return create_error_response(400, "Invalid query parameter", str(e))
+
+        results = search(query, limit + 1, offset)
+
+        body = MovieTrackerBuilder(
+            query=query
+        )
+        body.add_namespace("mt", LINK_RELATIONS_URL)
+        body.add_control("self", url_for("api.search", q=query))
+        body.add_control_all_movies()
+        body.add_control_all_series()
+        if len(results) > limit:
+            body.add_control_next_page(page_url(after=encode_cursor([offset + limit])))
+        if offset > 0:
+            body.add_control_prev_page(page_url(after=encode_cursor([max(0, offset - limit)])))
+        series_url = url_template("api.seriesitem")
+        movie_url = url_template("api.movieitem")
+        items = []
+        for result in results[:limit]:
+            genre = result.genre.name if result.genre is not None else None
+            if isinstance(result, Series):
+                items.append(series_serializer.encode(
+                    (result.title, result.actors, result.release_date, result.score, result.seasons, genre),
+                    series_url.format(series=result.uuid)
+                ))
+            else:
+                items.append(movie_serializer.encode(
+                    (result.title, result.actors, result.release_date, result.score, genre),
+                    movie_url.format(movie=result.uuid)
+                ))
+
+        return create_collection_response(body, items)
@@ -1,38 +1,136 @@
-import json
-from flask import Response, request, url_for
+from flask import Response, request, stream_with_context
 from flask_restful import Resource
-from jsonschema import validate, ValidationError
+from jsonschema import ValidationError
 from movietracker import db
 from movietracker.models import *
 from movietracker.constants import *
-from movietracker.utils import MovieTrackerBuilder, create_error_response
+from movietracker.caching import cached, conditional, get_genre_id, get_genre_name, invalidate_series_listings
+from movietracker.schemas import get_schema, validate
+from movietracker.utils import MovieTrackerBuilder, build_url, create_collection_response, create_error_response, create_mason_response, url_template
+from movietracker.serializers import series_serializer, stream_collection
+from movietracker.filters import filter_query, get_fieldset, get_filter_schema, get_sort_keys
+from movietracker.pagination import Page
+from movietracker.batch import delete_items, patch_item, update_items
+from movietracker.bulk import import_items
 
 class SeriesCollection(Resource):
     
+    @conditional(Series, Genre)
+    @cached
     def get(self):
+        try:
+            fields, controls = get_fieldset(Series)
+            keys = get_sort_keys(Series)
+            extra = [column for column, _ in keys] + ([Series.uuid] if controls else [])
+            query = filter_query(Series, listing_query(Series, fields, extra))
+            page = Page.from_request(query, keys)
+        except ValueError as e:
+            return create_error_response(400, "Invalid query parameter", str(e))
+
         body = MovieTrackerBuilder()
         body.add_namespace("mt", LINK_RELATIONS_URL)
-        body.add_control("self", url_for("api.seriescollection"))
+        body.add_control("self", build_url("api.seriescollection"))
         body.add_control_all_genres()
-        body["items"] = []
-
-        for db_series in Series.query.all():
-            item = MovieTrackerBuilder(
-                title=db_series.title,
-                actors=db_series.actors,
-                release_date=db_series.release_date,
-                score=db_series.score,
-                seasons=db_series.seasons,
-                genre=db_series.genre.name
+        body.add_control_filter(build_url("api.seriescollection"), get_filter_schema(Series))
+        body.add_control_export_series()
+        page.add_controls(body)
+        serializer = series_serializer.subset(fields, controls)
+        series_url = url_template("api.seriesitem")
+        items = (
+            serializer.encode(row, series_url.format(series=row.uuid) if controls else None)
+            for row in page.items
+        )
+        return create_collection_response(body, items)
+
+class SeriesExport(Resource):
+
+    @conditional(Series, Genre)
+    def get(self):
+        body = MovieTrackerBuilder()
+        body.add_namespace("mt", LINK_RELATIONS_URL)
+        body.add_control("self", build_url("api.seriesexport"))
+        body.add_control("collection", build_url("api.seriescollection"))
+
+        # rows are fetched from the cursor in batches while the response is
+        # being sent so the whole catalogue is never in memory at once
+        query = listing_query(Series, extra=[Series.uuid]).order_by(Series.id)
+        series_url = url_template("api.seriesitem")
+
+        def generate_items():
+            for row in query.yield_per(EXPORT_BATCH_SIZE):
+                yield series_serializer.encode(row, series_url.format(series=row.uuid))
+
+        return Response(
+            stream_with_context(stream_collection(body, generate_items())),
+            200,
+            mimetype=MASON
+        )
+
+class SeriesBulk(Resource):
+
+    def post(self):
+        # check media type, an empty array is a valid document
+        if not request.is_json:
+            return create_error_response(
+                415, "Unsupported media type",
+                "Requests must be JSON"
             )
-            item.add_control("self", url_for("api.seriesitem", series=db_series.uuid))
-            item.add_control("profile", SERIES_PROFILE)
-            body["items"].append(item)
-        
-        return Response(json.dumps(body), 200, mimetype=MASON)
+
+        if not isinstance(request.json, list):
+            return create_error_response(400,
+                "Invalid JSON document",
+                "Request must be a JSON array of series"
+            )
+
+        # invalid items are reported in the response, the rest are imported
+        created, errors = import_items(Series, request.json)
+        invalidate_series_listings(*{
+            document["genre"] for document in request.json
+            if isinstance(document, dict) and isinstance(document.get("genre"), str)
+        })
+
+        body = MovieTrackerBuilder(
+            created=created,
+            errors=errors
+        )
+        body.add_namespace("mt", LINK_RELATIONS_URL)
+        body.add_control("collection", build_url("api.seriescollection"))
+        return create_mason_response(body)
+
+class SeriesBatch(Resource):
+
+    def _apply(self, func):
+        # check media type, an empty document is rejected by the schema
+        if not request.is_json:
+            return create_error_response(
+                415, "Unsupported media type",
+                "Requests must be JSON"
+            )
+
+        try:
+            items, genres = func(Series, request.json)
+        except ValueError as e:
+            return create_error_response(400, "Invalid JSON document", str(e))
+        invalidate_series_listings(*genres)
+
+        body = MovieTrackerBuilder(
+            matched=sum(1 for item in items if item["status"] == 204),
+            items=items
+        )
+        body.add_namespace("mt", LINK_RELATIONS_URL)
+        body.add_control("collection", build_url("api.seriescollection"))
+        return create_mason_response(body)
+
+    def put(self):
+        return self._apply(update_items)
+
+    def delete(self):
+        return self._apply(delete_items)
+
 
 class SeriesItem(Resource):
     
+    @conditional(Series, Genre)
     def get(self, series):
         # check that series exists
         db_series = Series.query.filter_by(uuid=series).first()
@@ -43,22 +141,24 @@ class SeriesItem(Resource):
                 "Series with uuid '{}' does not exist".format(series)
             )
         
+        href = build_url("api.seriesitem", series=db_series.uuid)
+        genre = get_genre_name(db_series.genre_id)
         body = MovieTrackerBuilder(
             title=db_series.title,
             actors=db_series.actors,
             release_date=db_series.release_date,
             score=db_series.score,
             seasons=db_series.seasons,
-            genre = db_series.genre.name
+            genre=genre
         )
         body.add_namespace("mt", LINK_RELATIONS_URL)
-        body.add_control("self", url_for("api.seriesitem", series=db_series.uuid))
-        body.add_control("collection", url_for("api.seriescollection"))
-        body.add_control_series_by_genre(db_series.genre.name)
-        body.add_control_edit(url_for("api.seriesitem", series=db_series.uuid), Series.get_schema_put())
-        body.add_control_delete(url_for("api.seriesitem", series=db_series.uuid))
+        body.add_control("self", href)
+        body.add_control("collection", build_url("api.seriescollection"))
+        body.add_control_series_by_genre(genre)
+        body.add_control_edit(href, get_schema(Series, "put"))
+        body.add_control_delete(href)
 
-        return Response(json.dumps(body), 200, mimetype=MASON)
+        return create_mason_response(body)
 
     def put(self, series):
         # check that series exists
@@ -79,23 +179,26 @@ class SeriesItem(Resource):
 
         # validate JSON
         try:
-            validate(request.json, Series.get_schema_put())
+            validate(request.json, Series, "put")
         except ValidationError as e:
             return create_error_response(400, "Invalid JSON document", str(e))
 
         # check that given genre exists
         genre = request.json["genre"]
-        db_genre = Genre.query.filter_by(name=genre).first()
-        if db_genre is None:
+        genre_id = get_genre_id(genre)
+        if genre_id is None:
             return create_error_response(400,
                 "Invalid JSON document",
                 "Genre with name '{}' cannot be found".format(genre)
                 )
-        else:
-            request.json["genre"] = db_genre
+
+        # listings of the old genre change too
+        old_genre = get_genre_name(db_series.genre_id)
 
         # set properties
-        for attr in Series.get_schema_put()["properties"]:
+        for attr in get_schema(Series, "put")["properties"]:
+            if attr == "genre":
+                continue
             try:
                 setattr(db_series, attr, request.json[attr])
             except KeyError:
@@ -103,9 +206,32 @@ class SeriesItem(Resource):
                     "Missing property in JSON file",
                     "Property '{}' was not found".format(attr)
                     )
+        db_series.genre_id = genre_id
         
         db.session.add(db_series)
         db.session.commit()
+        invalidate_series_listings(old_genre, genre)
+        return Response(status=204, mimetype=MASON)
+
+    def patch(self, series):
+        # check media type
+        if request.mimetype != MERGE_PATCH:
+            return create_error_response(415,
+                "Unsupported media type",
+                "Request content type must be " + MERGE_PATCH
+            )
+
+        try:
+            genres = patch_item(Series, series, request.get_json())
+        except ValueError as e:
+            return create_error_response(400, "Invalid JSON document", str(e))
+        if genres is None:
+            return create_error_response(404,
+                "Series not found",
+                "Series with uuid '{}' cannot be found".format(series)
+                )
+
+        invalidate_series_listings(*genres)
         return Response(status=204, mimetype=MASON)
 
     def delete(self, series):
@@ -118,6 +244,8 @@ class SeriesItem(Resource):
                 "Series with uuid '{}' does not exist".format(series)
             )
         
+        genre = get_genre_name(db_series.genre_id)
         db.session.delete(db_series)
         db.session.commit()
+        invalidate_series_listings(genre)
         return Response(status=204, mimetype=MASON)
@@ -0,0 +1,67 @@
+from datetime import date
+from jsonschema import Draft7Validator, validators
+from jsonschema.exceptions import ValidationError, best_match
+from movietracker.constants import DATE_PATTERN
+
+# Schemas are built only once per model and method and shared by all
+# requests, so the returned dicts must not be modified
+_schemas = {}
+_validators = {}
+_builders = {}
+
+def _pattern(validator, pattern, instance, schema):
+    # strings matching the date pattern must also be valid calendar dates
+    # because they are stored in date columns
+    for error in Draft7Validator.VALIDATORS["pattern"](validator, pattern, instance, schema):
+        yield error
+        return
+    if pattern == DATE_PATTERN and validator.is_type(instance, "string"):
+        try:
+            date.fromisoformat(instance)
+        except ValueError:
+            yield ValidationError("{!r} is not a valid date".format(instance))
+
+DateValidator = validators.extend(Draft7Validator, {"pattern": _pattern})
+
+def register_schema(method, builder):
+    '''
+    Register a function that builds the schema of a model for given method,
+    for schemas that aren't defined by the models themselves
+    '''
+    _builders[method] = builder
+
+def get_schema(model, method):
+    '''
+    Get JSON schema of a model for given method ("post", "put", "patch" or
+    a method added with register_schema)
+    '''
+    key = (model, method)
+    if key not in _schemas:
+        if method in _builders:
+            _schemas[key] = _builders[method](model)
+        else:
+            _schemas[key] = getattr(model, "get_schema_" + method)()
+    return _schemas[key]
+
+def get_validator(model, method):
+    '''
+    Get precompiled Draft 7 validator for the JSON schema of a model. The
+    schema itself is checked only when the validator is created. Strings
+    with the date pattern are also checked to be valid dates.
+    '''
+    key = (model, method)
+    if key not in _validators:
+        schema = get_schema(model, method)
+        DateValidator.check_schema(schema)
+        _validators[key] = DateValidator(schema)
+    return _validators[key]
+
+def validate(instance, model, method):
+    '''
+    Validate a JSON document against the schema of a model. Raises
+    jsonschema ValidationError with the most relevant error like
+    jsonschema.validate does.
+    '''
+    error = best_match(get_validator(model, method).iter_errors(instance))
+    if error is not None:
+        raise error
@@ -0,0 +1,106 @@
+from sqlalchemy import event, or_, text
+from sqlalchemy.orm import joinedload
+from movietracker import db
+from movietracker.models import Movie, Series
+from movietracker.filters import _like
+
+# Movies and series share one FTS5 index so that they are ranked together.
+# The rowid of an entry encodes both the type and the id of the item: movies
+# use even rowids (2 * id) and series odd ones (2 * id + 1), which lets the
+# triggers update entries by rowid instead of scanning the index.
+
+SEARCH_TABLE = "search_index"
+
+_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN
+    INSERT INTO search_index (rowid, title, actors) VALUES (2 * new.id + {kind}, new.title, new.actors);
+END;
+CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN
+    DELETE FROM search_index WHERE rowid = 2 * old.id + {kind};
+END;
+CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF title, actors ON {table} BEGIN
+    DELETE FROM search_index WHERE rowid = 2 * old.id + {kind};
+    INSERT INTO search_index (rowid, title, actors) VALUES (2 * new.id + {kind}, new.title, new.actors);
+END;
+"""
+
+_INDEXED = [(Movie, 0), (Series, 1)]
+
+def create_search_index(connection):
+    '''
+    Create the full-text index and the triggers that keep it in sync with
+    the movie and series tables. If the index didn't exist yet it is filled
+    from existing rows. Only supported on SQLite.
+    '''
+    exists = connection.execute(
+        text("SELECT name FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": SEARCH_TABLE}
+    ).first()
+    if exists is None:
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE search_index USING fts5(title, actors)"
+        ))
+        for model, kind in _INDEXED:
+            connection.execute(text(
+                "INSERT INTO search_index (rowid, title, actors) "
+                "SELECT 2 * id + {kind}, title, actors FROM {table}".format(
+                    kind=kind, table=model.__tablename__
+                )
+            ))
+
+    for model, kind in _INDEXED:
+        for statement in _TRIGGERS.format(table=model.__tablename__, kind=kind).split("END;"):
+            if statement.strip():
+                connection.execute(text(statement + "END;"))
+
+@event.listens_for(db.metadata, "after_create")
+def _create_search_index(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        create_search_index(connection)
+
+def _match_expression(query):
+    # every word is matched as a quoted prefix so that FTS5 syntax characters
+    # in user input are taken literally
+    words = ['"{}"*'.format(word.replace('"', '""')) for word in query.split()]
+    return " ".join(words)
+
+def search(query, limit, offset=0):
+    '''
+    Search movies and series by title and actors. Returns a list of matching
+    Movie and Series objects, best matches first. On SQLite the results are
+    ranked with the FTS5 index, on other databases titles and actors are
+    matched with LIKE and sorted by title.
+    '''
+    if not query.split():
+        return []
+
+    if db.engine.dialect.name != "sqlite":
+        return _search_like(query, limit, offset)
+
+    rowids = [row[0] for row in db.session.execute(
+        text(
+            "SELECT rowid FROM search_index WHERE search_index MATCH :match "
+            "ORDER BY rank, rowid LIMIT :limit OFFSET :offset"
+        ),
+        {"match": _match_expression(query), "limit": limit, "offset": offset}
+    )]
+
+    found = {}
+    for model, kind in _INDEXED:
+        ids = [rowid // 2 for rowid in rowids if rowid % 2 == kind]
+        if ids:
+            for item in model.query.options(joinedload(model.genre)).filter(model.id.in_(ids)):
+                found[2 * item.id + kind] = item
+    return [found[rowid] for rowid in rowids if rowid in found]
+
+def _search_like(query, limit, offset):
+    results = []
+    for model, _ in _INDEXED:
+        conditions = [
+            or_(model.title.ilike(_like(word), escape="\\"), model.actors.ilike(_like(word), escape="\\"))
+            for word in query.split()
+        ]
+        results.extend(model.query.filter(*conditions).order_by(model.title, model.id).limit(limit + offset))
+    # the type and id break ties so that pages don't overlap
+    results.sort(key=lambda item: (item.title, isinstance(item, Series), item.id))
+    return results[offset:offset + limit]
@@ -0,0 +1,116 @@
+import json
+import math
+from json.encoder import encode_basestring_ascii
+from movietracker.constants import *
+
+# encode_basestring_ascii is the C accelerated string encoder of the json
+# module when it's available and the pure Python one otherwise. Both give
+# the same result as json.dumps with default settings.
+
+MOVIE_FIELDS = ("title", "actors", "release_date", "score", "genre")
+SERIES_FIELDS = ("title", "actors", "release_date", "score", "seasons", "genre")
+GENRE_FIELDS = ("name",)
+
+def _encode_float(value):
+    if math.isfinite(value):
+        return float.__repr__(value)
+    return json.dumps(value)
+
+# encoders for the exact types of field values, anything else goes through
+# json.dumps
+_ENCODERS = {
+    str: encode_basestring_ascii,
+    int: int.__repr__,
+    float: _encode_float,
+    bool: lambda value: "true" if value else "false",
+    type(None): lambda value: "null",
+}
+
+def encode_value(value):
+    '''
+    Encode a single field value exactly like json.dumps does
+    '''
+    return _ENCODERS.get(value.__class__, json.dumps)(value)
+
+
+class ItemSerializer(object):
+    """
+    Encodes collection items of one type straight into Mason JSON from tuples
+    of field values, without building MovieTrackerBuilder objects for them.
+    The output is identical to json.dumps of an item built with the given
+    fields in the same order followed by self and profile controls, or
+    without controls if controls is False.
+    """
+
+    def __init__(self, fields, profile, controls=True):
+        self.fields = fields
+        self.profile = profile
+        self.controls = controls
+        self._count = len(fields)
+        self._subsets = {}
+        members = ["{}: %s".format(encode_basestring_ascii(field).replace("%", "%%")) for field in fields]
+        if controls:
+            members.append('"@controls": {{"self": {{"href": %s}}, "profile": {{"href": {}}}}}'.format(
+                encode_basestring_ascii(profile).replace("%", "%%")
+            ))
+        self._template = "{" + ", ".join(members) + "}"
+
+    def subset(self, fields, controls=True):
+        '''
+        Get a serializer for only the given fields, in the order of this
+        serializer's fields, with or without controls. Subsets are created
+        once and reused.
+        '''
+        key = (tuple(field for field in self.fields if field in fields), controls)
+        serializer = self._subsets.get(key)
+        if serializer is None:
+            serializer = self._subsets[key] = ItemSerializer(key[0], self.profile, controls)
+        return serializer
+
+    def encode(self, values, href=None):
+        '''
+        Encode one item from a tuple (or row) that starts with its field
+        values and the href of its self control. Values after the fields
+        are ignored, as is the href when there are no controls.
+        '''
+        encoder = _ENCODERS.get
+        encoded = [encoder(value.__class__, json.dumps)(value) for value in values[:self._count]]
+        if self.controls:
+            encoded.append(encode_basestring_ascii(href))
+        return self._template % tuple(encoded)
+
+
+movie_serializer = ItemSerializer(MOVIE_FIELDS, MOVIE_PROFILE)
+series_serializer = ItemSerializer(SERIES_FIELDS, SERIES_PROFILE)
+genre_serializer = ItemSerializer(GENRE_FIELDS, GENRE_PROFILE)
+
+def _items_prefix(body):
+    if len(body) > 0:
+        return json.dumps(body)[:-1] + ", \"items\": ["
+    return "{\"items\": ["
+
+def encode_collection(body, items):
+    '''
+    Encode a Mason collection document from its body without items and an
+    iterable of items encoded with an ItemSerializer. The output is identical
+    to json.dumps of the complete document with "items" as its last key.
+    '''
+    return _items_prefix(body) + ", ".join(items) + "]}"
+
+def stream_collection(body, items, batch_size=EXPORT_BATCH_SIZE):
+    '''
+    Generator version of encode_collection for large documents. Items are
+    consumed from the iterable as the output is being sent, batch_size items
+    per yielded chunk.
+    '''
+    yield _items_prefix(body)
+
+    chunk = []
+    separator = ""
+    for item in items:
+        chunk.append(separator + item)
+        separator = ", "
+        if len(chunk) >= batch_size:
+            yield "".join(chunk)
+            chunk = []
+    yield "".join(chunk) + "]}"
@@ -50,6 +50,21 @@ function deleteData(href, postProcessor) {
     });
 }
 
+function pageControls(body, renderer) {
+    let links = [];
+    if ("prev" in body["@controls"]) {
+        links.push("<a href='" +
+                body["@controls"].prev.href +
+                "' onClick='followLink(event, this, " + renderer + ")'>Previous</a>");
+    }
+    if ("next" in body["@controls"]) {
+        links.push("<a href='" +
+                body["@controls"].next.href +
+                "' onClick='followLink(event, this, " + renderer + ")'>Next</a>");
+    }
+    $("div.tablecontrols").html(links.join(" | "));
+}
+
 function itemRow(item, type) {
     if (type == "movie") {
         let link = "<a href='" +
@@ -199,7 +214,7 @@ function renderMovies(body) {
         ENTRYPOINT +
         "' onClick='followLink(event, this, renderEntrypoint)'>Home Page</a>"
     );
-    $("div.tablecontrols").empty();
+    pageControls(body, "renderMovies");
     $(".resulttable thead").html(
         "<tr><th>Title</th><th>Actors</th><th>Release Date</th><th>Score</th><th>Genre</th></tr>"
     );
@@ -229,7 +244,7 @@ function renderMoviesByGenre(body) {
         ENTRYPOINT +
         "' onClick='followLink(event, this, renderEntrypoint)'>Home Page</a>"
     );
-    $("div.tablecontrols").empty();
+    pageControls(body, "renderMoviesByGenre");
     $(".resulttable thead").html(
         "<tr><th>Title</th><th>Actors</th><th>Release Date</th><th>Score</th><th>Genre</th></tr>"
     );
@@ -280,7 +295,7 @@ function renderSeries(body) {
         ENTRYPOINT +
         "' onClick='followLink(event, this, renderEntrypoint)'>Home Page</a>"
     );
-    $("div.tablecontrols").empty();
+    pageControls(body, "renderSeries");
     $(".resulttable thead").html(
         "<tr><th>Title</th><th>Actors</th><th>Release Date</th><th>Score</th><th>Seasons</th><th>Genre</th></tr>"
     );
@@ -309,7 +324,7 @@ function renderSeriesByGenre(body) {
         ENTRYPOINT +
         "' onClick='followLink(event, this, renderEntrypoint)'>Home Page</a>"
     );
-    $("div.tablecontrols").empty();
+    pageControls(body, "renderSeriesByGenre");
     $(".resulttable thead").html(
         "<tr><th>Title</th><th>Actors</th><th>Release Date</th><th>Score</th><th>Seasons</th><th>Genre</th></tr>"
     );
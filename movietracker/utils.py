@@ -1,7 +1,73 @@
+import re
 import json
 import shortuuid
-from flask import Response, request, url_for
+from flask import Response, current_app, request, url_for
+from werkzeug.routing import BaseConverter
 from movietracker.constants import *
+from movietracker.instrumentation import timed_serialization
+from movietracker.serializers import encode_collection
+
+# placeholder for route arguments while building URL templates, it must be
+# left unchanged by every converter's quoting
+_URL_PLACEHOLDER = "URLTEMPLATEVALUE{}X"
+
+# characters that BaseConverter.to_url never quotes
+_URL_SAFE = re.compile("[A-Za-z0-9_.~!$&'()*+,/:;=@-]*")
+
+
+class URLTemplate(object):
+    """
+    URL of an endpoint with slots for the route arguments, built with url_for
+    once. Formatting the template gives the same URL as url_for without
+    looking up the endpoint in the routing map, values are quoted with the
+    to_url method of the route's converters.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        rule = next(current_app.url_map.iter_rules(endpoint))
+        self.arguments = frozenset(rule.arguments)
+        self.converters = {name: rule._converters[name] for name in rule.arguments}
+
+        placeholders = {
+            name: _URL_PLACEHOLDER.format(i) for i, name in enumerate(sorted(rule.arguments))
+        }
+        template = url_for(endpoint, **placeholders).replace("%", "%%")
+        for name, placeholder in placeholders.items():
+            template = template.replace(placeholder, "%({})s".format(name))
+        self.template = template
+
+    def _to_url(self, name, value):
+        converter = self.converters[name]
+        # strings that wouldn't be changed by quoting are used as is
+        if (type(converter).to_url is BaseConverter.to_url and value.__class__ is str
+                and _URL_SAFE.fullmatch(value)):
+            return value
+        return converter.to_url(value)
+
+    def format(self, **values):
+        if values.keys() != self.arguments:
+            # extra values end up in the query string
+            return url_for(self.endpoint, **values)
+        return self.template % {name: self._to_url(name, value) for name, value in values.items()}
+
+def url_template(endpoint):
+    '''
+    Get the URLTemplate of an endpoint. Templates are built once per app.
+    '''
+    templates = current_app.extensions.setdefault("url_templates", {})
+    key = (endpoint, request.script_root)
+    template = templates.get(key)
+    if template is None:
+        template = templates[key] = URLTemplate(endpoint)
+    return template
+
+def build_url(endpoint, **values):
+    '''
+    Same as url_for(endpoint, **values) but using the URLTemplate of the
+    endpoint
+    '''
+    return url_template(endpoint).format(**values)
 
 # taken from https://github.com/JornWildt/Mason
 class MasonBuilder(dict):
@@ -74,7 +140,7 @@ class MovieTrackerBuilder(MasonBuilder):
     def add_control_all_movies(self):
         self.add_control(
             "mt:all-movies",
-            url_for("api.moviecollection"),
+            build_url("api.moviecollection"),
             method="GET",
             title="Collection of all movies"
         )
@@ -82,7 +148,7 @@ class MovieTrackerBuilder(MasonBuilder):
     def add_control_all_series(self):
         self.add_control(
             "mt:all-series",
-            url_for("api.seriescollection"),
+            build_url("api.seriescollection"),
             method="GET",
             title="Collection of all series"
         )
@@ -90,15 +156,69 @@ class MovieTrackerBuilder(MasonBuilder):
     def add_control_all_genres(self):
         self.add_control(
             "mt:all-genres",
-            url_for("api.genrecollection"),
+            build_url("api.genrecollection"),
             method="GET",
             title="Collection of all genres"
         )
 
+    def add_control_export_movies(self):
+        self.add_control(
+            "mt:export-movies",
+            build_url("api.movieexport"),
+            method="GET",
+            title="Export of all movies as a single streamed document"
+        )
+
+    def add_control_export_series(self):
+        self.add_control(
+            "mt:export-series",
+            build_url("api.seriesexport"),
+            method="GET",
+            title="Export of all series as a single streamed document"
+        )
+
+    def add_control_search(self):
+        self.add_control(
+            "mt:search",
+            build_url("api.search") + "{?q}",
+            method="GET",
+            isHrefTemplate=True,
+            title="Search movies and series by title and actors",
+            schema={
+                "type": "object",
+                "required": ["q"],
+                "properties": {
+                    "q": {
+                        "description": "Search terms",
+                        "type": "string"
+                    }
+                }
+            }
+        )
+
+    def add_control_filmography(self):
+        self.add_control(
+            "mt:filmography",
+            url_template("api.actoritem").template % {"actor": "{actor}"},
+            method="GET",
+            isHrefTemplate=True,
+            title="Movies and series of an actor",
+            schema={
+                "type": "object",
+                "required": ["actor"],
+                "properties": {
+                    "actor": {
+                        "description": "Full name of the actor",
+                        "type": "string"
+                    }
+                }
+            }
+        )
+
     def add_control_movies_by_genre(self, genre):
         self.add_control(
             "mt:movies-by-genre",
-            url_for("api.moviesbygenrecollection", genre=genre),
+            build_url("api.moviesbygenrecollection", genre=genre),
             method="GET",
             title="Collection of all movies in the genre"
         )
@@ -106,7 +226,7 @@ class MovieTrackerBuilder(MasonBuilder):
     def add_control_series_by_genre(self, genre):
         self.add_control(
             "mt:series-by-genre",
-            url_for("api.seriesbygenrecollection", genre=genre),
+            build_url("api.seriesbygenrecollection", genre=genre),
             method="GET",
             title="Collection of all series in the genre"
         )
@@ -114,7 +234,7 @@ class MovieTrackerBuilder(MasonBuilder):
     def add_control_add_movie(self, genre, schema):
         self.add_control(
             "mt:add-movie",
-            url_for("api.moviesbygenrecollection", genre=genre),
+            build_url("api.moviesbygenrecollection", genre=genre),
             method="POST",
             encoding="json",
             title="Add movie to the API",
@@ -124,7 +244,7 @@ class MovieTrackerBuilder(MasonBuilder):
     def add_control_add_series(self, genre, schema):
         self.add_control(
             "mt:add-series",
-            url_for("api.seriesbygenrecollection", genre=genre),
+            build_url("api.seriesbygenrecollection", genre=genre),
             method="POST",
             encoding="json",
             title="Add series to the API",
@@ -149,12 +269,56 @@ class MovieTrackerBuilder(MasonBuilder):
             title="Delete this item"
         )
 
+    def add_control_filter(self, href, schema):
+        self.add_control(
+            "mt:filter",
+            href + "{?" + ",".join(schema["properties"]) + "}",
+            method="GET",
+            isHrefTemplate=True,
+            title="Filter and sort the collection",
+            schema=schema
+        )
+
+    def add_control_next_page(self, href):
+        self.add_control(
+            "next",
+            href,
+            method="GET",
+            title="Next page of the collection"
+        )
+
+    def add_control_prev_page(self, href):
+        self.add_control(
+            "prev",
+            href,
+            method="GET",
+            title="Previous page of the collection"
+        )
+
+def create_mason_response(body, status_code=200):
+    '''
+    Encode a Mason document into a response. The time spent encoding is
+    recorded when instrumentation is enabled.
+    '''
+    with timed_serialization():
+        data = json.dumps(body)
+    return Response(data, status_code, mimetype=MASON)
+
+def create_collection_response(body, items):
+    '''
+    Encode a Mason collection into a response from its body without items
+    and an iterable of items encoded with an ItemSerializer
+    '''
+    with timed_serialization():
+        data = encode_collection(body, items)
+    return Response(data, 200, mimetype=MASON)
+
 def create_error_response(status_code, title, message=None):
     resource_url = request.path
     body = MasonBuilder(resource_url=resource_url)
     body.add_error(title, message)
     body.add_control("profile", href=ERROR_PROFILE)
-    return Response(json.dumps(body), status_code, mimetype=MASON)
+    return create_mason_response(body, status_code)
 
 
 def get_uuid():
@@ -7,9 +7,11 @@ setup(
     include_package_data=True,
     zip_safe=False,
     install_requires=[
-        "flask",
-        "flask-restful",
-        "flask-sqlalchemy",
-        "SQLAlchemy",
+        "flask>=2.2.5",
+        "flask-restful>=0.3.9",
+        "flask-sqlalchemy>=3.0",
+        "SQLAlchemy>=2.0",
+        "jsonschema>=3.2",
+        "shortuuid",
     ]
 )
\ No newline at end of file
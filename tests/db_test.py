@@ -2,18 +2,16 @@ import os
 import pytest
 import tempfile
 import shortuuid
-from sqlalchemy.engine import Engine
-from sqlalchemy import event
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import StatementError
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 from movietracker import db, create_app
 from movietracker.utils import get_uuid
-from movietracker.models import Genre, Movie, Series
-
-# based on "sensorhub" example database test
-@event.listens_for(Engine, "connect")
-def set_sqlite_pragma(dbapi_connection, connection_record):
-    cursor = dbapi_connection.cursor()
-    cursor.execute("PRAGMA foreign_keys=ON")
-    cursor.close()
+from movietracker.models import Actor, Genre, Movie, Series, get_alter_date_column, link_actors, movie_actor, \
+    parse_actors, series_actor
+from movietracker import schemas
+from movietracker.search import search, _search_like
+from jsonschema import ValidationError
 
 # based on "sensorhub" example database test
 @pytest.fixture
@@ -39,7 +37,7 @@ def _get_movie():
         title="The Avengers",
         uuid=get_uuid(),
         actors="Robert Downey Jr.",
-        release_date="11-04-2012",
+        release_date="2012-04-11",
         score=8.0
     )
 
@@ -48,7 +46,7 @@ def _get_series():
         title = "Breaking Bad",
         uuid=get_uuid(),
         actors = "Bryan Cranston",
-        release_date = "20-01-2008",
+        release_date = "2008-01-20",
         score = 9.5,
         seasons = 5
     )
@@ -126,13 +124,13 @@ def test_modifying_models(app):
         # modify movie
         movie.title = "Avengers: Endgame"
         movie.actors="Robert Downey Jr., Chris Evans"
-        movie.release_date="28-04-2018"
+        movie.release_date="2018-04-28"
         movie.score=9.0
 
         # modify series
         series.title = "House of Cards"
         series.actors = "Bryan Cranston, Robert Downey Jr."
-        series.release_date = "20-01-2010"
+        series.release_date = "2010-01-20"
         series.score = 9.0
         series.seasons = 7
         
@@ -148,12 +146,12 @@ def test_modifying_models(app):
         # check correctness
         assert db_movie.title == "Avengers: Endgame"
         assert db_movie.actors == "Robert Downey Jr., Chris Evans"
-        assert db_movie.release_date == "28-04-2018"
+        assert db_movie.release_date == "2018-04-28"
         assert db_movie.score == 9.0
 
         assert db_series.title == "House of Cards"
         assert db_series.actors == "Bryan Cranston, Robert Downey Jr."
-        assert db_series.release_date == "20-01-2010"
+        assert db_series.release_date == "2010-01-20"
         assert db_series.score == 9.0
         assert db_series.seasons == 7
 
@@ -249,4 +247,275 @@ def test_genre_ondelete_genre(app):
         assert db_movie.genre == None
         assert db_series.genre == None
         assert db_movie.genre_id == None
-        assert db_series.genre_id == None
\ No newline at end of file
+        assert db_series.genre_id == None
+
+def test_release_date(app):
+    """
+    Tests that release dates are stored in a date column and that only
+    valid dates are accepted.
+    """
+
+    with app.app_context():
+        columns = {column["name"]: column for column in inspect(db.engine).get_columns("movie")}
+        assert str(columns["release_date"]["type"]) == "DATE"
+
+        movie = _get_movie()
+        db.session.add(movie)
+        db.session.commit()
+        assert db.session.query(Movie.release_date).scalar() == "2012-04-11"
+        assert Movie.query.filter(Movie.release_date > "2012-01-01").count() == 1
+
+        movie.release_date = "2012-02-30"
+        with pytest.raises(StatementError):
+            db.session.commit()
+
+def _actor_names(model, links, item):
+    column = links.c[model.__tablename__ + "_id"]
+    return sorted(
+        name for name, in db.session.query(Actor.name)
+        .join(links, links.c.actor_id == Actor.id).filter(column == item.id)
+    )
+
+def test_actor_links(app):
+    """
+    Tests that movies and series are linked to the actors in their actors
+    strings and that upgrade-db links existing rows.
+    """
+
+    assert parse_actors(" A,B , ,A, C ") == ["A", "B", "C"]
+    assert parse_actors(None) == []
+
+    with app.app_context():
+        movie = _get_movie()
+        series = _get_series()
+        db.session.add(movie)
+        db.session.add(series)
+        db.session.commit()
+        assert _actor_names(Movie, movie_actor, movie) == ["Robert Downey Jr."]
+        assert _actor_names(Series, series_actor, series) == ["Bryan Cranston"]
+
+        movie.actors = "Robert Downey Jr., Chris Evans"
+        series.actors = "Bryan Cranston, Robert Downey Jr."
+        db.session.commit()
+        assert _actor_names(Movie, movie_actor, movie) == ["Chris Evans", "Robert Downey Jr."]
+        assert _actor_names(Series, series_actor, series) == ["Bryan Cranston", "Robert Downey Jr."]
+        assert Actor.query.count() == 3
+        # the actors string is kept as it was given
+        assert series.actors == "Bryan Cranston, Robert Downey Jr."
+
+        db.session.delete(movie)
+        db.session.commit()
+        assert db.session.query(movie_actor).count() == 0
+
+        db.session.execute(series_actor.delete())
+        db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["upgrade-db"])
+    assert result.exit_code == 0
+
+    with app.app_context():
+        series = Series.query.first()
+        assert _actor_names(Series, series_actor, series) == ["Bryan Cranston", "Robert Downey Jr."]
+
+def test_unlinked_actors(app):
+    """
+    Tests that actors are deleted when the last movie or series naming them
+    drops them, also when actors are set with Core statements.
+    """
+
+    with app.app_context():
+        movie = _get_movie()
+        series = _get_series()
+        movie.actors = "Robert Downey Jr., Chris Evans"
+        series.actors = "Bryan Cranston, Robert Downey Jr."
+        db.session.add(movie)
+        db.session.add(series)
+        db.session.commit()
+
+        series.actors = "Bryan Cranston"
+        db.session.commit()
+        assert Actor.query.count() == 3
+        movie.actors = "Chris Evans"
+        db.session.commit()
+        assert sorted(name for name, in db.session.query(Actor.name)) == ["Bryan Cranston", "Chris Evans"]
+
+        db.session.execute(Series.__table__.update().values(actors=None))
+        link_actors(db.session.connection(), Series, [(series.id, None)])
+        db.session.commit()
+        assert [name for name, in db.session.query(Actor.name)] == ["Chris Evans"]
+
+def test_alter_date_column():
+    """
+    Tests the statements that upgrade-db uses to change string release dates
+    to DATE columns.
+    """
+
+    assert get_alter_date_column(postgresql.dialect(), "movie", "release_date") == \
+        "ALTER TABLE movie ALTER COLUMN release_date TYPE DATE USING release_date::date"
+    assert get_alter_date_column(mysql.dialect(), "series", "release_date") == \
+        "ALTER TABLE series MODIFY release_date DATE NOT NULL"
+    assert get_alter_date_column(sqlite.dialect(), "movie", "release_date") is None
+
+def test_schema_registry():
+    """
+    Tests that schemas and validators are built only once and that the
+    validators accept valid and reject invalid documents.
+    """
+
+    for model in [Movie, Series]:
+        for method in ["post", "put"]:
+            schema = schemas.get_schema(model, method)
+            assert schema == getattr(model, "get_schema_" + method)()
+            assert schemas.get_schema(model, method) is schema
+            assert schemas.get_validator(model, method) is schemas.get_validator(model, method)
+
+    schemas.validate({"title": "a", "release_date": "2012-04-11"}, Movie, "post")
+    with pytest.raises(ValidationError):
+        schemas.validate({"title": "a", "release_date": "11-04-2012"}, Movie, "post")
+    with pytest.raises(ValidationError):
+        schemas.validate({"title": "a", "release_date": "2012-04-11"}, Movie, "put")
+    with pytest.raises(ValidationError):
+        schemas.validate({"title": "a", "release_date": "2012-02-30"}, Movie, "post")
+
+
+def test_upgrade_db(app):
+    """
+    Tests that upgrade-db creates indexes missing from a database that was
+    created before they were added to the models.
+    """
+
+    with app.app_context():
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.drop(db.engine)
+
+    result = app.test_cli_runner().invoke(args=["upgrade-db"])
+    assert result.exit_code == 0
+    assert "Created index ix_movie_genre_id_id" in result.output
+
+    with app.app_context():
+        inspector = inspect(db.engine)
+        for table in db.metadata.sorted_tables:
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            assert {index.name for index in table.indexes} <= existing
+
+    # running again doesn't fail or create anything
+    result = app.test_cli_runner().invoke(args=["upgrade-db"])
+    assert result.exit_code == 0
+    assert "Created index" not in result.output
+
+
+def test_search_index(app):
+    """
+    Tests that the search index follows changes to movies and series and that
+    upgrade-db builds it from existing rows.
+    """
+
+    with app.app_context():
+        movie = _get_movie()
+        series = _get_series()
+        db.session.add(movie)
+        db.session.add(series)
+        db.session.commit()
+        assert search("avengers", 10) == [movie]
+        assert search("bryan", 10) == [series]
+
+        movie.title = "Iron Man"
+        db.session.commit()
+        assert search("avengers", 10) == []
+        assert search("iron", 10) == [movie]
+
+        db.session.execute(text("DROP TABLE search_index"))
+        db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["upgrade-db"])
+    assert result.exit_code == 0
+
+    with app.app_context():
+        assert [item.title for item in search("iron", 10)] == ["Iron Man"]
+        assert [item.title for item in search("bryan", 10)] == ["Breaking Bad"]
+
+
+def test_search_like(app):
+    """
+    Tests that the LIKE search used on other databases matches words
+    literally and breaks ties between equal titles.
+    """
+
+    with app.app_context():
+        for title in ["100% Wolf", "1000 Ways", "100% Wolf"]:
+            movie = _get_movie()
+            movie.title = title
+            db.session.add(movie)
+        db.session.commit()
+        assert [item.title for item in _search_like("100%", 10, 0)] == ["100% Wolf", "100% Wolf"]
+        assert _search_like("1_00", 10, 0) == []
+        first, second = _search_like("wolf", 1, 0) + _search_like("wolf", 1, 1)
+        assert first.id < second.id
+
+
+def _pragmas(app, *names):
+    with app.app_context():
+        return [db.session.execute(text("PRAGMA " + name)).scalar() for name in names]
+
+def test_sqlite_pragmas(app):
+    """
+    Tests that every connection of the app gets the configured pragmas and
+    that they can be changed or left to SQLite's defaults in the config.
+    """
+
+    names = ["journal_mode", "synchronous", "busy_timeout", "foreign_keys", "mmap_size"]
+    assert _pragmas(app, *names) == ["wal", 1, 5000, 1, 256 * 2 ** 20]
+
+    db_fd, db_fname = tempfile.mkstemp()
+    other = create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + db_fname,
+        "TESTING": True,
+        "SQLITE_JOURNAL_MODE": "DELETE",
+        "SQLITE_SYNCHRONOUS": "FULL",
+        "SQLITE_FOREIGN_KEYS": False,
+        "SQLITE_MMAP_SIZE": None,
+    })
+    assert _pragmas(other, *names) == ["delete", 2, 5000, 0, 0]
+    os.close(db_fd)
+    os.unlink(db_fname)
+
+def test_engine_options():
+    """
+    Tests that pool options are only set for server databases, including
+    read replicas, and that explicit engine options are kept.
+    """
+
+    from flask import Flask
+    from movietracker.database import configure_engine
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///test.db"
+    configure_engine(app)
+    assert app.config["SQLALCHEMY_ENGINE_OPTIONS"] == {}
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "postgresql://user@localhost/movietracker"
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"pool_size": 3}
+    app.config["DATABASE_POOL_RECYCLE"] = 600
+    app.config["DATABASE_REPLICAS"] = [
+        "sqlite:///replica.db",
+        {"url": "postgresql://user@replica/movietracker", "max_overflow": 0},
+    ]
+    configure_engine(app)
+    assert app.config["SQLALCHEMY_ENGINE_OPTIONS"] == {
+        "pool_size": 3,
+        "max_overflow": 20,
+        "pool_recycle": 600,
+        "pool_pre_ping": True,
+    }
+    assert app.config["DATABASE_REPLICAS"] == [
+        {"url": "sqlite:///replica.db"},
+        {
+            "url": "postgresql://user@replica/movietracker",
+            "pool_size": 10,
+            "max_overflow": 0,
+            "pool_recycle": 600,
+            "pool_pre_ping": True,
+        },
+    ]
@@ -1,23 +1,23 @@
 import os
+import gzip
+import time
 import pytest
 import tempfile
 import json
 from jsonschema import validate
-from sqlalchemy.engine import Engine
 from sqlalchemy import event
 from movietracker import db, create_app
 from movietracker.models import *
-
-# based on "sensorhub" example resource test
-@event.listens_for(Engine, "connect")
-def set_sqlite_pragma(dbapi_connection, connection_record):
-    cursor = dbapi_connection.cursor()
-    cursor.execute("PRAGMA foreign_keys=ON")
-    cursor.close()
+from flask import url_for
+from movietracker.utils import MovieTrackerBuilder, build_url, get_uuid
+from movietracker.serializers import *
+from movietracker.caching import LRUCache, LocalClient, ResponseCache, SharedCache
+from movietracker import compression
+from movietracker.database import READ_YOUR_WRITES_COOKIE
 
 # based on "sensorhub" example resource test
 @pytest.fixture
-def client():
+def app():
     db_fd, db_fname = tempfile.mkstemp()
     config = {
         "SQLALCHEMY_DATABASE_URI": "sqlite:///" + db_fname,
@@ -30,11 +30,15 @@ def client():
         db.create_all()
         _populate_db()
 
-    yield app.test_client()
+    yield app
 
     os.close(db_fd)
     os.unlink(db_fname)
 
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
 def _populate_db():
     # add two genres to test db
     genres = ["action", "crime"]
@@ -48,7 +52,7 @@ def _populate_db():
             title="test-movie-{}".format(i),
             uuid="DWDES5GE5PtBQJGMSa7t3" + str(i),
             actors="test-actor-{}".format(i),
-            release_date="test-date-{}".format(i),
+            release_date="2000-01-0{}".format(i),
             score=i,
             genre=Genre.query.filter_by(name="action").first()
         )
@@ -56,7 +60,7 @@ def _populate_db():
             title="test-series-{}".format(i),
             uuid="638P5GEe3c8QmAtiUaYAE3" + str(i),
             actors="test-actor-{}".format(i),
-            release_date="test-date-{}".format(i),
+            release_date="2000-01-0{}".format(i),
             score=i,
             seasons=i,
             genre=Genre.query.filter_by(name="action").first()
@@ -111,6 +115,59 @@ def _get_series_json(method, number=1):
         }
     return series_json
 
+def _count_queries(app, url, headers=None, status_code=200):
+    """
+    Makes a GET request to the given URL and returns the number of SQL
+    statements executed while serving it.
+    """
+
+    return len(_capture_queries(app, url, headers, status_code))
+
+def _capture_queries(app, url, headers=None, status_code=200):
+    """
+    Makes a GET request to the given URL and returns the SQL statements
+    executed while serving it.
+    """
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        resp = app.test_client().get(url, headers=headers)
+        assert resp.status_code == status_code
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    return statements
+
+def _add_items(count):
+    """
+    Adds given number of extra movies and series to the "crime" genre and
+    the same number of movies and series each in a new genre of their own.
+    """
+
+    crime = Genre.query.filter_by(name="crime").first()
+    for _ in range(count):
+        db_genre = Genre(name=get_uuid())
+        for genre in [crime, db_genre]:
+            db.session.add(Movie(
+                title="extra-movie",
+                uuid=get_uuid(),
+                release_date="2000-01-01",
+                genre=genre
+            ))
+            db.session.add(Series(
+                title="extra-series",
+                uuid=get_uuid(),
+                release_date="2000-01-01",
+                genre=genre
+            ))
+    db.session.commit()
+
 # From "sensorhub" example
 def _check_namespace(client, response):
     """
@@ -202,6 +259,851 @@ def _check_control_post_method(ctrl, client, obj, item_type):
     assert resp.status_code == 201
 
 
+class TestQueryCount(object):
+
+    URLS = [
+        "/api/movies/",
+        "/api/series/",
+        "/api/genres/",
+        "/api/genres/crime/movies/",
+        "/api/genres/crime/series/",
+    ]
+
+    def test_collections(self, app):
+        """
+        Checks that the number of SQL statements per collection request
+        doesn't grow with the number of items in the collection.
+        """
+
+        with app.app_context():
+            _add_items(1)
+        counts = [_count_queries(app, url) for url in self.URLS]
+        with app.app_context():
+            _add_items(10)
+        assert [_count_queries(app, url) for url in self.URLS] == counts
+
+    def test_no_entities(self, client):
+        """
+        Checks that movie and series listings are built from rows without
+        loading ORM objects.
+        """
+
+        loaded = []
+
+        def count(target, context):
+            loaded.append(target)
+
+        for model in [Movie, Series]:
+            event.listen(model, "load", count)
+        try:
+            for url in self.URLS + ["/api/movies/export/", "/api/series/export/"]:
+                resp = client.get(url)
+                assert resp.status_code == 200
+                resp.close()
+        finally:
+            for model in [Movie, Series]:
+                event.remove(model, "load", count)
+        assert loaded == []
+
+
+class TestGenreCache(object):
+
+    URLS = [
+        "/api/movies/DWDES5GE5PtBQJGMSa7t31/",
+        "/api/series/638P5GEe3c8QmAtiUaYAE31/",
+        "/api/genres/crime/",
+        "/api/genres/crime/movies/",
+        "/api/genres/crime/series/",
+    ]
+
+    def test_no_lookups(self, app):
+        """
+        Checks that once the genre cache is loaded, genre names and ids are
+        not looked up from the database.
+        """
+
+        app.config["RESPONSE_CACHE_ENABLED"] = False
+        _count_queries(app, "/api/genres/crime/movies/")
+        for url in self.URLS:
+            statements = _capture_queries(app, url)
+            assert not [s for s in statements if "FROM genre" in s]
+        with app.app_context():
+            assert app.extensions["genre_cache"].loads == 1
+
+    def test_writes(self, app, client):
+        """
+        Checks that writes of movies and series resolve genres from the
+        cache without reading the version counters, and reload it only for
+        a genre that isn't found.
+        """
+
+        client.get("/api/genres/crime/movies/")
+        movie_json = _get_movie_json("put")
+        movie_json["genre"] = "crime"
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, "before_cursor_execute", capture)
+        try:
+            resp = client.put("/api/movies/DWDES5GE5PtBQJGMSa7t31/", json=movie_json)
+            assert resp.status_code == 204
+        finally:
+            event.remove(engine, "before_cursor_execute", capture)
+        assert not [s for s in statements if s.startswith("SELECT") and "table_version" in s]
+        assert app.extensions["genre_cache"].loads == 1
+
+        # a genre added by another process is found
+        with app.app_context():
+            db.session.execute(Genre.__table__.insert().values(name="drama"))
+            db.session.commit()
+        movie_json["genre"] = "drama"
+        resp = client.put("/api/movies/DWDES5GE5PtBQJGMSa7t31/", json=movie_json)
+        assert resp.status_code == 204
+        movie_json["genre"] = "western"
+        resp = client.put("/api/movies/DWDES5GE5PtBQJGMSa7t31/", json=movie_json)
+        assert resp.status_code == 400
+        assert client.get("/api/genres/drama/movies/").get_json()["items"][0]["title"] == "extra-movie-1"
+        assert app.extensions["genre_cache"].loads == 3
+
+    def test_reload(self, app, client):
+        """
+        Checks that the cache is reloaded when genres change.
+        """
+
+        assert client.get("/api/genres/drama/").status_code == 404
+        with app.app_context():
+            db.session.add(Genre(name="drama"))
+            db.session.commit()
+        assert client.get("/api/genres/drama/").status_code == 200
+        with app.app_context():
+            Genre.query.filter_by(name="drama").first().name = "thriller"
+            db.session.commit()
+        assert client.get("/api/genres/drama/").status_code == 404
+        assert client.get("/api/genres/thriller/").status_code == 200
+        assert app.extensions["genre_cache"].loads == 3
+
+
+class TestConditionalGet(object):
+
+    URLS = [
+        "/api/",
+        "/api/genres/",
+        "/api/genres/action/",
+        "/api/genres/action/movies/",
+        "/api/genres/action/series/",
+        "/api/movies/",
+        "/api/movies/?limit=1",
+        "/api/movies/export/",
+        "/api/movies/DWDES5GE5PtBQJGMSa7t31/",
+        "/api/series/",
+        "/api/series/export/",
+        "/api/series/638P5GEe3c8QmAtiUaYAE31/",
+    ]
+
+    def _get_etags(self, client):
+        etags = {}
+        for url in self.URLS:
+            resp = client.get(url)
+            assert resp.status_code == 200
+            etag, weak = resp.get_etag()
+            assert etag and not weak
+            etags[url] = etag
+            # streamed responses keep the request context until closed
+            resp.close()
+        return etags
+
+    def test_not_modified(self, app, client):
+        etags = self._get_etags(client)
+        assert len(set(etags.values())) == len(self.URLS)
+        for url, etag in etags.items():
+            # only the table versions are read, no rows
+            headers = {"If-None-Match": '"{}"'.format(etag)}
+            assert _count_queries(app, url, headers, 304) == 1
+            resp = client.get(url, headers=headers)
+            assert resp.get_etag()[0] == etag
+            assert resp.data == b""
+            # other ETags get the full response
+            resp = client.get(url, headers={"If-None-Match": '"other"'})
+            assert resp.status_code == 200
+            resp.close()
+
+        # errors don't get an ETag
+        resp = client.get("/api/movies/invalid-movie/")
+        assert resp.status_code == 404
+        assert resp.get_etag() == (None, None)
+
+    def test_modified(self, client):
+        etags = self._get_etags(client)
+        body = _get_movie_json("put")
+        resp = client.put("/api/movies/DWDES5GE5PtBQJGMSa7t31/", json=body)
+        assert resp.status_code == 204
+        changed = self._get_etags(client)
+        for url in self.URLS:
+            if "movies" in url:
+                assert changed[url] != etags[url]
+            else:
+                assert changed[url] == etags[url]
+
+        # bulk import changes series
+        resp = client.post("/api/series/bulk/", json=[_get_series_json("put")])
+        assert json.loads(resp.data)["created"] == 1
+        etags = changed
+        changed = self._get_etags(client)
+        for url in self.URLS:
+            if "series" in url:
+                assert changed[url] != etags[url]
+            else:
+                assert changed[url] == etags[url]
+
+
+class TestResponseCache(object):
+
+    URLS = [
+        "/api/genres/",
+        "/api/genres/action/movies/",
+        "/api/genres/action/series/",
+        "/api/movies/",
+        "/api/series/",
+    ]
+
+    def _check_cache(self, client, expected):
+        for url in self.URLS:
+            resp = client.get(url)
+            assert resp.status_code == 200
+            assert resp.headers["X-Cache"] == expected.get(url, "HIT")
+
+    def test_lru_cache(self):
+        cache = LRUCache(max_entries=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        assert cache.get("a") == 1
+        cache.set("c", 3)
+        # b was least recently used
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.evictions == 1
+        cache.ttl = -1
+        cache.set("d", 4)
+        assert cache.get("d") is None
+        assert cache.expirations == 1
+
+    def test_generations(self):
+        cache = ResponseCache(LRUCache())
+        cache.set("/api/movies/", "", {"etag": "1", "body": b"a"})
+        cache.set("/api/movies/", "limit=1", {"etag": "1", "body": b"b"})
+        cache.set("/api/series/", "", {"etag": "1", "body": b"c"})
+        cache.invalidate("/api/movies/")
+        assert cache.get("/api/movies/", "", "1") is None
+        assert cache.get("/api/movies/", "limit=1", "1") is None
+        assert cache.get("/api/series/", "", "1")["body"] == b"c"
+        # entries of an older version are misses
+        assert cache.get("/api/series/", "", "2") is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 3
+
+    def test_invalidation(self, app, client):
+        self._check_cache(client, {url: "MISS" for url in self.URLS})
+        self._check_cache(client, {})
+        cached = client.get("/api/movies/").data
+
+        # adding a movie invalidates only movie listings
+        resp = client.post("/api/genres/action/movies/", json=_get_movie_json("post"))
+        assert resp.status_code == 201
+        self._check_cache(client, {"/api/movies/": "MISS", "/api/genres/action/movies/": "MISS"})
+        assert client.get("/api/movies/").data != cached
+
+        # moving a series to another genre invalidates both genres
+        client.get("/api/genres/crime/series/")
+        body = _get_series_json("put")
+        body["genre"] = "crime"
+        resp = client.put("/api/series/638P5GEe3c8QmAtiUaYAE31/", json=body)
+        assert resp.status_code == 204
+        assert client.get("/api/genres/crime/series/").headers["X-Cache"] == "MISS"
+        self._check_cache(client, {"/api/series/": "MISS", "/api/genres/action/series/": "MISS"})
+
+        # all query strings of a path are invalidated
+        client.get("/api/series/?limit=1")
+        resp = client.delete("/api/series/638P5GEe3c8QmAtiUaYAE31/")
+        assert resp.status_code == 204
+        assert client.get("/api/series/?limit=1").headers["X-Cache"] == "MISS"
+
+        stats = json.loads(client.get("/api/_cache/").data)
+        assert stats["hits"] > 0
+        assert stats["misses"] > 0
+        assert stats["evictions"] == 0
+
+    def test_changed_elsewhere(self, app, client):
+        # changes that don't go through the API are detected from the ETag
+        self._check_cache(client, {url: "MISS" for url in self.URLS})
+        hits = json.loads(client.get("/api/_cache/").data)["hits"]
+        with app.app_context():
+            Movie.query.first().title = "changed"
+            db.session.commit()
+        self._check_cache(client, {"/api/movies/": "MISS", "/api/genres/action/movies/": "MISS"})
+        # stale entries are counted as misses
+        assert json.loads(client.get("/api/_cache/").data)["hits"] == hits + len(self.URLS) - 2
+        assert json.loads(client.get("/api/movies/").data)["items"][0]["title"] == "changed"
+
+    def test_shared_backend(self, app, client):
+        app.extensions["response_cache"] = ResponseCache(SharedCache(LocalClient()))
+        self._check_cache(client, {url: "MISS" for url in self.URLS})
+        self._check_cache(client, {})
+        resp = client.delete("/api/movies/DWDES5GE5PtBQJGMSa7t31/")
+        assert resp.status_code == 204
+        self._check_cache(client, {"/api/movies/": "MISS", "/api/genres/action/movies/": "MISS"})
+        stats = json.loads(client.get("/api/_cache/").data)
+        assert stats["hits"] > 0
+        assert "evictions" not in stats
+
+    def test_errors_not_cached(self, client):
+        resp = client.get("/api/genres/nonexistent/movies/")
+        assert resp.status_code == 404
+        assert "X-Cache" not in resp.headers
+        resp = client.get("/api/movies/?min_score=abc")
+        assert resp.status_code == 400
+        assert "X-Cache" not in resp.headers
+
+
+class TestReadReplicas(object):
+
+    @pytest.fixture
+    def replica_app(self, app):
+        # an empty database stands in for a replica that lags behind
+        db_fd, db_fname = tempfile.mkstemp()
+        def create(**config):
+            replica_app = create_app(dict(
+                SQLALCHEMY_DATABASE_URI=app.config["SQLALCHEMY_DATABASE_URI"],
+                DATABASE_REPLICAS=["sqlite:///" + db_fname],
+                TESTING=True,
+                **config
+            ))
+            with replica_app.app_context():
+                db.metadata.create_all(replica_app.extensions["db_replicas"][0])
+            return replica_app
+        yield create
+        os.close(db_fd)
+        os.unlink(db_fname)
+
+    def test_routing(self, replica_app):
+        client = replica_app().test_client()
+        assert json.loads(client.get("/api/movies/").data)["items"] == []
+        assert client.get("/api/genres/action/").status_code == 404
+
+        # writes go to the primary
+        resp = client.put("/api/movies/DWDES5GE5PtBQJGMSa7t31/", json=_get_movie_json("put"))
+        assert resp.status_code == 204
+        assert READ_YOUR_WRITES_COOKIE in resp.headers["Set-Cookie"]
+
+    def test_read_your_writes(self, replica_app):
+        app = replica_app()
+        client = app.test_client()
+        resp = client.post("/api/genres/action/movies/", json=_get_movie_json("post"))
+        assert resp.status_code == 201
+        assert client.get(resp.headers["Location"]).status_code == 200
+        assert len(json.loads(client.get("/api/movies/").data)["items"]) == 3
+
+        # other clients and expired windows read from the replica
+        assert app.test_client().get(resp.headers["Location"]).status_code == 404
+        client.set_cookie(READ_YOUR_WRITES_COOKIE, "0", path="/api/")
+        assert client.get(resp.headers["Location"]).status_code == 404
+
+    def test_genre_cache(self, replica_app):
+        """
+        Checks that the primary and the replica have genre maps of their own
+        that aren't reloaded when requests alternate between them.
+        """
+
+        app = replica_app()
+        primary = app.test_client()
+        primary.set_cookie(READ_YOUR_WRITES_COOKIE, str(time.time() + 60), path="/api/")
+        replica = app.test_client()
+        for _ in range(3):
+            assert primary.get("/api/genres/action/").status_code == 200
+            assert replica.get("/api/genres/action/").status_code == 404
+        assert app.extensions["genre_cache"].loads == 2
+
+    def test_disabled(self, replica_app):
+        client = replica_app(DATABASE_READ_YOUR_WRITES=0).test_client()
+        resp = client.post("/api/genres/action/movies/", json=_get_movie_json("post"))
+        assert resp.status_code == 201
+        assert "Set-Cookie" not in resp.headers
+        assert client.get(resp.headers["Location"]).status_code == 404
+
+
+class TestCompression(object):
+
+    GZIP = {"Accept-Encoding": "gzip"}
+
+    def _compressing_client(self, app, **config):
+        config.setdefault("COMPRESSION_MIN_SIZE", 0)
+        return create_app(dict(
+            SQLALCHEMY_DATABASE_URI=app.config["SQLALCHEMY_DATABASE_URI"],
+            TESTING=True,
+            **config
+        )).test_client()
+
+    def test_gzip(self, app):
+        client = self._compressing_client(app)
+        plain = client.get("/api/movies/")
+        assert "Content-Encoding" not in plain.headers
+        assert "Accept-Encoding" in plain.headers["Vary"]
+
+        resp = client.get("/api/movies/?limit=5", headers=self.GZIP)
+        assert resp.status_code == 200
+        assert resp.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in resp.headers["Vary"]
+        assert resp.headers["ETag"].startswith("W/")
+        assert json.loads(gzip.decompress(resp.data)) == json.loads(client.get("/api/movies/?limit=5").data)
+
+        resp = client.get("/api/movies/", headers={"Accept-Encoding": "gzip;q=0, identity"})
+        assert "Content-Encoding" not in resp.headers
+
+    def test_min_size(self, app):
+        client = self._compressing_client(app, COMPRESSION_MIN_SIZE=10 ** 6)
+        resp = client.get("/api/movies/", headers=self.GZIP)
+        assert "Content-Encoding" not in resp.headers
+        client = self._compressing_client(app, COMPRESSION_ENABLED=False)
+        resp = client.get("/api/movies/", headers=self.GZIP)
+        assert "Content-Encoding" not in resp.headers
+
+    def test_errors(self, app):
+        client = self._compressing_client(app)
+        resp = client.get("/api/movies/nonexistent/", headers=self.GZIP)
+        assert resp.status_code == 404
+        assert "Content-Encoding" not in resp.headers
+        json.loads(resp.data)
+
+    def test_streamed(self, app):
+        client = self._compressing_client(app)
+        resp = client.get("/api/movies/export/", headers=self.GZIP)
+        assert resp.is_streamed
+        assert resp.headers["Content-Encoding"] == "gzip"
+        assert "Content-Length" not in resp.headers
+        body = json.loads(gzip.decompress(resp.data))
+        resp.close()
+        assert len(body["items"]) == 2
+
+    def test_cached_variants(self, app, monkeypatch):
+        client = self._compressing_client(app)
+        calls = []
+        original = compression.compress
+        monkeypatch.setattr(compression, "compress", lambda data, encoding: calls.append(encoding) or original(data, encoding))
+
+        first = client.get("/api/movies/", headers=self.GZIP)
+        assert first.headers["X-Cache"] == "MISS"
+        second = client.get("/api/movies/", headers=self.GZIP)
+        assert second.headers["X-Cache"] == "HIT"
+        assert second.headers["Content-Encoding"] == "gzip"
+        assert second.data == first.data
+        assert calls == ["gzip"]
+
+        # uncompressed hits are served from the same entry
+        plain = client.get("/api/movies/")
+        assert plain.headers["X-Cache"] == "HIT"
+        assert gzip.decompress(first.data) == plain.data
+        assert calls == ["gzip"]
+
+    def test_conditional(self, app):
+        client = self._compressing_client(app)
+        resp = client.get("/api/movies/", headers=self.GZIP)
+        etag = resp.headers["ETag"]
+        resp = client.get("/api/movies/", headers=dict(self.GZIP, **{"If-None-Match": etag}))
+        assert resp.status_code == 304
+        resp = client.get("/api/movies/", headers={"If-None-Match": etag})
+        assert resp.status_code == 304
+
+    def test_brotli(self, app):
+        brotli = pytest.importorskip("brotli")
+        client = self._compressing_client(app)
+        resp = client.get("/api/movies/", headers={"Accept-Encoding": "gzip, br"})
+        assert resp.headers["Content-Encoding"] == "br"
+        assert json.loads(brotli.decompress(resp.data)) == json.loads(client.get("/api/movies/").data)
+
+
+class TestInstrumentation(object):
+
+    def _instrumented_app(self, app):
+        return create_app({
+            "SQLALCHEMY_DATABASE_URI": app.config["SQLALCHEMY_DATABASE_URI"],
+            "TESTING": True,
+            "INSTRUMENTATION_ENABLED": True
+        })
+
+    def test_disabled(self, client):
+        resp = client.get("/api/movies/")
+        assert "Server-Timing" not in resp.headers
+        resp = client.get("/api/_metrics")
+        assert resp.status_code == 404
+
+    def test_server_timing(self, app):
+        client = self._instrumented_app(app).test_client()
+        resp = client.get("/api/movies/")
+        assert resp.status_code == 200
+        timings = dict(
+            part.strip().split(";", 1) for part in resp.headers["Server-Timing"].split(",")
+        )
+        assert set(timings) == {"db", "serialize", "total"}
+        expected = _count_queries(app, "/api/movies/")
+        assert '"{} queries"'.format(expected) in timings["db"]
+
+    def test_metrics(self, app):
+        client = self._instrumented_app(app).test_client()
+        client.get("/api/movies/")
+        client.get("/api/movies/")
+        client.get("/api/movies/nonexistent/")
+        resp = client.get("/api/_metrics")
+        assert resp.status_code == 200
+        assert resp.mimetype == "text/plain"
+        lines = resp.data.decode("utf-8").splitlines()
+        assert 'movietracker_requests_total{endpoint="api.moviecollection",method="GET",status="200"} 2' in lines
+        assert 'movietracker_requests_total{endpoint="api.movieitem",method="GET",status="404"} 1' in lines
+        assert 'movietracker_request_duration_seconds_count{endpoint="api.moviecollection",method="GET"} 2' in lines
+        assert 'movietracker_request_duration_seconds_bucket{endpoint="api.moviecollection",method="GET",le="+Inf"} 2' in lines
+        assert 'movietracker_response_cache_hits_total 1' in lines
+        for name in ["sql_statements", "sql_duration_seconds", "serialization_duration_seconds", "response_bytes"]:
+            assert "# TYPE movietracker_{}_total counter".format(name) in lines
+
+
+class TestSerializers(object):
+
+    VALUES = [
+        "plain", "Ünïcödé \"quoted\" \\ \n\t ☃ %s", "", None, True, False,
+        0, -7, 2 ** 70, 1.5, 1e20, -0.0, 1 / 3, float("nan"), float("inf")
+    ]
+
+    def test_encode_value(self):
+        for value in self.VALUES:
+            assert encode_value(value) == json.dumps(value)
+
+    def test_identical_output(self):
+        for value in self.VALUES:
+            values = (value, "actor", "2001-01-01", value, 3, "genre %d")
+            builder = MovieTrackerBuilder(**dict(zip(SERIES_FIELDS, values)))
+            builder.add_control("self", "/api/series/%s/")
+            builder.add_control("profile", SERIES_PROFILE)
+            assert series_serializer.encode(values, "/api/series/%s/") == json.dumps(builder)
+
+        body = MovieTrackerBuilder(name="x")
+        body.add_control("self", "/api/genres/")
+        items = [genre_serializer.encode(("a",), "/a/"), genre_serializer.encode(("b",), "/b/")]
+        expected = dict(body, items=[json.loads(item) for item in items])
+        assert encode_collection(body, items) == json.dumps(expected)
+        assert "".join(stream_collection(body, iter(items), batch_size=1)) == json.dumps(expected)
+        assert encode_collection(MovieTrackerBuilder(), []) == json.dumps({"items": []})
+
+
+class TestURLTemplates(object):
+
+    VALUES = ["action", "sci fi", "a/b", "Ünïcödé", "50%", "?#&=+", "DWDES5GE5PtBQJGMSa7t31"]
+
+    def test_equivalence(self, app):
+        rules = [rule for rule in app.url_map.iter_rules() if rule.endpoint.startswith("api.")]
+        assert len(rules) == 16
+        for base_url in ["http://localhost/", "http://localhost/prefix/"]:
+            with app.test_request_context(base_url=base_url):
+                for rule in rules:
+                    for value in self.VALUES:
+                        values = {name: value for name in rule.arguments}
+                        assert build_url(rule.endpoint, **values) == url_for(rule.endpoint, **values)
+                    # extra values go to the query string like with url_for
+                    values["q"] = "a b"
+                    assert build_url(rule.endpoint, **values) == url_for(rule.endpoint, **values)
+
+
+class TestFiltering(object):
+
+    URLS = ["/api/movies/", "/api/genres/action/movies/"]
+
+    def _add_movies(self):
+        db_genre = Genre.query.filter_by(name="action").first()
+        movies = [
+            ("a", None, "2001-01-01", "Keanu Reeves"),
+            ("b", 5.0, "2001-01-01", "Carrie-Anne Moss, Keanu Reeves"),
+            ("c", 5.0, "1999-03-31", "Laurence Fishburne"),
+            ("d", 7.5, "2003-11-05", None),
+            ("e", None, "1999-03-31", "100%_literal"),
+            ("f", 5.0, "2003-11-05", "Keanu Reeves"),
+        ]
+        for title, score, release_date, actors in movies:
+            db.session.add(Movie(
+                title=title,
+                uuid=get_uuid(),
+                actors=actors,
+                release_date=release_date,
+                score=score,
+                genre=db_genre
+            ))
+        db.session.commit()
+
+    def _walk(self, client, url):
+        titles = []
+        while url:
+            resp = client.get(url)
+            assert resp.status_code == 200
+            body = json.loads(resp.data)
+            titles.extend(item["title"] for item in body["items"])
+            url = body["@controls"].get("next", {}).get("href")
+        # walk back to the start from the last page
+        back = [item["title"] for item in body["items"]]
+        while "prev" in body["@controls"]:
+            body = json.loads(client.get(body["@controls"]["prev"]["href"]).data)
+            back = [item["title"] for item in body["items"]] + back
+        assert back == titles
+        return titles
+
+    def test_sort(self, app, client):
+        with app.app_context():
+            self._add_movies()
+            rows = [
+                {"id": m.id, "title": m.title, "score": m.score, "release_date": m.release_date}
+                for m in Movie.query.all()
+            ]
+
+        for sort in ["score", "-score", "score,-release_date", "-release_date,title", "-title"]:
+            # NULL sorts as the smallest value and id breaks ties
+            expected = sorted(rows, key=lambda row: row["id"])
+            for field in reversed(sort.split(",")):
+                name = field.lstrip("-")
+                expected.sort(
+                    key=lambda row: (row[name] is not None, row[name] or 0),
+                    reverse=field.startswith("-")
+                )
+            expected = [row["title"] for row in expected]
+            for url in self.URLS:
+                for limit in [1, 2, 3, 100]:
+                    found = self._walk(client, "{}?sort={}&limit={}".format(url, sort, limit))
+                    assert found == expected
+
+    def test_filter(self, app, client):
+        with app.app_context():
+            self._add_movies()
+
+        for url in self.URLS:
+            body = json.loads(client.get(url).data)
+            ctrl = body["@controls"]["mt:filter"]
+            assert ctrl["isHrefTemplate"]
+            assert ctrl["method"] == "GET"
+            assert ctrl["href"].startswith(url + "{?")
+            assert "min_score" in ctrl["schema"]["properties"]
+
+            assert self._walk(client, url + "?min_score=5&sort=title") == ["b", "c", "d", "f"]
+            assert self._walk(client, url + "?min_score=5&max_score=6&sort=title") == ["b", "c", "f"]
+            assert self._walk(client, url + "?released_after=2001-01-01&released_before=2002-01-01&sort=title") == ["a", "b"]
+            assert self._walk(client, url + "?actor=keanu&sort=-title&limit=1") == ["f", "b", "a"]
+            assert self._walk(client, url + "?actor=%25_&sort=title") == ["e"]
+
+            for query in ["?min_score=abc", "?released_after=2001", "?released_after=2001-02-30",
+                          "?sort=actors", "?sort=-uuid", "?sort=release_date&after=WyJib2d1cyIsMV0",
+                          "?sort=score&after=W3siYSI6MX0sMV0", "?sort=release_date&after=WzUsMV0"]:
+                resp = client.get(url + query)
+                assert resp.status_code == 400
+
+    def test_actor_links(self, app, client):
+        """
+        Checks that the actor filter finds items through the actor links and
+        that the links follow changes made through the API.
+        """
+
+        with app.app_context():
+            self._add_movies()
+            uuid = Movie.query.filter_by(title="d").first().uuid
+        statements = _capture_queries(app, "/api/movies/?actor=keanu")
+        listing = [statement for statement in statements if "FROM movie" in statement]
+        assert "movie_actor" in listing[0]
+        assert "movie.actors LIKE" not in listing[0]
+
+        url = "/api/movies/{}/".format(uuid)
+        movie_json = _get_movie_json("put")
+        movie_json["actors"] = "Keanu Reeves, Hugo Weaving"
+        assert client.put(url, json=movie_json).status_code == 204
+        assert self._walk(client, "/api/movies/?actor=keanu&sort=title") == ["a", "b", "extra-movie-1", "f"]
+        assert self._walk(client, "/api/movies/?actor=hugo") == ["extra-movie-1"]
+
+        resp = client.patch(url, data=json.dumps({"actors": "Hugo Weaving"}), content_type=MERGE_PATCH)
+        assert resp.status_code == 204
+        assert self._walk(client, "/api/movies/?actor=keanu&sort=title") == ["a", "b", "f"]
+
+        resp = client.put("/api/movies/batch/", json={"filter": {"actor": "hugo"}, "patch": {"actors": None}})
+        assert resp.status_code == 200
+        assert self._walk(client, "/api/movies/?actor=hugo") == []
+
+        assert client.delete("/api/movies/batch/", json={"filter": {"actor": "keanu"}}).status_code == 200
+        with app.app_context():
+            assert db.session.query(movie_actor).count() == 4
+
+
+class TestFieldsets(object):
+
+    URLS = [
+        "/api/movies/",
+        "/api/series/",
+        "/api/genres/action/movies/",
+        "/api/genres/action/series/",
+    ]
+
+    def test_fields(self, client):
+        for url in self.URLS:
+            body = json.loads(client.get(url + "?fields=score,title").data)
+            assert "mt:filter" in body["@controls"]
+            for item in body["items"]:
+                assert list(item) == ["title", "score", "@controls"]
+                assert client.get(item["@controls"]["self"]["href"]).status_code == 200
+
+            body = json.loads(client.get(url + "?fields=title&controls=none").data)
+            assert body["items"]
+            for item in body["items"]:
+                assert list(item) == ["title"]
+
+        body = json.loads(client.get("/api/genres/?controls=none").data)
+        assert body["items"] == [{"name": "action"}, {"name": "crime"}]
+        body = json.loads(client.get("/api/genres/?fields=name").data)
+        assert body["items"][0]["@controls"]["self"]["href"] == "/api/genres/action/"
+
+    def test_pagination(self, client):
+        # sort keys that are not among the fields are still used for cursors
+        body = json.loads(client.get("/api/series/?fields=title&controls=none&sort=-score&limit=1").data)
+        titles = [item["title"] for item in body["items"]]
+        body = json.loads(client.get(body["@controls"]["next"]["href"]).data)
+        titles += [item["title"] for item in body["items"]]
+        assert titles == ["test-series-2", "test-series-1"]
+
+    def test_projection(self, app):
+        statements = _capture_queries(app, "/api/movies/?fields=title&controls=none")
+        listing = [statement for statement in statements if "FROM movie" in statement]
+        assert len(listing) == 1
+        assert "movie.actors" not in listing[0]
+        assert "movie.uuid" not in listing[0]
+        assert "JOIN genre" not in listing[0]
+
+    def test_invalid(self, client):
+        for url in self.URLS + ["/api/genres/"]:
+            for query in ["?fields=bogus", "?fields=", "?controls=some"]:
+                resp = client.get(url + query)
+                assert resp.status_code == 400
+
+
+class TestSearch(object):
+
+    RESOURCE_URL = "/api/search/"
+
+    def _search(self, client, query):
+        resp = client.get(self.RESOURCE_URL, query_string={"q": query})
+        assert resp.status_code == 200
+        return json.loads(resp.data)
+
+    def test_get(self, client):
+        movie = _get_movie_json("post")
+        movie["title"] = "The Avengers"
+        movie["actors"] = "Robert Downey Jr., Chris Evans"
+        resp = client.post("/api/genres/action/movies/", json=movie)
+        movie_url = resp.headers["Location"]
+        series = _get_series_json("post")
+        series["title"] = "Ally McBeal"
+        series["actors"] = "Robert Downey Jr."
+        client.post("/api/genres/crime/series/", json=series)
+
+        # entry point advertises search
+        body = json.loads(client.get("/api/").data)
+        ctrl = body["@controls"]["mt:search"]
+        assert ctrl["isHrefTemplate"]
+        assert ctrl["href"] == self.RESOURCE_URL + "{?q}"
+
+        # items look like collection items
+        body = self._search(client, "downey")
+        _check_namespace(client, body)
+        _check_control_get_method("self", client, body)
+        assert sorted(item["title"] for item in body["items"]) == ["Ally McBeal", "The Avengers"]
+        for item in body["items"]:
+            assert "actors" in item
+            assert "release_date" in item
+            assert "score" in item
+            assert "genre" in item
+            _check_control_get_method("self", client, item)
+            _check_control_get_method("profile", client, item)
+        series_item = [item for item in body["items"] if item["title"] == "Ally McBeal"][0]
+        assert series_item["seasons"] == 1
+        assert series_item["genre"] == "crime"
+
+        # all words must match, prefixes match too
+        assert [item["title"] for item in self._search(client, "aveng robert")["items"]] == ["The Avengers"]
+        assert self._search(client, "avengers ally")["items"] == []
+        # FTS syntax is taken literally
+        assert self._search(client, 'avengers OR "ally')["items"] == []
+
+        # index follows changes
+        movie = _get_movie_json("put")
+        movie["title"] = "Iron Man"
+        movie["actors"] = "Robert Downey Jr."
+        client.put(movie_url, json=movie)
+        assert self._search(client, "avengers")["items"] == []
+        assert [item["title"] for item in self._search(client, "iron")["items"]] == ["Iron Man"]
+        client.delete(movie_url)
+        assert self._search(client, "iron")["items"] == []
+
+        # bulk imports are indexed as well
+        movie["title"] = "Sherlock Holmes"
+        client.post("/api/movies/bulk/", json=[movie])
+        assert [item["title"] for item in self._search(client, "sherlock")["items"]] == ["Sherlock Holmes"]
+
+    def test_pagination(self, client):
+        titles = []
+        body = self._search(client, "test")
+        expected = [item["title"] for item in body["items"]]
+        assert len(expected) == 4
+        resp = client.get(self.RESOURCE_URL + "?q=test&limit=1")
+        body = json.loads(resp.data)
+        assert "prev" not in body["@controls"]
+        titles.append(body["items"][0]["title"])
+        while "next" in body["@controls"]:
+            body = json.loads(client.get(body["@controls"]["next"]["href"]).data)
+            titles.append(body["items"][0]["title"])
+        assert titles == expected
+        body = json.loads(client.get(body["@controls"]["prev"]["href"]).data)
+        assert body["items"][0]["title"] == expected[-2]
+
+        # W3RydWVd is [true] which isn't an offset
+        for query in ["", "?q=", "?q=test&limit=0", "?q=test&after=invalid", "?q=test&after=W3RydWVd"]:
+            resp = client.get(self.RESOURCE_URL + query)
+            assert resp.status_code == 400
+
+
+def _check_pagination(client, url, attr, expected):
+    """
+    Walks through a collection one item per page following "next" controls
+    and back again following "prev" controls. Checks that items come in the
+    expected order and that invalid paging parameters are rejected.
+    """
+
+    resp = client.get(url + "?limit=1")
+    assert resp.status_code == 200
+    body = json.loads(resp.data)
+    assert "prev" not in body["@controls"]
+    found = [body["items"][0][attr]]
+    while "next" in body["@controls"]:
+        assert body["@controls"]["next"]["method"] == "GET"
+        body = json.loads(client.get(body["@controls"]["next"]["href"]).data)
+        assert len(body["items"]) == 1
+        found.append(body["items"][0][attr])
+    assert found == expected
+
+    found = [body["items"][0][attr]]
+    while "prev" in body["@controls"]:
+        body = json.loads(client.get(body["@controls"]["prev"]["href"]).data)
+        found.insert(0, body["items"][0][attr])
+    assert found == expected
+
+    # test invalid parameters
+    # the cursors hold [{"a": 1}], [[1]] and [true]
+    for query in ["?limit=0", "?limit=abc", "?after=invalid", "?after=WzFd&before=WzFd",
+                  "?after=W3siYSI6MX1d", "?before=W1sxXV0", "?after=W3RydWVd"]:
+        resp = client.get(url + query)
+        assert resp.status_code == 400
+
+
 class TestEntryPoint(object):
 
     RESOURCE_URL = "/api/"
@@ -214,6 +1116,105 @@ class TestEntryPoint(object):
         _check_control_get_method("mt:all-series", client, body)
         _check_control_get_method("mt:all-movies", client, body)
         _check_control_get_method("mt:all-genres", client, body)
+        ctrl = body["@controls"]["mt:filmography"]
+        assert ctrl["isHrefTemplate"]
+        assert client.get(ctrl["href"].format(actor="test-actor-1")).status_code == 200
+
+
+class TestActorItem(object):
+
+    RESOURCE_URL = "/api/actors/test-actor-1/"
+
+    def _titles(self, client, url):
+        titles = []
+        while url:
+            body = json.loads(client.get(url).data)
+            titles.extend(item["title"] for item in body["items"])
+            url = body["@controls"].get("next", {}).get("href")
+        return titles
+
+    def test_get(self, client):
+        resp = client.get(self.RESOURCE_URL)
+        assert resp.status_code == 200
+        body = json.loads(resp.data)
+        assert body["name"] == "test-actor-1"
+        _check_namespace(client, body)
+        _check_control_get_method("self", client, body)
+        _check_control_get_method("mt:all-movies", client, body)
+        _check_control_get_method("mt:all-series", client, body)
+        movie, series = body["items"]
+        assert movie["title"] == "test-movie-1"
+        assert movie["@controls"]["profile"]["href"] == MOVIE_PROFILE
+        assert series["title"] == "test-series-1"
+        assert series["seasons"] == 1
+        assert series["genre"] == "action"
+        # items are the same as in the collections
+        body = json.loads(client.get("/api/series/").data)
+        assert series == body["items"][0]
+
+        resp = client.get("/api/actors/nobody/")
+        assert resp.status_code == 404
+        resp = client.get(self.RESOURCE_URL + "?limit=0")
+        assert resp.status_code == 400
+        # the release date of the cursor [5, "movie", 1] isn't a string
+        resp = client.get(self.RESOURCE_URL + "?after=WzUsIm1vdmllIiwxXQ")
+        assert resp.status_code == 400
+
+    def test_pagination(self, app, client):
+        with app.app_context():
+            db_genre = Genre.query.filter_by(name="crime").first()
+            for i in range(5):
+                db.session.add(Movie(title="m{}".format(i), uuid=get_uuid(), actors="A, test-actor-1",
+                    release_date="199{}-01-01".format(i), genre=db_genre))
+                db.session.add(Series(title="s{}".format(i), uuid=get_uuid(), actors="test-actor-1",
+                    release_date="199{}-06-01".format(i), seasons=1, genre=db_genre))
+            db.session.commit()
+
+        expected = [title for i in range(5) for title in ["m{}".format(i), "s{}".format(i)]]
+        expected += ["test-movie-1", "test-series-1"]
+        for limit in [1, 3, 100]:
+            assert self._titles(client, self.RESOURCE_URL + "?limit={}".format(limit)) == expected
+        assert self._titles(client, "/api/actors/A/") == ["m{}".format(i) for i in range(5)]
+
+    def test_changes(self, client):
+        """
+        Checks that the filmography follows changes made through the API.
+        """
+
+        movie_json = _get_movie_json("put")
+        movie_json["actors"] = "test-actor-2"
+        resp = client.put("/api/movies/DWDES5GE5PtBQJGMSa7t31/", json=movie_json)
+        assert resp.status_code == 204
+        assert self._titles(client, self.RESOURCE_URL) == ["test-series-1"]
+        assert self._titles(client, "/api/actors/test-actor-2/") == ["extra-movie-1", "test-movie-2", "test-series-2"]
+
+        resp = client.delete("/api/series/638P5GEe3c8QmAtiUaYAE31/")
+        assert resp.status_code == 204
+        assert client.get(self.RESOURCE_URL).status_code == 404
+
+    def test_queries(self, app, client):
+        """
+        Checks that the items are found through the actor links without
+        scanning the movie and series tables.
+        """
+
+        executed = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            executed.append((statement, parameters))
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, "before_cursor_execute", capture)
+        try:
+            assert client.get(self.RESOURCE_URL).status_code == 200
+        finally:
+            event.remove(engine, "before_cursor_execute", capture)
+        statement, parameters = [item for item in executed if "UNION ALL" in item[0]][0]
+        assert "actors LIKE" not in statement
+        with app.app_context():
+            plan = db.session.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+        assert not [row for row in plan if row[-1].startswith(("SCAN movie", "SCAN series"))]
 
 
 class TestGenreColletion(object):
@@ -394,6 +1395,156 @@ class TestMovieCollection(object):
             _check_control_get_method("self", client, item)
             _check_control_get_method("profile", client, item)
 
+    def test_pagination(self, client):
+        _check_pagination(client, self.RESOURCE_URL, "title", ["test-movie-1", "test-movie-2"])
+
+
+class TestMovieExport(object):
+
+    RESOURCE_URL = "/api/movies/export/"
+
+    def test_get(self, client):
+        resp = client.get(self.RESOURCE_URL)
+        assert resp.status_code == 200
+        assert resp.is_streamed
+        body = json.loads(resp.data)
+        resp.close()
+        _check_namespace(client, body)
+        _check_control_get_method("self", client, body)
+        _check_control_get_method("collection", client, body)
+
+        # export contains the same items as the collection
+        collection = json.loads(client.get("/api/movies/").data)
+        _check_control_get_method("mt:export-movies", client, collection)
+        assert body["items"] == collection["items"]
+
+
+class TestMovieBulk(object):
+
+    RESOURCE_URL = "/api/movies/bulk/"
+
+    def test_post(self, client):
+        valid = [_get_movie_json("put", i) for i in range(1, 4)]
+        invalid_genre = _get_movie_json("put")
+        invalid_genre["genre"] = "invalid genre"
+        missing_title = _get_movie_json("put")
+        missing_title.pop("title")
+
+        # test with wrong content type
+        resp = client.post(self.RESOURCE_URL, data=json.dumps(valid))
+        assert resp.status_code == 415
+        # test with a single item instead of a list
+        resp = client.post(self.RESOURCE_URL, json=valid[0])
+        assert resp.status_code == 400
+        # test that an empty list is a valid import of nothing
+        resp = client.post(self.RESOURCE_URL, json=[])
+        assert resp.status_code == 200
+        assert json.loads(resp.data)["created"] == 0
+        # test that valid items are created and invalid ones reported
+        resp = client.post(self.RESOURCE_URL, json=[valid[0], invalid_genre, valid[1], missing_title, valid[2]])
+        assert resp.status_code == 200
+        body = json.loads(resp.data)
+        assert body["created"] == 3
+        assert [error["index"] for error in body["errors"]] == [1, 3]
+        _check_control_get_method("collection", client, body)
+        body = json.loads(client.get("/api/movies/").data)
+        assert len(body["items"]) == 5
+        # imported items are linked to their actors
+        body = json.loads(client.get("/api/movies/?actor=extra-actors-2").data)
+        assert [item["title"] for item in body["items"]] == ["extra-movie-2"]
+
+
+class TestMovieBatch(object):
+
+    RESOURCE_URL = "/api/movies/batch/"
+    UUIDS = ["DWDES5GE5PtBQJGMSa7t31", "DWDES5GE5PtBQJGMSa7t32"]
+
+    def test_put(self, client):
+        # test with wrong content type
+        resp = client.put(self.RESOURCE_URL, data=json.dumps({"uuids": self.UUIDS}))
+        assert resp.status_code == 415
+        # test with invalid documents
+        for document in [
+            {"uuids": self.UUIDS},
+            {"uuids": self.UUIDS, "filter": {}, "patch": {"score": 1}},
+            {"uuids": self.UUIDS, "patch": {}},
+            {"uuids": self.UUIDS, "patch": {"title": None}},
+            {"filter": {"sort": "title"}, "patch": {"score": 1}},
+            {"filter": {}, "patch": {"score": 1}},
+            {"uuids": self.UUIDS, "patch": {"genre": "invalid genre"}},
+        ]:
+            resp = client.put(self.RESOURCE_URL, json=document)
+            assert resp.status_code == 400
+
+        # test retagging by uuids, missing items are reported
+        resp = client.put(self.RESOURCE_URL, json={
+            "uuids": self.UUIDS + ["nonexistent"],
+            "patch": {"genre": "crime", "score": 5}
+        })
+        assert resp.status_code == 200
+        body = json.loads(resp.data)
+        assert body["matched"] == 2
+        assert body["items"] == [
+            {"uuid": self.UUIDS[0], "status": 204},
+            {"uuid": self.UUIDS[1], "status": 204},
+            {"uuid": "nonexistent", "status": 404},
+        ]
+        _check_control_get_method("collection", client, body)
+        for uuid in self.UUIDS:
+            movie = json.loads(client.get("/api/movies/{}/".format(uuid)).data)
+            assert movie["genre"] == "crime"
+            assert movie["score"] == 5
+        assert len(json.loads(client.get("/api/genres/crime/movies/").data)["items"]) == 2
+        assert json.loads(client.get("/api/genres/action/movies/").data)["items"] == []
+
+    def test_put_filter(self, client):
+        resp = client.put(self.RESOURCE_URL, json={
+            "filter": {"genre": "action", "max_score": 1},
+            "patch": {"title": "renamed"}
+        })
+        assert resp.status_code == 200
+        body = json.loads(resp.data)
+        assert body["items"] == [{"uuid": self.UUIDS[0], "status": 204}]
+        titles = [item["title"] for item in json.loads(client.get("/api/movies/").data)["items"]]
+        assert titles == ["renamed", "test-movie-2"]
+        resp = client.get("/api/search/?q=renamed")
+        assert len(json.loads(resp.data)["items"]) == 1
+
+    def test_delete(self, client):
+        resp = client.delete(self.RESOURCE_URL, json={"uuids": self.UUIDS[:1], "patch": {"score": 1}})
+        assert resp.status_code == 400
+        resp = client.delete(self.RESOURCE_URL, json={"uuids": self.UUIDS[:1] + ["nonexistent"]})
+        assert resp.status_code == 200
+        assert json.loads(resp.data)["matched"] == 1
+        assert client.get("/api/movies/{}/".format(self.UUIDS[0])).status_code == 404
+        # an empty document or filter must not select everything
+        resp = client.delete(self.RESOURCE_URL, json={})
+        assert resp.status_code == 400
+        resp = client.delete(self.RESOURCE_URL, json={"filter": {}})
+        assert resp.status_code == 400
+        resp = client.delete(self.RESOURCE_URL, json={"filter": {"genre": "action"}})
+        assert json.loads(resp.data)["items"] == [{"uuid": self.UUIDS[1], "status": 204}]
+        assert json.loads(client.get("/api/movies/").data)["items"] == []
+
+    def test_chunks(self, app, client, monkeypatch):
+        monkeypatch.setattr("movietracker.batch.BATCH_CHUNK_SIZE", 1)
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, "before_cursor_execute", capture)
+        try:
+            resp = client.put(self.RESOURCE_URL, json={"filter": {"genre": "action"}, "patch": {"score": 7}})
+            assert resp.status_code == 200
+        finally:
+            event.remove(engine, "before_cursor_execute", capture)
+        assert len([s for s in statements if s.startswith("UPDATE movie ")]) == 2
+        scores = [item["score"] for item in json.loads(client.get("/api/movies/").data)["items"]]
+        assert scores == [7, 7]
+
 
 class TestMovieItem(object):
  
@@ -409,7 +1560,7 @@ class TestMovieItem(object):
         # Test attributes and controls
         assert body["title"] == "test-movie-1"
         assert body["actors"] == "test-actor-1"
-        assert body["release_date"] == "test-date-1"
+        assert body["release_date"] == "2000-01-01"
         assert body["score"] == 1
         assert body["genre"] == "action"
         # Test controls
@@ -453,6 +1604,58 @@ class TestMovieItem(object):
         resp = client.put(self.RESOURCE_URL, json=valid)
         assert resp.status_code == 400
         
+    def test_patch(self, client):
+        headers = {"Content-Type": MERGE_PATCH}
+        # test with wrong content type
+        resp = client.patch(self.RESOURCE_URL, json={"score": 9})
+        assert resp.status_code == 415
+        # test with invalid documents
+        for document in [[], {"title": None}, {"score": "high"}, {"uuid": "x"}, {"genre": "invalid genre"}]:
+            resp = client.patch(self.RESOURCE_URL, data=json.dumps(document), headers=headers)
+            assert resp.status_code == 400
+        # test with nonexistent movie
+        resp = client.patch(self.INVALID_URL, data=json.dumps({"score": 9}), headers=headers)
+        assert resp.status_code == 404
+        # an empty patch is a no-op
+        resp = client.patch(self.INVALID_URL, data="{}", headers=headers)
+        assert resp.status_code == 404
+        resp = client.patch(self.RESOURCE_URL, data="{}", headers=headers)
+        assert resp.status_code == 204
+        assert json.loads(client.get(self.RESOURCE_URL).data)["score"] == 1
+
+        # only the given properties change, null removes a property
+        resp = client.patch(self.RESOURCE_URL, data=json.dumps({"score": 9, "actors": None}), headers=headers)
+        assert resp.status_code == 204
+        body = json.loads(client.get(self.RESOURCE_URL).data)
+        assert body["score"] == 9
+        assert body["actors"] is None
+        assert body["title"] == "test-movie-1"
+        assert body["genre"] == "action"
+
+        resp = client.patch(self.RESOURCE_URL, data=json.dumps({"genre": "crime"}), headers=headers)
+        assert resp.status_code == 204
+        assert json.loads(client.get(self.RESOURCE_URL).data)["genre"] == "crime"
+        assert len(json.loads(client.get("/api/genres/action/movies/").data)["items"]) == 1
+
+    def test_patch_single_update(self, app, client):
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, "before_cursor_execute", capture)
+        try:
+            resp = client.patch(self.RESOURCE_URL, data=json.dumps({"score": 3}), headers={"Content-Type": MERGE_PATCH})
+            assert resp.status_code == 204
+        finally:
+            event.remove(engine, "before_cursor_execute", capture)
+        movie_statements = [s for s in statements if " movie" in s and "table_version" not in s]
+        assert len(movie_statements) == 1
+        assert movie_statements[0].startswith("UPDATE movie SET score=")
+        assert not any("FROM genre" in s and "RETURNING" not in s for s in statements)
+
     def test_delete(self, client):
         # Test and verify deletion
         resp = client.delete(self.RESOURCE_URL)
@@ -490,6 +1693,78 @@ class TestSeriesCollection(object):
             _check_control_get_method("self", client, item)
             _check_control_get_method("profile", client, item)
 
+    def test_pagination(self, client):
+        _check_pagination(client, self.RESOURCE_URL, "title", ["test-series-1", "test-series-2"])
+
+
+class TestSeriesExport(object):
+
+    RESOURCE_URL = "/api/series/export/"
+
+    def test_get(self, client):
+        resp = client.get(self.RESOURCE_URL)
+        assert resp.status_code == 200
+        assert resp.is_streamed
+        body = json.loads(resp.data)
+        resp.close()
+        _check_namespace(client, body)
+        _check_control_get_method("self", client, body)
+        _check_control_get_method("collection", client, body)
+
+        # export contains the same items as the collection
+        collection = json.loads(client.get("/api/series/").data)
+        _check_control_get_method("mt:export-series", client, collection)
+        assert body["items"] == collection["items"]
+
+
+class TestSeriesBulk(object):
+
+    RESOURCE_URL = "/api/series/bulk/"
+
+    def test_post(self, client):
+        valid = [_get_series_json("put", i) for i in range(1, 4)]
+        invalid_genre = _get_series_json("put")
+        invalid_genre["genre"] = "invalid genre"
+        missing_title = _get_series_json("put")
+        missing_title.pop("title")
+
+        # test with wrong content type
+        resp = client.post(self.RESOURCE_URL, data=json.dumps(valid))
+        assert resp.status_code == 415
+        # test with a single item instead of a list
+        resp = client.post(self.RESOURCE_URL, json=valid[0])
+        assert resp.status_code == 400
+        # test that an empty list is a valid import of nothing
+        resp = client.post(self.RESOURCE_URL, json=[])
+        assert resp.status_code == 200
+        assert json.loads(resp.data)["created"] == 0
+        # test that valid items are created and invalid ones reported
+        resp = client.post(self.RESOURCE_URL, json=[valid[0], invalid_genre, valid[1], missing_title, valid[2]])
+        assert resp.status_code == 200
+        body = json.loads(resp.data)
+        assert body["created"] == 3
+        assert [error["index"] for error in body["errors"]] == [1, 3]
+        _check_control_get_method("collection", client, body)
+        body = json.loads(client.get("/api/series/").data)
+        assert len(body["items"]) == 5
+
+
+class TestSeriesBatch(object):
+
+    RESOURCE_URL = "/api/series/batch/"
+
+    def test_put(self, client):
+        resp = client.put(self.RESOURCE_URL, json={"filter": {"actor": "actor-2"}, "patch": {"seasons": 9}})
+        assert resp.status_code == 200
+        assert json.loads(resp.data)["items"] == [{"uuid": "638P5GEe3c8QmAtiUaYAE32", "status": 204}]
+        series = json.loads(client.get("/api/series/638P5GEe3c8QmAtiUaYAE32/").data)
+        assert series["seasons"] == 9
+
+    def test_delete(self, client):
+        resp = client.delete(self.RESOURCE_URL, json={"uuids": ["638P5GEe3c8QmAtiUaYAE31"]})
+        assert resp.status_code == 200
+        assert len(json.loads(client.get("/api/series/").data)["items"]) == 1
+
 
 class TestSeriesItem(object):
  
@@ -503,7 +1778,7 @@ class TestSeriesItem(object):
         body = json.loads(resp.data)
         assert body["title"] == "test-series-1"
         assert body["actors"] == "test-actor-1"
-        assert body["release_date"] == "test-date-1"
+        assert body["release_date"] == "2000-01-01"
         assert body["score"] == 1
         assert body["seasons"] == 1
         assert body["genre"] == "action"
@@ -545,6 +1820,18 @@ class TestSeriesItem(object):
         resp = client.put(self.RESOURCE_URL, json=valid)
         assert resp.status_code == 400
         
+    def test_patch(self, client):
+        headers = {"Content-Type": MERGE_PATCH}
+        resp = client.patch(self.RESOURCE_URL, data=json.dumps({"seasons": None}), headers=headers)
+        assert resp.status_code == 400
+        resp = client.patch(self.INVALID_URL, data=json.dumps({"seasons": 4}), headers=headers)
+        assert resp.status_code == 404
+        resp = client.patch(self.RESOURCE_URL, data=json.dumps({"seasons": 4}), headers=headers)
+        assert resp.status_code == 204
+        body = json.loads(client.get(self.RESOURCE_URL).data)
+        assert body["seasons"] == 4
+        assert body["title"] == "test-series-1"
+
     def test_delete(self, client):
         # Test and verify deletion
         resp = client.delete(self.RESOURCE_URL)
@@ -554,3 +1841,25 @@ class TestSeriesItem(object):
         # Test Invalid deletion
         resp = client.delete(self.INVALID_URL)
         assert resp.status_code == 404
+
+
+class TestImportCatalog(object):
+
+    def test_import(self, app, tmp_path):
+        lines = [
+            json.dumps(_get_movie_json("put", 1)),
+            "",
+            "not json",
+            json.dumps(dict(_get_movie_json("put", 2), genre="invalid genre")),
+            json.dumps(_get_movie_json("put", 3)),
+        ]
+        catalog = tmp_path / "movies.jsonl"
+        catalog.write_text("\n".join(lines))
+
+        result = app.test_cli_runner().invoke(args=["import-catalog", str(catalog), "--chunk-size", "1"])
+        assert result.exit_code == 0
+        assert "Imported 2 items, 2 errors" in result.output
+        assert "line 3:" in result.output
+        assert "line 4:" in result.output
+        with app.app_context():
+            assert Movie.query.count() == 4